@@ -0,0 +1,140 @@
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+
+ACQUISITION_KEY = "acquisition"
+
+# Lengths in microns, durations in minutes, the units of the SAP configuration
+LENGTH_UNITS = {
+    "nm": 1e-3,
+    "µm": 1.0,
+    "um": 1.0,
+    "micron": 1.0,
+    "microns": 1.0,
+    "\\u00B5m": 1.0,
+    "mm": 1e3,
+    "cm": 1e4,
+    "m": 1e6,
+}
+TIME_UNITS = {"ms": 1 / 60000, "s": 1 / 60, "sec": 1 / 60, "min": 1.0, "h": 60.0}
+
+
+def ome_acquisition(ome_xml):
+    """
+    Pixel size and time step of the first image of OME-XML metadata.
+
+    Parameters
+    ----------
+    ome_xml : str
+        The OME-XML document.
+
+    Returns
+    -------
+    dict
+        "scale1D" (microns per pixel) and "dt" (minutes between frames), for
+        the values present in the metadata.
+    """
+    pixels = next(
+        (
+            element
+            for element in ElementTree.fromstring(ome_xml).iter()
+            if element.tag.rsplit("}", 1)[-1] == "Pixels"
+        ),
+        None,
+    )
+    if pixels is None:
+        return {}
+    acquisition = {}
+    size = pixels.get("PhysicalSizeX")
+    unit = pixels.get("PhysicalSizeXUnit", "µm")
+    if size is not None and unit in LENGTH_UNITS:
+        acquisition["scale1D"] = float(size) * LENGTH_UNITS[unit]
+    increment = pixels.get("TimeIncrement")
+    unit = pixels.get("TimeIncrementUnit", "s")
+    if increment is not None and unit in TIME_UNITS:
+        acquisition["dt"] = float(increment) * TIME_UNITS[unit]
+    return acquisition
+
+
+def imagej_acquisition(imagej_metadata, page):
+    """
+    Pixel size and time step of an ImageJ hyperstack.
+
+    Parameters
+    ----------
+    imagej_metadata : dict
+        The ImageJ metadata of the file.
+    page : tifffile.TiffPage
+        The first page, holding the resolution tags.
+
+    Returns
+    -------
+    dict
+        "scale1D" and "dt", for the values present in the metadata.
+    """
+    acquisition = {}
+    unit = imagej_metadata.get("unit", "").replace("\\u00B5", "µ")
+    resolution = page.tags.get("XResolution")
+    if resolution is not None and unit in LENGTH_UNITS:
+        pixels, length = resolution.value
+        if pixels:
+            acquisition["scale1D"] = length / pixels * LENGTH_UNITS[unit]
+    interval = imagej_metadata.get("finterval")
+    unit = imagej_metadata.get("tunit", "s")
+    if interval and unit in TIME_UNITS:
+        acquisition["dt"] = float(interval) * TIME_UNITS[unit]
+    return acquisition
+
+
+def read_acquisition(path):
+    """
+    Read the pixel size and time step of a movie from its tif metadata.
+
+    OME-XML is read first, then ImageJ metadata. The bare resolution tags are
+    ignored: most writers fill them with a default of 72 dpi.
+
+    Parameters
+    ----------
+    path : str
+        A tif file: a multi-page or OME-TIFF movie, or its first frame.
+
+    Returns
+    -------
+    dict
+        "scale1D" (length of a pixel in microns) and "dt" (time between two
+        frames in minutes) when the metadata hold them, and the "source" file.
+    """
+    import tifffile
+
+    with tifffile.TiffFile(path) as tif:
+        if tif.is_ome:
+            acquisition = ome_acquisition(tif.ome_metadata)
+        elif tif.is_imagej:
+            acquisition = imagej_acquisition(tif.imagej_metadata, tif.pages[0])
+        else:
+            acquisition = {}
+    return {**acquisition, "source": os.path.abspath(path)}
+
+
+def load_acquisition(zarr_path):
+    """
+    Acquisition metadata stored in the METADATA group of an animal store.
+
+    The attributes are read from their JSON file, without zarr, so that the
+    SAP configuration can use them cheaply.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        The animal store.
+
+    Returns
+    -------
+    dict
+        The acquisition metadata, empty if there is none.
+    """
+    attributes = os.path.join(zarr_path, "METADATA", ".zattrs")
+    if not os.path.exists(attributes):
+        return {}
+    with open(attributes) as file:
+        return json.load(file).get(ACQUISITION_KEY, {})
@@ -0,0 +1,602 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import zipfile
+import argparse
+import warnings
+from contextlib import nullcontext
+from urllib.parse import quote
+
+import zarr
+
+ANIMAL_GROUPS = ["METADATA", "TENSORS", "IMAGE", "TRACKING"]
+METADATA_FILES = [".zgroup", ".zarray", ".zattrs"]
+CONSOLIDATED_KEY = ".zmetadata"
+CHECKSUMS_KEY = ".checksums"
+# Keys locked by `AnimalSynchronizer`: metadata and structure, never chunks
+LOCKED_KEYS = set(METADATA_FILES) | {CONSOLIDATED_KEY, ".structure"}
+# A writer waiting this long for a lock says which lock file it waits for
+LOCK_WARNING_S = 60.0
+
+
+class IndexedConsolidatedStore(zarr.storage.ConsolidatedMetadataStore):
+    """
+    Consolidated metadata store listing children from a precomputed index.
+
+    `zarr.storage.ConsolidatedMetadataStore` lists a node by scanning every
+    key of the hierarchy, which makes walking a store with thousands of nodes
+    quadratic.
+
+    Parameters
+    ----------
+    store : zarr.storage.BaseStore
+        The store holding the consolidated metadata.
+    metadata_key : str, optional
+        The key of the consolidated metadata. Default is ".zmetadata".
+    """
+
+    def __init__(self, store, metadata_key=CONSOLIDATED_KEY):
+        super().__init__(store, metadata_key=metadata_key)
+        self.children = {}
+        for key in self.meta_store:
+            parts = key.split("/")
+            for i, part in enumerate(parts):
+                self.children.setdefault("/".join(parts[:i]), set()).add(part)
+
+    def listdir(self, path=""):
+        return sorted(self.children.get((path or "").strip("/"), ()))
+
+
+def synchronizer_path(zarr_path):
+    """
+    Path of the folder holding the lock files of an animal store.
+
+    The folder sits next to the store (`<store>.sync`) so that lock files are
+    never seen as zarr keys. It only exists while a lock is held.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        Path to the zarr store of the animal.
+
+    Returns
+    -------
+    str
+        The path to the lock folder.
+    """
+    return f"{os.path.normpath(str(zarr_path))}.sync"
+
+
+def lock_owner():
+    return f"{socket.gethostname()} {os.getpid()}"
+
+
+def is_stale(owner):
+    """
+    Whether a lock is held by a process of this host that no longer runs.
+
+    Locks of other hosts cannot be checked and are never considered stale.
+    """
+    host, _, pid = owner.partition(" ")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def read_owner(path):
+    try:
+        with open(path) as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def remove_stale(path, owner):
+    """
+    Remove a lock file if it is still the one held by `owner`.
+    """
+    try:
+        with open(path) as file:
+            identity = os.fstat(file.fileno()).st_ino
+            if file.read() != owner:
+                return
+        if os.stat(path).st_ino == identity:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class StoreLock:
+    """
+    Inter-process lock held by the existence of a lock file.
+
+    The file is created exclusively and removed on release. Exclusive
+    creation is atomic on local file systems and on NFS (v3 and later),
+    which often does not honour fcntl locks. The lock folder is removed with
+    the last lock, so that no lock file outlives the writers. A lock left by
+    a crashed process of the same host is broken, one left by another host
+    must be deleted by hand.
+
+    Parameters
+    ----------
+    path : str
+        The lock file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def acquire(self):
+        delay = 0.001
+        start = time.monotonic()
+        warned = False
+        while True:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                descriptor = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileNotFoundError:
+                # The folder was removed with the last lock in between
+                continue
+            except FileExistsError:
+                owner = read_owner(self.path)
+                if owner is not None and is_stale(owner):
+                    self.break_stale(owner)
+                    continue
+                if not warned and time.monotonic() - start > LOCK_WARNING_S:
+                    warnings.warn(f"Waiting for {self.path}, held by {owner}")
+                    warned = True
+                time.sleep(delay)
+                delay = min(2 * delay, 0.1)
+                continue
+            with os.fdopen(descriptor, "w") as file:
+                file.write(lock_owner())
+            return
+
+    def break_stale(self, owner):
+        """
+        Remove the lock file of a dead process.
+
+        The lock is broken under a second, short-lived lock: only its holder
+        removes dead lock files, so the file checked is the one removed and
+        never a lock taken in between.
+        """
+        breaker = f"{self.path}.break"
+        try:
+            descriptor = os.open(breaker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileNotFoundError:
+            # The lock folder was removed: the lock was released
+            return
+        except FileExistsError:
+            # Another process is breaking the lock, or died doing so
+            breaker_owner = read_owner(breaker)
+            if breaker_owner is not None and is_stale(breaker_owner):
+                remove_stale(breaker, breaker_owner)
+            return
+        with os.fdopen(descriptor, "w") as file:
+            file.write(lock_owner())
+        try:
+            remove_stale(self.path, owner)
+        finally:
+            os.remove(breaker)
+
+    def release(self):
+        os.remove(self.path)
+        try:
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            # Other locks are held
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AnimalSynchronizer:
+    """
+    zarr synchronizer locking the metadata updates of an animal store.
+
+    zarr asks its synchronizer for the lock of every key it writes. Only the
+    attributes, array and group metadata, consolidated metadata and structure
+    locks (see `structure_lock`) are locked, one lock file per key in the
+    folder of `synchronizer_path`. Chunks are not: every dataset is created
+    and filled by a single writer, under its structure lock.
+
+    Parameters
+    ----------
+    path : str
+        The lock folder.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __getitem__(self, key):
+        if key.rsplit("/", 1)[-1] not in LOCKED_KEYS:
+            return nullcontext()
+        return StoreLock(os.path.join(self.path, quote(key, safe="")))
+
+
+def open_animal(zarr_path, mode="a", consolidated=False):
+    """
+    Open the zarr group of an animal with a process synchronizer.
+
+    Metadata and attribute writes are locked, see `AnimalSynchronizer`, so
+    that several processes (e.g. image ingest and AOT extraction) can write
+    the same animal at once.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        Path to the zarr store of the animal.
+    mode : str, optional
+        Persistence mode, see `zarr.open_group`. Default is "a".
+    consolidated : bool, optional
+        If True, read the whole hierarchy metadata from the consolidated
+        `.zmetadata` key in one request, falling back to a regular open when
+        the store has not been consolidated. Only "r" and "r+" modes are
+        allowed and metadata (groups, arrays, attributes) cannot be modified
+        through the returned group. Default is False.
+
+    Notes
+    -----
+    Paths ending with ".zip" are opened read-only as archives written by
+    `export_animal`, see `open_archive`.
+
+    Returns
+    -------
+    zarr.hierarchy.Group
+        The root group of the animal.
+    """
+    if str(zarr_path).endswith(".zip"):
+        return open_archive(zarr_path, mode=mode, consolidated=consolidated)
+
+    # Read-only access needs no lock, and must work on read-only file systems
+    synchronizer = None
+    if mode != "r":
+        synchronizer = AnimalSynchronizer(synchronizer_path(zarr_path))
+    if consolidated and os.path.exists(os.path.join(zarr_path, CONSOLIDATED_KEY)):
+        if mode not in ["r", "r+"]:
+            raise ValueError(
+                "Consolidated stores can only be opened in 'r' or 'r+' mode"
+            )
+        store = zarr.DirectoryStore(str(zarr_path))
+        return zarr.open_group(
+            IndexedConsolidatedStore(store),
+            mode=mode,
+            chunk_store=store,
+            synchronizer=synchronizer,
+        )
+    if synchronizer is None:
+        return zarr.open_group(str(zarr_path), mode=mode)
+    with synchronizer[".structure"]:
+        return zarr.open_group(str(zarr_path), mode=mode, synchronizer=synchronizer)
+
+
+def consolidate_animal(zarr_path, paths=None, recursive=True):
+    """
+    Write or refresh the consolidated metadata of an animal store.
+
+    Without `paths` (or when the store was never consolidated) the metadata of
+    the whole hierarchy is consolidated. Otherwise only the entries of the
+    given nodes, their subtrees and their ancestors are re-read, so that a
+    stage of the zarrification refreshes what it wrote without walking the
+    rest of the store.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        Path to the zarr store of the animal.
+    paths : list of str, optional
+        Paths of the nodes to refresh, e.g. ["IMAGE"] or ["TENSORS"]. "" is the
+        root group. Default is None (full consolidation).
+    recursive : bool, optional
+        Whether the subtrees of `paths` are refreshed too. Default is True.
+    """
+    zarr_path = str(zarr_path)
+    store = zarr.DirectoryStore(zarr_path)
+    synchronizer = AnimalSynchronizer(synchronizer_path(zarr_path))
+    with synchronizer[CONSOLIDATED_KEY]:
+        if paths is None or CONSOLIDATED_KEY not in store:
+            zarr.consolidate_metadata(store)
+            return
+
+        consolidated = json.loads(store[CONSOLIDATED_KEY])
+        entries = consolidated["metadata"]
+        for path in paths:
+            path = path.strip("/")
+            parts = path.split("/") if path else []
+            nodes = ["/".join(parts[:i]) for i in range(len(parts) + 1)]
+            if recursive:
+                subtree = os.path.join(zarr_path, path)
+                nodes += [
+                    os.path.relpath(root, zarr_path).replace(os.sep, "/")
+                    for root, _, _ in os.walk(subtree)
+                ]
+                prefix = f"{path}/" if path else ""
+                entries = {
+                    key: value
+                    for key, value in entries.items()
+                    if not key.startswith(prefix)
+                }
+            for node in nodes:
+                node = "" if node == "." else node
+                for file in METADATA_FILES:
+                    key = f"{node}/{file}" if node else file
+                    if key in store:
+                        entries[key] = json.loads(store[key])
+                    else:
+                        entries.pop(key, None)
+        consolidated["metadata"] = entries
+        store[CONSOLIDATED_KEY] = json.dumps(
+            consolidated, indent=4, sort_keys=True, ensure_ascii=True
+        ).encode()
+
+
+def structure_lock(group, name=""):
+    """
+    Inter-process lock guarding the creation of the child `name` of a group.
+
+    Checking that a child exists and creating it must happen under this lock
+    for concurrent writers not to race on its `.zgroup`/`.zarray` files. In
+    zarr v2 a parent group does not list its children, so one lock per child
+    is enough.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The parent group.
+    name : str, optional
+        Name of the child. If empty, the lock guards the group itself.
+
+    Returns
+    -------
+    context manager
+        The lock, or a no-op context if the group has no synchronizer.
+    """
+    if group.synchronizer is None:
+        return nullcontext()
+    return group.synchronizer[os.path.join(group.path, name, ".structure")]
+
+
+def require_animal_groups(animal):
+    """
+    Create the first level groups of an animal if they don't exist.
+
+    Parameters
+    ----------
+    animal : zarr.hierarchy.Group
+        The root group of the animal.
+    """
+    for group in ANIMAL_GROUPS:
+        require_subgroup(animal, group)
+
+
+def require_subgroup(group, name):
+    """
+    Return the child group `name` of `group`, creating it if needed.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The parent group.
+    name : str
+        Name of the child group.
+
+    Returns
+    -------
+    zarr.hierarchy.Group
+        The child group.
+    """
+    with structure_lock(group, name):
+        return group.require_group(name)
+
+
+def store_keys(zarr_path):
+    """
+    List the zarr keys of an animal directory store.
+
+    Files that are not part of the zarr hierarchy (e.g. the tif frames saved
+    next to the groups for the SAP pipeline) are left out.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        Path to the zarr store of the animal.
+
+    Returns
+    -------
+    list of str
+        The metadata and chunk keys of the hierarchy.
+    """
+    zarr_path = str(zarr_path)
+    keys = []
+    for name in sorted(os.listdir(zarr_path)):
+        path = os.path.join(zarr_path, name)
+        if name in METADATA_FILES or name == CONSOLIDATED_KEY:
+            keys.append(name)
+        elif any(
+            os.path.exists(os.path.join(path, file)) for file in METADATA_FILES[:2]
+        ):
+            for folder, _, files in os.walk(path):
+                relative = os.path.relpath(folder, zarr_path).replace(os.sep, "/")
+                keys.extend(f"{relative}/{file}" for file in sorted(files))
+    return keys
+
+
+def checksum(value):
+    return hashlib.sha256(value).hexdigest()
+
+
+def verify_checksums(store, checksums):
+    """
+    Compare the content of a store to a manifest of checksums.
+
+    Parameters
+    ----------
+    store : zarr.storage.BaseStore
+        The store to verify.
+    checksums : dict
+        {key: sha256 hex digest}.
+
+    Raises
+    ------
+    IOError
+        If a key is missing or its content does not match its checksum.
+    """
+    for key, digest in checksums.items():
+        if key not in store:
+            raise IOError(f"{key} is missing")
+        if checksum(store[key]) != digest:
+            raise IOError(f"Checksum mismatch for {key}")
+
+
+def export_animal(zarr_path, archive_path, verify=True):
+    """
+    Pack an animal store into a single zip file.
+
+    The metadata of the whole store is consolidated first. Chunks are then
+    copied as stored (already compressed by their codecs) into an
+    uncompressed zip, one key at a time. A manifest of SHA-256 checksums is
+    written in the archive under the `.checksums` key.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        Path to the zarr store of the animal.
+    archive_path : str or Path
+        Path of the zip file to write. Must end with ".zip".
+    verify : bool, optional
+        Whether to read the archive back and check every checksum. Default is True.
+
+    Returns
+    -------
+    dict
+        The checksums of the exported keys.
+    """
+    if not str(archive_path).endswith(".zip"):
+        raise ValueError(f"The archive path must end with .zip, got {archive_path}")
+
+    # A `.zmetadata` left by an earlier stage may miss the nodes written since
+    source = zarr.DirectoryStore(str(zarr_path))
+    consolidate_animal(zarr_path)
+
+    checksums = {}
+    with zarr.ZipStore(
+        str(archive_path), mode="w", compression=zipfile.ZIP_STORED
+    ) as archive:
+        for key in store_keys(zarr_path):
+            value = source[key]
+            checksums[key] = checksum(value)
+            archive[key] = value
+        archive[CHECKSUMS_KEY] = json.dumps(checksums, indent=4).encode()
+
+    if verify:
+        with zarr.ZipStore(str(archive_path), mode="r") as archive:
+            verify_checksums(archive, checksums)
+    return checksums
+
+
+def import_animal(archive_path, zarr_path):
+    """
+    Unpack an archive written by `export_animal` into a directory store.
+
+    Every key is checked against the manifest of the archive while it is
+    written.
+
+    Parameters
+    ----------
+    archive_path : str or Path
+        Path of the zip file.
+    zarr_path : str or Path
+        Path of the zarr store to create. Must not contain a hierarchy already.
+
+    Raises
+    ------
+    IOError
+        If a key of the archive does not match its checksum.
+    """
+    destination = zarr.DirectoryStore(str(zarr_path))
+    if ".zgroup" in destination:
+        raise IOError(f"{zarr_path} already contains a zarr hierarchy")
+
+    with zarr.ZipStore(str(archive_path), mode="r") as archive:
+        checksums = json.loads(archive[CHECKSUMS_KEY])
+        for key, digest in checksums.items():
+            value = archive[key]
+            if checksum(value) != digest:
+                raise IOError(f"Checksum mismatch for {key} in {archive_path}")
+            destination[key] = value
+
+
+def open_archive(archive_path, mode="r", consolidated=True):
+    """
+    Open an animal archive written by `export_animal` without unpacking it.
+
+    Parameters
+    ----------
+    archive_path : str or Path
+        Path of the zip file.
+    mode : str, optional
+        Must be "r", archives are read-only. Default is "r".
+    consolidated : bool, optional
+        Whether to read the hierarchy from the consolidated metadata. Default is True.
+
+    Returns
+    -------
+    zarr.hierarchy.Group
+        The root group of the animal. The archive stays open until the group
+        is closed with `close_animal`.
+    """
+    if mode != "r":
+        raise ValueError(f"Animal archives are read-only, got mode {mode!r}")
+    store = zarr.ZipStore(str(archive_path), mode="r")
+    if consolidated and CONSOLIDATED_KEY in store:
+        return zarr.open_group(
+            IndexedConsolidatedStore(store), mode="r", chunk_store=store
+        )
+    return zarr.open_group(store, mode="r")
+
+
+def close_animal(group):
+    """
+    Close the store of a group opened by `open_animal`, releasing the file
+    handle of an archive. Closing a directory store does nothing.
+    """
+    group.chunk_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack animal stores into single zip files and back."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Pack a store into a zip")
+    export_parser.add_argument("store")
+    export_parser.add_argument("archive")
+    import_parser = subparsers.add_parser("import", help="Unpack a zip into a store")
+    import_parser.add_argument("archive")
+    import_parser.add_argument("store")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        checksums = export_animal(args.store, args.archive)
+        print(f"Exported {len(checksums)} keys to {args.archive}")
+    else:
+        import_animal(args.archive, args.store)
+        print(f"Imported {args.archive} into {args.store}")
+
+
+if __name__ == "__main__":
+    main()
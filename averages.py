@@ -0,0 +1,196 @@
+from collections import deque
+
+import numpy as np
+
+from progress import NULL_PROGRESS
+
+AVERAGES_GROUP = "averages"
+AVERAGE_MODES = ["block", "sliding"]
+
+
+def parse_window(window):
+    """
+    Parse a time-averaging window.
+
+    Parameters
+    ----------
+    window : str or tuple
+        "block_<n>" / ("block", n): mean of consecutive, non-overlapping
+        blocks of n frames, the last block holding the remaining frames.
+        "sliding_<n>" / ("sliding", n): mean of every run of n consecutive
+        frames.
+
+    Returns
+    -------
+    tuple
+        (mode, size).
+
+    Raises
+    ------
+    ValueError
+        If the mode is unknown or the size is not a positive integer.
+    """
+    if isinstance(window, str):
+        mode, _, size = window.partition("_")
+    else:
+        mode, size = window
+    if mode not in AVERAGE_MODES or not str(size).isdigit() or int(size) < 1:
+        raise ValueError(
+            f"Invalid averaging window {window}, use e.g. 'block_24' or 'sliding_5'"
+        )
+    return mode, int(size)
+
+
+def window_name(mode, size):
+    return f"{mode}_{size}"
+
+
+def n_averages(mode, size, n_frames):
+    """
+    Number of averaged frames produced by a window over `n_frames` frames.
+    """
+    if mode == "block":
+        return -(-n_frames // size)
+    return max(n_frames - size + 1, 0)
+
+
+class RunningAverage:
+    """
+    Time average of a stream of frames over one window.
+
+    Frames are summed in a float64 accumulator and every average is written
+    as soon as its window is complete. A block window only holds the running
+    sum, a sliding window also holds its last `size` frames to subtract the
+    frame leaving the window, so memory does not depend on the movie length.
+
+    Parameters
+    ----------
+    dataset : zarr.core.Array
+        The output dataset, of shape (n_averages, height, width).
+    frame_range : zarr.core.Array
+        The output first and last frames (1-based, inclusive) of every average.
+    mode : str
+        "block" or "sliding".
+    size : int
+        Number of frames of the window.
+    """
+
+    def __init__(self, dataset, frame_range, mode, size):
+        self.dataset = dataset
+        self.frame_range = frame_range
+        self.mode = mode
+        self.size = size
+        self.sum = np.zeros(dataset.shape[1:], dtype=np.float64)
+        self.window = deque()
+        self.n_summed = 0
+        self.n_frames = 0
+        self.n_written = 0
+        self.ranges = []
+
+    def add(self, frame):
+        self.n_frames += 1
+        self.sum += frame
+        if self.mode == "sliding":
+            self.window.append(frame)
+            if len(self.window) > self.size:
+                self.sum -= self.window.popleft()
+            if len(self.window) == self.size:
+                self.write(self.size)
+        else:
+            self.n_summed += 1
+            if self.n_summed == self.size:
+                self.write(self.size)
+                self.sum[:] = 0
+                self.n_summed = 0
+
+    def finish(self):
+        # Write the last, incomplete block, then all frame ranges at once
+        if self.mode == "block" and self.n_summed:
+            self.write(self.n_summed)
+            self.n_summed = 0
+        if self.ranges:
+            self.frame_range[:] = self.ranges
+
+    def write(self, n_summed):
+        self.dataset[self.n_written] = self.sum / n_summed
+        self.ranges.append([self.n_frames - n_summed + 1, self.n_frames])
+        self.n_written += 1
+
+
+def create_running_averages(group, windows, n_frames, height, width):
+    """
+    Create the `averages/<window>` datasets of a group and their accumulators.
+
+    Each window is a group holding the float32 averaged frames in `frames`
+    and their first and last frames in `frame_range`. Existing windows are
+    left untouched.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The group of the averaged dataset (usually IMAGE).
+    windows : list
+        The windows to compute, see `parse_window`.
+    n_frames, height, width : int
+        Shape of the averaged movie.
+
+    Returns
+    -------
+    list of RunningAverage
+        The accumulators to feed with every frame, in order.
+    """
+    averages = group.require_group(AVERAGES_GROUP)
+    accumulators = []
+    for window in windows:
+        mode, size = parse_window(window)
+        name = window_name(mode, size)
+        if name in averages:
+            continue
+        window_group = averages.create_group(name)
+        window_group.attrs.update({"mode": mode, "size": size})
+        n = n_averages(mode, size, n_frames)
+        dataset = window_group.create_dataset(
+            "frames",
+            shape=(n, height, width),
+            chunks=(1, height, width),
+            dtype=np.float32,
+        )
+        frame_range = window_group.create_dataset(
+            "frame_range", shape=(n, 2), dtype=np.int64
+        )
+        accumulators.append(RunningAverage(dataset, frame_range, mode, size))
+    return accumulators
+
+
+def compute_averages(group, windows, dataset_name="raw", progress=None):
+    """
+    Compute time averages of a stored movie, reading it frame by frame.
+
+    Used when the averages were not requested at ingest.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The group holding the movie (usually IMAGE).
+    windows : list
+        The windows to compute, see `parse_window`.
+    dataset_name : str, optional
+        Name of the movie dataset. Default is "raw".
+    progress : ProgressReporter, optional
+        Reporter receiving the "averages" stage.
+    """
+    progress = progress or NULL_PROGRESS
+    movie = group[dataset_name]
+    accumulators = create_running_averages(group, windows, *movie.shape)
+    if not accumulators:
+        return
+
+    progress.start("averages", movie.shape[0])
+    for i in range(movie.shape[0]):
+        frame = movie[i]
+        for accumulator in accumulators:
+            accumulator.add(frame)
+        progress.advance("averages", 1, frame.nbytes)
+    for accumulator in accumulators:
+        accumulator.finish()
+    progress.finish("averages")
@@ -0,0 +1,74 @@
+"""
+Benchmark of time-averaged raw stacks.
+
+A synthetic movie is ingested once with the averages computed in the raw
+pass, and once with the averages computed afterwards by re-reading the
+stored movie. Both are checked against a NumPy reference. Run from the
+repository root:
+
+    python -m benchmarks.bench_averages --frames 96 --size 512
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import zarr
+
+from averages import compute_averages
+from benchmarks.synthetic import make_synthetic_animal
+from zarrification import extract_and_store_raw
+
+WINDOWS = ["block_24", "sliding_5"]
+
+
+def reference(movie, window):
+    mode, size = window.split("_")
+    size = int(size)
+    if mode == "block":
+        return np.stack(
+            [movie[i : i + size].mean(axis=0) for i in range(0, len(movie), size)]
+        )
+    return np.stack(
+        [movie[i : i + size].mean(axis=0) for i in range(len(movie) - size + 1)]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=96)
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    folder = make_synthetic_animal(
+        root, "bench", n_frames=args.frames, height=args.size, width=args.size
+    )
+
+    results = {"frames": args.frames, "size": args.size}
+    start = time.perf_counter()
+    single = zarr.open_group(f"{root}/single.zarr", mode="w")
+    extract_and_store_raw(folder, single, root, "single", averages=WINDOWS)
+    results["single_pass_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reread = zarr.open_group(f"{root}/reread.zarr", mode="w")
+    extract_and_store_raw(folder, reread, root, "reread")
+    compute_averages(reread, WINDOWS)
+    results["ingest_then_reread_s"] = time.perf_counter() - start
+
+    movie = single["raw"][:].astype(np.float64)
+    for window in WINDOWS:
+        expected = reference(movie, window)
+        for name, group in [("single", single), ("reread", reread)]:
+            error = np.abs(group["averages"][window]["frames"][:] - expected).max()
+            results[f"{name}_{window}_max_error"] = float(error)
+    print(json.dumps(results, indent=4))
+    shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
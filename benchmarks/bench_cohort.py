@@ -0,0 +1,114 @@
+"""
+Benchmark of the cohort aggregation of a tensor quantity.
+
+Synthetic animals with shifted grid origins and start times are extracted,
+then averaged with `aggregate_quantity` and with an in-memory reference
+that loads every animal at once. Run from the repository root:
+
+    python -m benchmarks.bench_cohort --animals 12 --times 40
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from animal_store import consolidate_animal, open_animal, require_animal_groups
+from benchmarks.synthetic import make_synthetic_animal
+from cohort import aggregate_quantity, align_animals
+from zarrification import extract_AOT_results_folder
+
+
+def make_animals(root, n_animals, n_times, grid_shape):
+    """
+    Create and extract the AOT backups of `n_animals` synthetic animals.
+    """
+    paths = []
+    for i in range(n_animals):
+        folder = make_synthetic_animal(
+            root,
+            f"animal_{i}",
+            n_frames=1,
+            height=32,
+            width=32,
+            n_cells=2,
+            grid_shape=grid_shape,
+            n_times=n_times,
+            seed=i,
+            origin=(i % 3, (2 * i) % 5),
+            start_hour=14 + 2 * (i % 4),
+        )
+        animal = open_animal(folder, "a")
+        require_animal_groups(animal)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            extract_AOT_results_folder(
+                animal.TENSORS,
+                f"{folder}/SAP_animal_{i}",
+                ["UPIV", "Coordinates", "TimeArray"],
+            )
+        consolidate_animal(folder)
+        paths.append(folder)
+    return paths
+
+
+def in_memory_reference(paths, quantity, grid):
+    """
+    Aligned stack of every animal, reduced with NumPy.
+    """
+    animals, cohort = align_animals(paths, quantity, grid)
+    stack = np.full((len(animals),) + cohort["shape"], np.nan)
+    for i, animal in enumerate(animals):
+        values = open_animal(animal["path"], "r").TENSORS[grid][quantity][:]
+        row, column = animal["offset"]
+        stack[
+            i,
+            animal["times"],
+            row : row + values.shape[1],
+            column : column + values.shape[2],
+        ] = values
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmean(stack, axis=0), np.nanvar(stack, axis=0, ddof=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--animals", type=int, default=12)
+    parser.add_argument("--times", type=int, default=40)
+    parser.add_argument("--rows", type=int, default=30)
+    parser.add_argument("--columns", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    paths = make_animals(root, args.animals, args.times, (args.rows, args.columns))
+
+    start = time.perf_counter()
+    group = aggregate_quantity(
+        paths, f"{root}/cohort.zarr", "UPIV", n_workers=args.workers
+    )
+    aggregate_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mean, variance = in_memory_reference(paths, "UPIV", "DBA_L")
+    reference_time = time.perf_counter() - start
+
+    results = {
+        "animals": args.animals,
+        "shape": group["mean"].shape,
+        "aggregate_s": aggregate_time,
+        "in_memory_s": reference_time,
+        "max_mean_error": float(np.nanmax(np.abs(group["mean"][:] - mean))),
+        "max_variance_error": float(np.nanmax(np.abs(group["variance"][:] - variance))),
+    }
+    print(json.dumps(results, indent=4))
+    shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
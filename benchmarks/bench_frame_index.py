@@ -0,0 +1,75 @@
+"""
+Enumeration of a raw image folder: glob/listdir per call site against the
+shared directory index.
+
+A zarrification run lists the raw folder of the animal three times (frame
+count of the SAP configuration, `load_stack`, raw ingest). The benchmark
+times these three listings on a folder of empty `{animal}_{NNNN}.tif` files,
+enumerated with `glob`/`os.listdir` as before and with `directory_index`.
+Run from the repository root:
+
+    python -m benchmarks.bench_frame_index --files 20000 --repeat 5
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from frame_index import cached_scan, directory_index, match_frames
+
+
+def listings_glob(folder):
+    count = sum(1 for file in os.listdir(folder) if file.lower().endswith(".tif"))
+    stack_files = sorted(glob.glob(os.path.join(folder, "*.tif")))
+    raw_files = sorted(glob.glob(os.path.join(folder, "*.tif")))
+    return count, stack_files, raw_files
+
+
+def listings_index(folder):
+    count = directory_index(folder).count(".tif")
+    stack_files = match_frames(folder, "*.tif").paths
+    raw_files = match_frames(folder, "*.tif").paths
+    return count, stack_files, raw_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(root, "wRNAi_1")
+        os.makedirs(folder)
+        for i in range(args.files):
+            open(os.path.join(folder, f"wRNAi_1_{i:04d}.tif"), "w").close()
+        # Older than the racy interval, as a raw folder is when it is zarrified
+        past = time.time() - 60
+        os.utime(folder, (past, past))
+
+        results = {}
+        for name, listings in [("glob", listings_glob), ("index", listings_index)]:
+            times = []
+            for _ in range(args.repeat):
+                cached_scan.cache_clear()
+                start = time.perf_counter()
+                result = listings(folder)
+                times.append(time.perf_counter() - start)
+            results[name] = {"wall_time_s": min(times)}
+        assert listings_glob(folder) == listings_index(folder)
+        results["speedup"] = (
+            results["glob"]["wall_time_s"] / results["index"]["wall_time_s"]
+        )
+        results["files"] = len(result[1])
+    finally:
+        shutil.rmtree(root)
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
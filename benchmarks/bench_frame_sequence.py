@@ -0,0 +1,80 @@
+"""
+Time to reject a movie with a mis-sized last frame: decode then stack,
+as `load_stack` did, against the header check of `sequence_frames`. Also
+times the header scan of the movie with one thread and with a thread pool.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_frame_sequence --frames 200 --height 1024 --width 1024
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from skimage.io import imread, imsave
+
+from frame_index import read_headers, sequence_frames
+
+
+def decode_then_stack(folder):
+    frames = [np.array(imread(path)) for path in sorted(glob.glob(f"{folder}/*.tif"))]
+    return np.stack(frames, axis=0)
+
+
+def check_headers(folder):
+    return sequence_frames(folder, "*.tif")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--width", type=int, default=1024)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(0)
+        for i in range(args.frames):
+            # The last frame is one row short
+            height = args.height - (i == args.frames - 1)
+            frame = rng.integers(0, 4096, (height, args.width), dtype=np.uint16)
+            imsave(
+                os.path.join(root, f"bench_{i + 1:04d}.tif"),
+                frame,
+                check_contrast=False,
+            )
+
+        results = {}
+        for name, load in [("decode", decode_then_stack), ("headers", check_headers)]:
+            start = time.perf_counter()
+            try:
+                load(root)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{name} accepted the mis-sized frame")
+            results[name] = {"time_to_failure_s": time.perf_counter() - start}
+        results["speedup"] = (
+            results["decode"]["time_to_failure_s"]
+            / results["headers"]["time_to_failure_s"]
+        )
+
+        paths = sorted(glob.glob(f"{root}/*.tif"))
+        for name, n_workers in [("serial", 1), ("parallel", None)]:
+            start = time.perf_counter()
+            read_headers(paths, n_workers=n_workers)
+            results[f"header_scan_{name}_s"] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(root)
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
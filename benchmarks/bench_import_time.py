@@ -0,0 +1,103 @@
+"""
+Import time of the modules behind the command line tools.
+
+Every module is imported in a fresh interpreter with `python -X importtime`
+and its cumulative import time is read from the report (best of several
+runs). The script fails if a module exceeds its budget or loads one of the
+heavy dependencies it must only import on demand. Run from the repository
+root:
+
+    python -m benchmarks.bench_import_time --repeat 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Budgets in milliseconds, and the heavy modules each import must not load
+MODULES = {
+    "cli": (100, ["zarr", "numpy", "pandas", "skimage", "scipy", "napari"]),
+    "create_sap_info": (100, ["zarr", "numpy", "pandas", "skimage", "scipy"]),
+    "space_registration": (500, ["napari", "qtpy", "skimage", "scipy.io"]),
+    "zarrification": (500, ["pandas", "skimage", "scipy.io", "tqdm", "napari"]),
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module):
+    """
+    Cumulative import time of a module in a fresh interpreter, in ms.
+
+    Returns
+    -------
+    float
+        The import time.
+    list
+        The names of all the modules loaded by the import.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys, {module}; print(' '.join(sys.modules))",
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        if name.strip() == module:
+            cumulative = int(cumulative_us) / 1e3
+    return cumulative, result.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Factor applied to the budgets"
+    )
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for module, (budget, forbidden) in MODULES.items():
+        times = []
+        for _ in range(args.repeat):
+            elapsed, loaded = import_time(module)
+            times.append(elapsed)
+        loaded_heavy = sorted(
+            name
+            for name in forbidden
+            if any(
+                loaded_name == name or loaded_name.startswith(f"{name}.")
+                for loaded_name in loaded
+            )
+        )
+        results[module] = {
+            "import_ms": min(times),
+            "budget_ms": budget * args.scale,
+            "heavy_modules_loaded": loaded_heavy,
+        }
+        if min(times) > budget * args.scale:
+            failures.append(f"{module} imports in {min(times):.0f} ms")
+        if loaded_heavy:
+            failures.append(f"{module} loads {', '.join(loaded_heavy)}")
+
+    print(json.dumps(results, indent=4))
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
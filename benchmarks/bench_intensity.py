@@ -0,0 +1,75 @@
+"""
+Benchmark of the dtype policies of the raw ingest on a 16-bit movie.
+
+The movie is ingested with every policy of `intensity.DTYPE_POLICIES`. The
+percentiles of "rescale", estimated from sampled frames, are compared with
+the exact percentiles of the whole movie. Run from the repository root:
+
+    python -m benchmarks.bench_intensity --frames 64 --size 512
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import zarr
+from skimage.io import imsave
+
+from intensity import DTYPE_POLICIES, PERCENTILES
+from zarrification import extract_and_store_raw
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(root, "bench")
+        os.makedirs(folder)
+        rng = np.random.default_rng(0)
+        # 12-bit camera noise around a slow drift of the background
+        movie = np.stack(
+            [
+                rng.normal(600 + 10 * i, 150, (args.size, args.size))
+                .clip(0, 4095)
+                .astype(np.uint16)
+                for i in range(args.frames)
+            ]
+        )
+        for i, frame in enumerate(movie):
+            imsave(
+                os.path.join(folder, f"bench_{i + 1:04d}.tif"),
+                frame,
+                check_contrast=False,
+            )
+
+        results = {"frames": args.frames, "size": args.size}
+        for policy in DTYPE_POLICIES:
+            output = os.path.join(root, policy)
+            os.makedirs(output)
+            group = zarr.open_group(os.path.join(output, "data.zarr"), mode="w")
+            start = time.perf_counter()
+            raw = extract_and_store_raw(
+                folder, group, output, "bench", dtype_policy=policy
+            )
+            results[policy] = {
+                "wall_time_s": time.perf_counter() - start,
+                "dtype": str(raw.dtype),
+                "stored_bytes": raw.nbytes_stored,
+                "intensity_range": raw.attrs["intensity_range"],
+            }
+        results["exact_percentiles"] = np.percentile(movie, PERCENTILES).tolist()
+    finally:
+        shutil.rmtree(root)
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark of the IMAGE/masks storage modes.
+
+Compares the legacy dense uint8 masks with the label storage (native dtype,
+delta + zstd, bounding box index): stored size, and time to extract single
+labels. Run from the repository root:
+
+    python -m benchmarks.bench_masks --frames 20 --size 1024
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import zarr
+
+from segmentation import (
+    LabelIndex,
+    extract_label,
+    label_bounding_boxes,
+    label_chunks,
+    label_codecs,
+    write_label_index,
+)
+
+
+def make_labels(n_frames, size, cell_size, seed=0):
+    """
+    Tile frames with square cells, leaving a background border.
+    """
+    rng = np.random.default_rng(seed)
+    n_cells = size // cell_size
+    frames = []
+    for _ in range(n_frames):
+        ids = rng.permutation(n_cells * n_cells).reshape(n_cells, n_cells) + 1
+        labels = np.kron(ids, np.ones((cell_size, cell_size), dtype=np.uint16))
+        frame = np.zeros((size, size), dtype=np.uint16)
+        frame[: labels.shape[0], : labels.shape[1]] = labels
+        frame[: cell_size * 2] = 0
+        frames.append(frame)
+    return np.stack(frames)
+
+
+def dense_extract(masks, frame, label):
+    image = masks[frame] == label
+    rows = np.flatnonzero(image.any(axis=1))
+    columns = np.flatnonzero(image.any(axis=0))
+    if len(rows) == 0:
+        return None
+    return image[rows[0] : rows[-1] + 1, columns[0] : columns[-1] + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--cell-size", type=int, default=24)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    masks = make_labels(args.frames, args.size, args.cell_size)
+    chunks = (1, args.size, args.size)
+    path = tempfile.mkdtemp(suffix=".zarr")
+    group = zarr.open_group(path, mode="w")
+
+    start = time.perf_counter()
+    dense = group.create_dataset("dense", data=masks.astype(np.uint8), chunks=chunks)
+    dense_write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    labels = group.create_dataset(
+        "labels",
+        data=masks,
+        chunks=label_chunks(args.size, args.size),
+        **label_codecs(masks.dtype),
+    )
+    index_group = write_label_index(
+        group, [label_bounding_boxes(mask) for mask in masks]
+    )
+    labels_write = time.perf_counter() - start
+
+    rng = np.random.default_rng(1)
+    queries = [
+        (int(rng.integers(args.frames)), int(rng.integers(1, masks.max() + 1)))
+        for _ in range(args.queries)
+    ]
+    start = time.perf_counter()
+    for frame, label in queries:
+        dense_extract(dense, frame, label % 256)
+    dense_query = (time.perf_counter() - start) / args.queries
+
+    start = time.perf_counter()
+    index = LabelIndex(index_group)
+    for frame, label in queries:
+        extract_label(labels, index, frame, label)
+    labels_query = (time.perf_counter() - start) / args.queries
+
+    results = {
+        "frames": args.frames,
+        "size": args.size,
+        "max_label": int(masks.max()),
+        "dense_uint8": {
+            "stored_bytes": dense.nbytes_stored,
+            "write_s": dense_write,
+            "extract_label_ms": dense_query * 1e3,
+            "wrapped_labels": int((masks > 255).any(axis=(1, 2)).sum()),
+        },
+        "labels": {
+            "dtype": str(labels.dtype),
+            "stored_bytes": labels.nbytes_stored
+            + sum(array.nbytes_stored for _, array in index_group.arrays()),
+            "write_s": labels_write,
+            "extract_label_ms": labels_query * 1e3,
+        },
+    }
+    print(json.dumps(results, indent=4))
+    shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
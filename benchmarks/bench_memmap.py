@@ -0,0 +1,105 @@
+"""
+Throughput and peak RSS of the raw ingest and of `load_stack`, reading the
+tif frames through a memory map or decoding them.
+
+Uncompressed frames are memory-mapped when `memmap=True`. Compressed frames
+are always decoded, so the compressed movie measures the fallback. Every run
+happens in a fresh process so that its peak RSS is its own. Run from the
+repository root:
+
+    python -m benchmarks.bench_memmap --frames 100 --size 1024
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tifffile
+
+from benchmarks.suite import peak_rss
+
+
+def run(arguments):
+    """
+    Ingest or stack a movie in a worker process.
+
+    Parameters
+    ----------
+    arguments : tuple
+        (stage, movie folder, output folder, memmap).
+
+    Returns
+    -------
+    dict
+        Wall time, throughput and peak RSS.
+    """
+    import zarr
+
+    from zarrification import extract_and_store_raw, load_stack
+
+    stage, folder, output, memmap = arguments
+    os.makedirs(output)
+    baseline = peak_rss()
+    start = time.perf_counter()
+    if stage == "raw":
+        group = zarr.open_group(os.path.join(output, "data.zarr"), mode="w")
+        nbytes = extract_and_store_raw(
+            folder, group, output, "bench", memmap=memmap
+        ).nbytes
+    else:
+        nbytes = load_stack(folder, "*.tif", memmap=memmap)[1].nbytes
+    wall_time = time.perf_counter() - start
+    return {
+        "wall_time_s": wall_time,
+        "mb_per_s": nbytes / wall_time / 1e6,
+        "peak_rss_mb": peak_rss() / 1e6,
+        "rss_growth_mb": (peak_rss() - baseline) / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--size", type=int, default=1024)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(0)
+        for compression in ["none", "zlib"]:
+            folder = os.path.join(root, compression)
+            os.makedirs(folder)
+            for i in range(args.frames):
+                frame = rng.integers(0, 4096, (args.size, args.size), dtype=np.uint16)
+                tifffile.imwrite(
+                    os.path.join(folder, f"bench_{i + 1:04d}.tif"),
+                    frame,
+                    compression=None if compression == "none" else compression,
+                )
+
+        results = {"frames": args.frames, "size": args.size}
+        context = multiprocessing.get_context("spawn")
+        for compression in ["none", "zlib"]:
+            for stage in ["raw", "load_stack"]:
+                for memmap in [False, True]:
+                    name = f"{compression}_{stage}_{'memmap' if memmap else 'decode'}"
+                    folder = os.path.join(root, compression)
+                    output = os.path.join(root, name)
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        results[name] = pool.submit(
+                            run, (stage, folder, output, memmap)
+                        ).result()
+                    shutil.rmtree(output)
+    finally:
+        shutil.rmtree(root)
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
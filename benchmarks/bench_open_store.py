@@ -0,0 +1,69 @@
+"""
+Benchmark of opening an animal store and listing its whole hierarchy.
+
+A store with thousands of nodes (nested TENSORS groups holding small
+arrays) is opened and walked with and without consolidated metadata. Run
+from the repository root:
+
+    python -m benchmarks.bench_open_store --groups 500
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import zarr
+
+from animal_store import consolidate_animal, open_animal
+
+QUANTITIES = ["EpsilonPIV", "OmegaPIV", "UPIV", "grid_xStart", "grid_yStart"]
+
+
+def make_store(path, n_groups):
+    """
+    Create a store with `n_groups` AOT-like groups of small arrays.
+    """
+    animal = zarr.open_group(path, mode="w")
+    tensors = animal.create_group("TENSORS")
+    for i in range(n_groups):
+        group = tensors.require_group(f"AOT_{i // 50}").create_group(f"DBA_{i}")
+        group.attrs["index"] = i
+        for quantity in QUANTITIES:
+            group.zeros(quantity, shape=(4, 8, 10), chunks=(1, 8, 10), dtype=np.float16)
+
+
+def open_and_list(path, consolidated):
+    start = time.perf_counter()
+    animal = open_animal(path, mode="r", consolidated=consolidated)
+    names = []
+    animal.visit(names.append)
+    return time.perf_counter() - start, len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(suffix=".zarr")
+    make_store(path, args.groups)
+    start = time.perf_counter()
+    consolidate_animal(path)
+    consolidation_time = time.perf_counter() - start
+
+    results = {"groups": args.groups, "consolidation_s": consolidation_time}
+    for consolidated in [False, True]:
+        timings = [open_and_list(path, consolidated) for _ in range(args.repeat)]
+        key = "consolidated" if consolidated else "directory"
+        results[f"{key}_open_list_s"] = min(timing for timing, _ in timings)
+        results["nodes"] = timings[0][1]
+    print(json.dumps(results, indent=4))
+    shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
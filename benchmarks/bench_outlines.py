@@ -0,0 +1,64 @@
+"""
+Benchmark of deriving IMAGE/outlines from the masks instead of decoding
+the seg PNG files.
+
+A synthetic animal is ingested once per outlines source, the time spent
+on the outlines stage is compared and the derived outlines are checked
+against the decoded ones. Run from the repository root:
+
+    python -m benchmarks.bench_outlines --frames 20 --size 1024
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import zarr
+
+from benchmarks.synthetic import make_synthetic_animal
+from segmentation import compare_outlines, outlines_from_masks
+from zarrification import load_stack
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--size", type=int, default=1024)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    animal_folder = make_synthetic_animal(
+        root, "bench", n_frames=args.frames, height=args.size, width=args.size
+    )
+    seg_folder = os.path.join(animal_folder, "SEG_bench")
+
+    start = time.perf_counter()
+    ingested = load_stack(os.path.join(seg_folder, "results_bench"), "seg*.png")[1]
+    decode_time = time.perf_counter() - start
+
+    masks = load_stack(os.path.join(seg_folder, "roi_bench"), "roi*.png")[1]
+    group = zarr.open_group(os.path.join(root, "bench.zarr"), mode="w")
+    group.create_dataset("masks", data=masks, chunks=(1, args.size, args.size))
+    start = time.perf_counter()
+    derived = [outlines_from_masks(group["masks"][t]) for t in range(args.frames)]
+    derive_time = time.perf_counter() - start
+
+    agreement = [compare_outlines(derived[t], ingested[t]) for t in range(args.frames)]
+    results = {
+        "frames": args.frames,
+        "size": args.size,
+        "decode_seg_png_s": decode_time,
+        "derive_from_masks_s": derive_time,
+        "min_iou": min(frame["iou"] for frame in agreement),
+        "min_precision": min(frame["precision"] for frame in agreement),
+        "min_recall": min(frame["recall"] for frame in agreement),
+    }
+    print(json.dumps(results, indent=4))
+    shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
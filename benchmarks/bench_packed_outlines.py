@@ -0,0 +1,91 @@
+"""
+Benchmark of dense against bit-packed IMAGE/outlines.
+
+Reports the stored size of both layouts and their read throughput for
+full frames and for 256x256 tiles. Run from the repository root:
+
+    python -m benchmarks.bench_packed_outlines --frames 20 --size 2048
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import zarr
+
+from benchmarks.bench_masks import make_labels
+from segmentation import create_packed_outlines, open_outlines, outlines_from_masks
+
+TILE = 256
+
+
+def read_throughput(array, n_frames, size, tiles):
+    """
+    Return the full-frame and tile read throughputs, in unpacked MB/s.
+    """
+    start = time.perf_counter()
+    for frame in range(n_frames):
+        array[frame]
+    frames_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for frame, y, x in tiles:
+        array[frame, y : y + TILE, x : x + TILE]
+    tiles_time = time.perf_counter() - start
+
+    return {
+        "frame_mb_per_s": n_frames * size * size / frames_time / 1e6,
+        "tile_mb_per_s": len(tiles) * TILE * TILE / tiles_time / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--tiles", type=int, default=200)
+    args = parser.parse_args()
+
+    outlines = outlines_from_masks(make_labels(args.frames, args.size, 24))
+    path = tempfile.mkdtemp(suffix=".zarr")
+    dense_group = zarr.open_group(f"{path}/dense", mode="w")
+    packed_group = zarr.open_group(f"{path}/packed", mode="w")
+
+    dense = dense_group.create_dataset(
+        "outlines", data=outlines, chunks=(1, args.size, args.size)
+    )
+    packed = create_packed_outlines(packed_group, outlines.shape)
+    packed[:] = outlines
+    packed = open_outlines(packed_group)
+    assert np.array_equal(packed[0], dense[0])
+
+    rng = np.random.default_rng(0)
+    tiles = [
+        (
+            int(rng.integers(args.frames)),
+            int(rng.integers(args.size - TILE)),
+            int(rng.integers(args.size - TILE)),
+        )
+        for _ in range(args.tiles)
+    ]
+    results = {
+        "frames": args.frames,
+        "size": args.size,
+        "dense": {
+            "stored_bytes": dense.nbytes_stored,
+            **read_throughput(dense, args.frames, args.size, tiles),
+        },
+        "packed": {
+            "stored_bytes": packed.packed.nbytes_stored,
+            **read_throughput(packed, args.frames, args.size, tiles),
+        },
+    }
+    print(json.dumps(results, indent=4))
+    shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
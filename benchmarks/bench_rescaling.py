@@ -0,0 +1,82 @@
+"""
+Benchmark of the rescalingOutput.txt parser against pandas.
+
+A cohort table with many animals is parsed with `parse_rescaling_file`,
+with the memoized `read_rescaling_table` (one lookup per animal of the
+batch) and with the former `pd.read_table` approach. Run from the
+repository root:
+
+    python -m benchmarks.bench_rescaling --animals 100000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from create_sap_info import (
+    RESCALING_COLUMNS,
+    RESCALING_INDEX,
+    parse_rescaling_file,
+    read_rescaling_table,
+)
+
+
+def make_table(path, n_animals, seed=0):
+    """
+    Write a synthetic rescaling table of `n_animals` rows.
+    """
+    rng = np.random.default_rng(seed)
+    columns = [RESCALING_INDEX] + RESCALING_COLUMNS + ["nMacro"]
+    with open(path, "w") as file:
+        file.write(" ".join(columns) + "\n")
+        for i in range(n_animals):
+            file.write(
+                f"wRNAi_{i} {rng.integers(400, 900)} {rng.random() + 0.5:.6f} "
+                f"{rng.random() + 0.5:.6f} {rng.integers(900, 1300)} "
+                f"{rng.integers(500, 900)} 4\n"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--animals", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=50, help="Animals looked up")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "rescalingOutput.txt")
+    make_table(path, args.animals)
+    results = {"animals": args.animals}
+
+    start = time.perf_counter()
+    rows = parse_rescaling_file(path)
+    results["parser_s"] = time.perf_counter() - start
+
+    # One lookup per animal of the batch, the file is parsed once
+    names = list(rows)[:: max(1, len(rows) // args.batch)]
+    start = time.perf_counter()
+    for name in names:
+        read_rescaling_table(path)[name]
+    results["memoized_batch_s"] = time.perf_counter() - start
+    results["batch"] = len(names)
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+    if pd is not None:
+        start = time.perf_counter()
+        table = pd.read_table(path, sep=" ").set_index(RESCALING_INDEX)
+        pandas_rows = table.to_dict(orient="index")
+        results["pandas_s"] = time.perf_counter() - start
+        results["identical"] = pandas_rows == dict(rows)
+
+    print(json.dumps(results, indent=4))
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark of time-window queries of tensor quantities.
+
+A synthetic animal with many time points is extracted, then a frame window
+of UPIV is read with `query_tensor` and by loading the whole quantity and
+slicing it by hand. The chunks read by the query are counted through a
+store wrapper. Run from the repository root:
+
+    python -m benchmarks.bench_tensor_query --times 200 --frames 50 120
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+import warnings
+from collections.abc import MutableMapping
+
+import numpy as np
+import zarr
+
+from animal_store import open_animal, require_animal_groups
+from benchmarks.synthetic import make_synthetic_animal
+from tensors import FRAME_INDEX, TIME_INDEX, query_tensor, time_index
+from zarrification import extract_AOT_results_folder
+
+
+class CountingStore(MutableMapping):
+    """
+    Store wrapper counting the chunk keys read under a path prefix.
+    """
+
+    def __init__(self, store, prefix):
+        self.store = store
+        self.prefix = prefix
+        self.reads = 0
+
+    def __getitem__(self, key):
+        if key.startswith(self.prefix) and not key.rsplit("/", 1)[-1].startswith("."):
+            self.reads += 1
+        return self.store[key]
+
+    def __setitem__(self, key, value):
+        self.store[key] = value
+
+    def __delitem__(self, key):
+        del self.store[key]
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, key):
+        return key in self.store
+
+
+def check_single_time_point(root):
+    """
+    Extract a backup with a single time point.
+
+    `loadmat(squeeze_me=True)` squeezes its `TimeArray` and `FrameArray` to
+    shape (2,): the extraction must still index one time point.
+    """
+    folder = make_synthetic_animal(
+        root, "single", n_frames=1, height=32, width=32, n_cells=2, n_times=1
+    )
+    animal = open_animal(folder, "a")
+    require_animal_groups(animal)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        extract_AOT_results_folder(
+            animal.TENSORS,
+            f"{folder}/SAP_single",
+            ["UPIV", "Coordinates", "TimeArray", "FrameArray"],
+        )
+    group = animal.TENSORS["DBA_L"]
+    index = time_index(group)
+    assert index[TIME_INDEX].shape == (1, 2), index[TIME_INDEX]
+    assert index[FRAME_INDEX].tolist() == [[1, 24]], index[FRAME_INDEX]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--times", type=int, default=200)
+    parser.add_argument("--frames", type=int, nargs=2, default=[50, 120])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    check_single_time_point(root)
+    folder = make_synthetic_animal(
+        root, "animal", n_frames=1, height=32, width=32, n_cells=2, n_times=args.times
+    )
+    animal = open_animal(folder, "a")
+    require_animal_groups(animal)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        extract_AOT_results_folder(
+            animal.TENSORS,
+            f"{folder}/SAP_animal",
+            ["UPIV", "Coordinates", "TimeArray", "FrameArray"],
+        )
+
+    store = CountingStore(zarr.DirectoryStore(folder), "TENSORS/DBA_L/UPIV/")
+    group = zarr.open_group(store, mode="r").TENSORS["DBA_L"]
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        values, coordinates = query_tensor(group, "UPIV", frames=args.frames)
+    query_time = (time.perf_counter() - start) / args.repeat
+    chunk_reads = store.reads // args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        frame_array = np.array(group["FrameArray"][0])
+        selected = (frame_array[:, 0] <= args.frames[1]) & (
+            frame_array[:, 1] >= args.frames[0]
+        )
+        expected = group["UPIV"][:][selected]
+    naive_time = (time.perf_counter() - start) / args.repeat
+
+    results = {
+        "time_points": args.times,
+        "selected": len(values),
+        "chunk_reads": chunk_reads,
+        "query_ms": 1e3 * query_time,
+        "load_and_slice_ms": 1e3 * naive_time,
+        "identical": bool(np.array_equal(values, expected)),
+    }
+    print(json.dumps(results, indent=4))
+    shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Stress test of concurrent writes to a single animal store.
+
+An image ingest and an AOT extraction of the same animal run in two
+processes at once, both also writing METADATA attributes, then the store
+is checked for integrity. Run from the repository root:
+
+    python -m benchmarks.stress_concurrent_writes --rounds 5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+from skimage.io import imread
+
+from animal_store import open_animal, require_animal_groups
+from benchmarks.synthetic import make_synthetic_animal
+from zarrification import extract_AOT_results_folder, store_data_in_zarr
+
+QUANTITIES = ["EpsilonPIV", "OmegaPIV", "UPIV", "xywh", "Coordinates", "TimeArray"]
+N_ATTRIBUTE_WRITES = 50
+
+
+def write_attributes(animal, writer):
+    for i in range(N_ATTRIBUTE_WRITES):
+        animal.METADATA.attrs[f"{writer}_{i}"] = i
+
+
+def ingest_images(animal_folder):
+    animal_folder = Path(animal_folder)
+    name = animal_folder.name
+    seg_folder = animal_folder / f"SEG_{name}"
+    store_data_in_zarr(
+        animal_folder,
+        animal_folder,
+        seg_folder / f"results_{name}",
+        seg_folder / f"roi_{name}",
+        animal_folder / f"SAP_{name}",
+    )
+    write_attributes(open_animal(animal_folder), "ingest")
+
+
+def extract_tensors(animal_folder):
+    animal_folder = Path(animal_folder)
+    animal = open_animal(animal_folder)
+    require_animal_groups(animal)
+    extract_AOT_results_folder(
+        animal.TENSORS, animal_folder / f"SAP_{animal_folder.name}", QUANTITIES
+    )
+    write_attributes(animal, "tensors")
+
+
+def check_integrity(animal_folder):
+    """
+    Check that both writers' outputs are complete and readable.
+
+    Returns
+    -------
+    list
+        The problems found, empty if the store is intact.
+    """
+    problems = []
+    animal_folder = Path(animal_folder)
+    for root, _, files in os.walk(animal_folder):
+        for file in files:
+            if file in [".zgroup", ".zarray", ".zattrs"]:
+                try:
+                    json.loads((Path(root) / file).read_text())
+                except ValueError:
+                    problems.append(f"corrupted {Path(root) / file}")
+
+    animal = open_animal(animal_folder, mode="r")
+    name = animal_folder.name
+    first_mask = imread(animal_folder / f"SEG_{name}" / f"roi_{name}" / "roi_0001.png")
+    for dataset in ["raw", "outlines", "masks"]:
+        if dataset not in animal.IMAGE:
+            problems.append(f"missing IMAGE/{dataset}")
+    if "masks" in animal.IMAGE and not np.array_equal(
+        animal.IMAGE.masks[0], first_mask.astype(animal.IMAGE.masks.dtype)
+    ):
+        problems.append("IMAGE/masks differs from the source")
+    for grid in ["DBA_L", "AOA_L"]:
+        for quantity in ["EpsilonPIV", "OmegaPIV", "UPIV"]:
+            if f"{grid}/{quantity}" not in animal.TENSORS:
+                problems.append(f"missing TENSORS/{grid}/{quantity}")
+    attributes = animal.METADATA.attrs.asdict()
+    for writer in ["ingest", "tensors"]:
+        for i in range(N_ATTRIBUTE_WRITES):
+            if attributes.get(f"{writer}_{i}") != i:
+                problems.append(f"lost METADATA attribute {writer}_{i}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--size", type=int, default=256)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    failures = 0
+    context = get_context("spawn")
+    for round_index in range(args.rounds):
+        animal_folder = make_synthetic_animal(
+            root,
+            f"stress_{round_index}",
+            n_frames=args.frames,
+            height=args.size,
+            width=args.size,
+            seed=round_index,
+        )
+
+        processes = [
+            context.Process(target=ingest_images, args=(animal_folder,)),
+            context.Process(target=extract_tensors, args=(animal_folder,)),
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        problems = check_integrity(animal_folder)
+        problems += [
+            f"writer exited with {process.exitcode}"
+            for process in processes
+            if process.exitcode != 0
+        ]
+        failures += bool(problems)
+        print(f"round {round_index}: {'OK' if not problems else problems}")
+
+    shutil.rmtree(root)
+    if failures:
+        raise SystemExit(f"{failures}/{args.rounds} rounds corrupted the store")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Benchmark suite of the zarrification pipeline stages on a synthetic animal.
+
+Every stage runs in a fresh process so that its peak RSS is its own, and
+reports its wall time, throughput, peak RSS and the size written on disk as
+JSON. Two reports can then be compared to flag regressions. Run from the
+repository root:
+
+    python -m benchmarks.suite run --frames 50 --height 512 --width 512 -o before.json
+    python -m benchmarks.suite run --frames 50 --height 512 --width 512 -o after.json
+    python -m benchmarks.suite compare before.json after.json --threshold 0.1
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import zarr
+
+STAGES = [
+    "load_stack",
+    "save_stack",
+    "extract_and_store_data",
+    "store_data_in_zarr",
+    "extract_AOT",
+    "harmonize_shape",
+]
+QUANTITIES = ["EpsilonPIV", "OmegaPIV", "UPIV", "xywh", "Overlap", "Coordinates"]
+HARMONIZE_REPEAT = 1000
+
+
+def disk_size(path):
+    """
+    Total size in bytes of the files under `path`.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, file))
+        for root, _, files in os.walk(path)
+        for file in files
+    )
+
+
+def peak_rss():
+    """
+    Peak resident set size of the current process, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def aot_files(animal_folder):
+    return sorted(glob.glob(os.path.join(animal_folder, "SAP_*", "AOT*", "*", "*.mat")))
+
+
+def run_stage(arguments):
+    """
+    Run one stage on the synthetic animal, in a fresh worker process.
+
+    Inputs that the stage does not measure (e.g. the movie saved by
+    `save_stack`) are prepared before the timer starts.
+
+    Parameters
+    ----------
+    arguments : tuple
+        (stage name, animal folder, work folder).
+
+    Returns
+    -------
+    dict
+        The wall time, items and bytes processed, throughputs, peak RSS and
+        size on disk of the stage.
+    """
+    from skimage.io import imread
+
+    from zarrification import (
+        extract_AOT,
+        extract_and_store_data,
+        harmonize_shape,
+        load_and_update_backup,
+        load_stack,
+        save_stack,
+        store_data_in_zarr,
+    )
+
+    stage, animal_folder, work_folder = arguments
+    name = os.path.basename(animal_folder)
+    seg_folder = os.path.join(animal_folder, f"SEG_{name}")
+    output = os.path.join(work_folder, stage)
+    os.makedirs(output)
+    warnings.simplefilter("ignore")
+
+    if stage == "load_stack":
+        start = time.perf_counter()
+        movie = load_stack(animal_folder, "*.tif")[1]
+        wall_time = time.perf_counter() - start
+        items, nbytes = len(movie), movie.nbytes
+
+    elif stage == "save_stack":
+        movie = load_stack(animal_folder, "*.tif")[1]
+        start = time.perf_counter()
+        save_stack(output, name, movie, extension="tif")
+        wall_time = time.perf_counter() - start
+        items, nbytes = len(movie), movie.nbytes
+
+    elif stage == "extract_and_store_data":
+        group = zarr.open_group(os.path.join(output, "data.zarr"), mode="w")
+        height, width = imread(glob.glob(os.path.join(animal_folder, "*.tif"))[0]).shape
+        start = time.perf_counter()
+        data = extract_and_store_data(
+            os.path.join(seg_folder, f"results_{name}"),
+            "seg",
+            "outlines",
+            group,
+            height,
+            width,
+        )
+        wall_time = time.perf_counter() - start
+        items, nbytes = len(data), data.nbytes
+
+    elif stage == "store_data_in_zarr":
+        zarr_path = os.path.join(output, name)
+        start = time.perf_counter()
+        store_data_in_zarr(
+            zarr_path,
+            animal_folder,
+            os.path.join(seg_folder, f"results_{name}"),
+            os.path.join(seg_folder, f"roi_{name}"),
+            os.path.join(animal_folder, f"SAP_{name}"),
+        )
+        wall_time = time.perf_counter() - start
+        raw = zarr.open_group(zarr_path, mode="r")["IMAGE"]["raw"]
+        items, nbytes = raw.shape[0], raw.nbytes
+
+    elif stage == "extract_AOT":
+        files = aot_files(animal_folder)
+        tensors = zarr.open_group(os.path.join(output, "tensors.zarr"), mode="w")
+        groups = [
+            tensors.require_group(os.path.basename(os.path.dirname(path)))
+            for path in files
+        ]
+        start = time.perf_counter()
+        for group, path in zip(groups, files):
+            extract_AOT(group, path, QUANTITIES, verbose=False)
+        wall_time = time.perf_counter() - start
+        items, nbytes = len(files), sum(os.path.getsize(path) for path in files)
+
+    elif stage == "harmonize_shape":
+        arrays = [
+            (os.path.basename(os.path.dirname(path)), quantity, backup[quantity])
+            for path in aot_files(animal_folder)
+            for backup in [load_and_update_backup(path)]
+            for quantity in ["EpsilonPIV", "OmegaPIV", "UPIV"]
+        ]
+        start = time.perf_counter()
+        for _ in range(HARMONIZE_REPEAT):
+            for group_name, quantity, value in arrays:
+                harmonize_shape(value, quantity_name=quantity, group_name=group_name)
+        wall_time = time.perf_counter() - start
+        items = HARMONIZE_REPEAT * len(arrays)
+        nbytes = HARMONIZE_REPEAT * sum(value.nbytes for _, _, value in arrays)
+
+    else:
+        raise ValueError(f"Unknown stage {stage}, choose from {STAGES}")
+
+    return {
+        "wall_time_s": wall_time,
+        "items": items,
+        "items_per_s": items / wall_time,
+        "mb_per_s": nbytes / wall_time / 1e6,
+        "peak_rss_mb": peak_rss() / 1e6,
+        "disk_bytes": disk_size(output),
+    }
+
+
+def run_suite(args):
+    """
+    Generate the synthetic animal and run the selected stages.
+
+    Returns
+    -------
+    dict
+        The report: configuration, environment and per-stage results. Each
+        result is the median run (by wall time) of `args.repeat` runs.
+    """
+    from benchmarks.synthetic import make_synthetic_animal
+
+    root = tempfile.mkdtemp()
+    try:
+        animal_folder = make_synthetic_animal(
+            root,
+            "suite",
+            n_frames=args.frames,
+            height=args.height,
+            width=args.width,
+            n_cells=args.cells,
+            grid_shape=(args.grid_rows, args.grid_columns),
+            n_times=args.times,
+        )
+        stages = {}
+        # A fresh interpreter per run, so that peak RSS is not inherited
+        context = multiprocessing.get_context("spawn")
+        for stage in args.stages:
+            runs = []
+            for i in range(args.repeat):
+                work_folder = os.path.join(root, f"work_{stage}_{i}")
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(
+                        pool.submit(
+                            run_stage, (stage, animal_folder, work_folder)
+                        ).result()
+                    )
+                shutil.rmtree(work_folder)
+            stages[stage] = sorted(runs, key=lambda run: run["wall_time_s"])[
+                len(runs) // 2
+            ]
+            print(f"{stage}: {stages[stage]['wall_time_s']:.3f} s", file=sys.stderr)
+    finally:
+        shutil.rmtree(root)
+
+    return {
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ["command", "output", "stages"]
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "zarr": zarr.__version__,
+        },
+        "stages": stages,
+    }
+
+
+def compare_reports(before, after, threshold=0.1):
+    """
+    Compare two reports and flag the regressions.
+
+    A stage regresses when its wall time or peak RSS grew by more than
+    `threshold` (relative).
+
+    Parameters
+    ----------
+    before, after : dict
+        Reports written by `run_suite`.
+    threshold : float, optional
+        Relative tolerance. Default is 0.1 (10%).
+
+    Returns
+    -------
+    dict
+        {stage: {metric: {"before", "after", "change", "regression"}}} for the
+        stages present in both reports.
+    """
+    comparison = {}
+    for stage in before["stages"].keys() & after["stages"].keys():
+        comparison[stage] = {}
+        for metric in ["wall_time_s", "peak_rss_mb", "disk_bytes"]:
+            old, new = before["stages"][stage][metric], after["stages"][stage][metric]
+            change = (new - old) / old if old else 0.0
+            comparison[stage][metric] = {
+                "before": old,
+                "after": new,
+                "change": change,
+                "regression": change > threshold,
+            }
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the suite")
+    run_parser.add_argument("--frames", type=int, default=50)
+    run_parser.add_argument("--height", type=int, default=512)
+    run_parser.add_argument("--width", type=int, default=512)
+    run_parser.add_argument("--cells", type=int, default=200)
+    run_parser.add_argument("--grid-rows", type=int, default=30)
+    run_parser.add_argument("--grid-columns", type=int, default=40)
+    run_parser.add_argument("--times", type=int, default=20)
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    run_parser.add_argument("-o", "--output", help="JSON report, default stdout")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = json.dumps(run_suite(args), indent=4)
+        if args.output:
+            with open(args.output, "w") as file:
+                file.write(report)
+        else:
+            print(report)
+        return
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+    comparison = compare_reports(before, after, args.threshold)
+    print(json.dumps(comparison, indent=4))
+    regressions = [
+        f"{stage}.{metric}"
+        for stage, metrics in comparison.items()
+        for metric, result in metrics.items()
+        if result["regression"]
+    ]
+    if regressions:
+        print(f"Regressions: {', '.join(sorted(regressions))}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
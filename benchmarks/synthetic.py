@@ -0,0 +1,145 @@
+import os
+import warnings
+
+import numpy as np
+import scipy.io as spio
+from skimage.io import imsave
+
+from segmentation import outlines_from_masks
+
+
+def make_grid_coordinates(n_rows, n_columns, origin=(1, 2)):
+    """
+    Build a MATLAB-like cell array of grid coordinates.
+
+    Parameters
+    ----------
+    n_rows, n_columns : int
+        Size of the grid.
+    origin : tuple, optional
+        (row, column) of the box whose coordinates are (0, 0).
+
+    Returns
+    -------
+    np.ndarray
+        Object array of shape (n_rows, n_columns) holding [x, y] arrays.
+    """
+    coordinates = np.empty((n_rows, n_columns), dtype=object)
+    for i in range(n_rows):
+        for j in range(n_columns):
+            coordinates[i, j] = np.array([float(j - origin[1]), float(i - origin[0])])
+    return coordinates
+
+
+def make_aot_backup(rng, n_rows, n_columns, n_times, origin=(1, 2), start_hour=14):
+    """
+    Build the content of a synthetic AOT backup `.mat` file.
+
+    Time points last two hours from `start_hour` APF and the grid origin is
+    the box at `origin` (row, column).
+
+    Returns
+    -------
+    dict
+        Variables to be saved with `scipy.io.savemat`.
+    """
+    hours = start_hour + 2 * np.arange(n_times + 1)
+    return {
+        "EpsilonPIV": rng.random((n_rows, n_columns, 2, 2, n_times)),
+        "OmegaPIV": rng.random((n_rows, n_columns, n_times)),
+        "UPIV": rng.random((n_rows, n_columns, 2, n_times)),
+        "xywh": np.array([10, 20, 30, 40]),
+        "Overlap": 0.5,
+        "Coordinates": make_grid_coordinates(n_rows, n_columns, origin),
+        "TimeArray": np.array(
+            [[f"{h}h00", f"{h + 2}h00"] for h in hours[:-1]], dtype=object
+        ),
+        "FrameArray": np.array([[1 + 24 * t, 24 * (t + 1)] for t in range(n_times)]),
+    }
+
+
+def make_synthetic_animal(
+    root,
+    animal_name="synthetic_1",
+    n_frames=10,
+    height=256,
+    width=256,
+    n_cells=50,
+    grid_shape=(8, 10),
+    n_times=4,
+    seed=0,
+    origin=(1, 2),
+    start_hour=14,
+):
+    """
+    Generate a synthetic animal folder laid out like our acquisitions.
+
+    The folder holds `{animal}_{NNNN}.tif` raw frames, the `SEG_{animal}` folder
+    with `results_*` outlines and `roi_*` label masks, and a `SAP_{animal}`
+    folder with an AOT folder containing DBA and AOA backups.
+
+    Parameters
+    ----------
+    root : str or Path
+        Folder in which the animal folder is created.
+    animal_name : str, optional
+        Name of the animal.
+    n_frames, height, width : int, optional
+        Size of the movie.
+    n_cells : int, optional
+        Number of square cells drawn in each mask.
+    grid_shape : tuple, optional
+        (rows, columns) of the PIV grid of the AOT backups.
+    n_times : int, optional
+        Number of time points of the AOT backups.
+    seed : int, optional
+        Seed of the random generator.
+    origin : tuple, optional
+        (row, column) of the origin box of the PIV grid.
+    start_hour : int, optional
+        Start of the first time point of the AOT backups, in hours APF.
+
+    Returns
+    -------
+    str
+        The path to the animal folder.
+    """
+    rng = np.random.default_rng(seed)
+    animal_folder = os.path.join(root, animal_name)
+    seg_folder = os.path.join(animal_folder, f"SEG_{animal_name}")
+    outlines_folder = os.path.join(seg_folder, f"results_{animal_name}")
+    masks_folder = os.path.join(seg_folder, f"roi_{animal_name}")
+    for folder in [outlines_folder, masks_folder]:
+        os.makedirs(folder, exist_ok=True)
+
+    cell_size = max(min(height, width) // 16, 3)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=UserWarning)
+        for i in range(1, n_frames + 1):
+            raw = rng.integers(0, 4096, (height, width), dtype=np.uint16)
+            imsave(os.path.join(animal_folder, f"{animal_name}_{i:04d}.tif"), raw)
+
+            labels = np.zeros((height, width), dtype=np.uint16)
+            ys = rng.integers(0, height - cell_size, n_cells)
+            xs = rng.integers(0, width - cell_size, n_cells)
+            for label, (y, x) in enumerate(zip(ys, xs), start=1):
+                labels[y : y + cell_size, x : x + cell_size] = label
+            imsave(os.path.join(masks_folder, f"roi_{i:04d}.png"), labels)
+
+            imsave(
+                os.path.join(outlines_folder, f"seg_{i:04d}.png"),
+                outlines_from_masks(labels),
+            )
+
+    n_rows, n_columns = grid_shape
+    for subfolder in ["DBA_L", "AOA_L"]:
+        aot_folder = os.path.join(
+            animal_folder, f"SAP_{animal_name}", "AOT_synthetic", subfolder
+        )
+        os.makedirs(aot_folder, exist_ok=True)
+        spio.savemat(
+            os.path.join(aot_folder, f"AOT_{subfolder}.mat"),
+            make_aot_backup(rng, n_rows, n_columns, n_times, origin, start_hour),
+        )
+
+    return animal_folder
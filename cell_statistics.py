@@ -0,0 +1,172 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import zarr
+
+from segmentation import label_bounding_boxes, open_outlines
+
+STATISTICS_GROUP = "cell_statistics"
+SOURCE_KEY = "source"
+SOURCE_DATASETS = ["masks", "outlines"]
+
+
+def frame_statistics(mask, outline):
+    """
+    Compute the region statistics of every label of a frame in a few passes.
+
+    Areas, centroids and perimeters are weighted histograms of the label
+    image (`np.bincount`), bounding boxes come from `ndimage.find_objects`.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        2D label image, 0 being the background.
+    outline : numpy.ndarray
+        2D binary outline image of the same frame. The perimeter of a cell is
+        the number of outline pixels carrying its label.
+
+    Returns
+    -------
+    dict
+        Columns "label", "area", "centroid" (y, x), "bbox" (y_start, y_stop,
+        x_start, x_stop) and "perimeter", one row per label.
+    """
+    labels, bboxes = label_bounding_boxes(mask)
+    flat = mask.ravel()
+    n_bins = int(flat.max()) + 1
+    height, width = mask.shape
+
+    area = np.bincount(flat, minlength=n_bins)
+    rows = np.repeat(np.arange(height, dtype=np.float64), width)
+    columns = np.tile(np.arange(width, dtype=np.float64), height)
+    sum_y = np.bincount(flat, weights=rows, minlength=n_bins)
+    sum_x = np.bincount(flat, weights=columns, minlength=n_bins)
+    perimeter = np.bincount(flat[outline.ravel() > 0], minlength=n_bins)
+
+    area = area[labels]
+    return {
+        "label": labels,
+        "area": area,
+        "centroid": np.stack([sum_y[labels] / area, sum_x[labels] / area], axis=1),
+        "bbox": bboxes,
+        "perimeter": perimeter[labels],
+    }
+
+
+def statistics_from_store(arguments):
+    """
+    Compute the statistics of one frame of a store, in a worker process.
+
+    Parameters
+    ----------
+    arguments : tuple
+        (store path, frame index).
+
+    Returns
+    -------
+    dict
+        See `frame_statistics`.
+    """
+    zarr_path, frame = arguments
+    image = zarr.open_group(zarr_path, mode="r")["IMAGE"]
+    return frame_statistics(image["masks"][frame], open_outlines(image)[frame])
+
+
+def source_signature(zarr_path):
+    """
+    Shape and metadata modification time of the masks and outlines of a
+    store, which change whenever they are rewritten.
+
+    Returns
+    -------
+    dict
+        {dataset: {"shape", "mtime_ns"}} for the datasets of `SOURCE_DATASETS`.
+    """
+    image = zarr.open_group(zarr_path, mode="r")["IMAGE"]
+    return {
+        name: {
+            "shape": list(image[name].shape),
+            "mtime_ns": os.stat(
+                os.path.join(zarr_path, "IMAGE", name, ".zarray")
+            ).st_mtime_ns,
+        }
+        for name in SOURCE_DATASETS
+    }
+
+
+def compute_cell_statistics(zarr_path, tracking_group, n_workers=None):
+    """
+    Compute per-frame cell statistics of an animal and store them as columns.
+
+    Each mask and outline frame is read once, frames are processed in
+    parallel. The results are written in `TRACKING/cell_statistics` as
+    columnar arrays (`frame`, `label`, `area`, `centroid`, `bbox`,
+    `perimeter`), the rows of frame t being `offsets[t]:offsets[t + 1]`,
+    along with the number of cells per frame in `cell_count`. The masks and
+    outlines they come from are recorded in the `source` attribute, see
+    `source_signature`: statistics of unchanged masks and outlines are not
+    computed again.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        Path to the zarr store of the animal.
+    tracking_group : zarr.hierarchy.Group
+        The TRACKING group of the animal.
+    n_workers : int, optional
+        Number of worker processes. Default is the number of CPUs.
+
+    Returns
+    -------
+    zarr.hierarchy.Group
+        The statistics group.
+    """
+    zarr_path = str(zarr_path)
+    source = source_signature(zarr_path)
+    if (
+        STATISTICS_GROUP in tracking_group
+        and tracking_group[STATISTICS_GROUP].attrs.get(SOURCE_KEY) == source
+    ):
+        print("Cell statistics are up to date")
+        return tracking_group[STATISTICS_GROUP]
+    masks = zarr.open_group(zarr_path, mode="r")["IMAGE"]["masks"]
+    n_frames = masks.shape[0]
+    n_workers = n_workers or os.cpu_count()
+
+    print("Computing cell statistics")
+    arguments = [(zarr_path, frame) for frame in range(n_frames)]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        frames = list(
+            executor.map(
+                statistics_from_store,
+                arguments,
+                chunksize=max(1, n_frames // (4 * n_workers)),
+            )
+        )
+
+    cell_count = np.array([len(frame["label"]) for frame in frames], dtype=np.int64)
+    # A frame without cells gives the empty columns of a movie without frames
+    rows = frames or [
+        frame_statistics(np.zeros((1, 1), masks.dtype), np.zeros((1, 1), np.uint8))
+    ]
+    statistics = tracking_group.require_group(STATISTICS_GROUP)
+    statistics.create_dataset(
+        "offsets",
+        data=np.concatenate([[0], np.cumsum(cell_count)]).astype(np.int64),
+        overwrite=True,
+    )
+    statistics.create_dataset("cell_count", data=cell_count, overwrite=True)
+    statistics.create_dataset(
+        "frame",
+        data=np.repeat(np.arange(n_frames, dtype=np.int32), cell_count),
+        overwrite=True,
+    )
+    for column in ["label", "area", "centroid", "bbox", "perimeter"]:
+        statistics.create_dataset(
+            column,
+            data=np.concatenate([frame[column] for frame in rows]),
+            overwrite=True,
+        )
+    statistics.attrs[SOURCE_KEY] = source
+    return statistics
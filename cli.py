@@ -0,0 +1,252 @@
+"""
+Command line interface of the zarrification and configuration tools.
+
+Every command imports the modules it needs when it runs, so that quick
+commands (e.g. generating the SAP configuration) do not pay for zarr,
+scikit-image, scipy, pandas or napari.
+
+    python cli.py zarrify /data/wRNAi_1 --averages block_24 --report
+    python cli.py sap-config /data/wRNAi_1 wRNAi_1 --run sr piv vm
+    python cli.py config-diff /data/wRNAi_1 /data/wRNAi_2
+    python cli.py sap-run /data/*/SAP_info/SAP_info_*.m --command octave
+    python cli.py export-attributes /data/wRNAi_1
+    python cli.py export /data/wRNAi_1 wRNAi_1.zip
+    python cli.py import wRNAi_1.zip /data/wRNAi_1
+    python cli.py cohort cohort.zarr /data/wRNAi_1 /data/wRNAi_2 --quantity UPIV
+"""
+
+import argparse
+
+SAP_PROGRAMS = ["sr", "piv", "vm", "ffbp", "ct", "aot"]
+
+
+def zarrify(args):
+    from zarrification import run_zarrification
+
+    run_zarrification(
+        args.folder,
+        output_folder=args.output,
+        averages=args.averages,
+        report=args.report,
+        profile=args.profile,
+        on_gap=args.on_gap,
+        raw_dtype=args.raw_dtype,
+        mask_storage=args.mask_storage,
+        outlines_source=args.outlines_source,
+        outlines_storage=args.outlines_storage,
+        cell_statistics=args.cell_statistics,
+        n_workers=args.workers,
+    )
+
+
+def sap_config(args):
+    from create_sap_info import generate_sap_files
+
+    generate_sap_files(
+        args.folder,
+        args.animal,
+        algorithm_to_run={
+            program: int(program in args.run) for program in SAP_PROGRAMS
+        },
+        force=args.force,
+    )
+
+
+def config_diff(args):
+    from sap_config import diff_cohort
+
+    differences = diff_cohort(args.stores)
+    for key, values in differences.items():
+        print(key)
+        for store, value in values.items():
+            print(f"    {store}: {value}")
+    if not differences:
+        print("Same effective parameters in every recorded store")
+
+
+def sap_run(args):
+    import json
+
+    from sap_scheduler import run_sap_jobs
+
+    results = run_sap_jobs(
+        args.scripts,
+        command=args.command,
+        n_workers=args.workers,
+        timeout=args.timeout,
+        extract=not args.no_extract,
+    )
+    if args.summary:
+        with open(args.summary, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+def export_attributes(args):
+    from pathlib import Path
+
+    from animal_store import open_animal
+    from space_registration import attributes_to_text_file
+
+    path_animal = Path(args.store)
+    animal_name = args.name or path_animal.name
+    attributes_to_text_file(open_animal(path_animal, "r"), path_animal, animal_name)
+
+
+def export_archive(args):
+    from animal_store import export_animal
+
+    checksums = export_animal(args.store, args.archive)
+    print(f"Exported {len(checksums)} keys to {args.archive}")
+
+
+def import_archive(args):
+    from animal_store import import_animal
+
+    import_animal(args.archive, args.store)
+    print(f"Imported {args.archive} into {args.store}")
+
+
+def cohort(args):
+    from cohort import aggregate_quantity
+
+    group = aggregate_quantity(
+        args.animals,
+        args.cohort,
+        args.quantity,
+        grid=args.grid,
+        time_block=args.time_block,
+        n_workers=args.workers,
+    )
+    print(group.tree())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description=__doc__.strip().splitlines()[0]
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    zarrify_parser = subparsers.add_parser("zarrify", help="Zarrify an animal folder")
+    zarrify_parser.add_argument("folder", help="Animal folder, named after the animal")
+    zarrify_parser.add_argument("-o", "--output", help="Zarr store, default folder")
+    zarrify_parser.add_argument(
+        "--averages", nargs="+", help="Time-averaging windows, e.g. block_24 sliding_5"
+    )
+    zarrify_parser.add_argument(
+        "--report", action="store_true", help="Store a run report in METADATA"
+    )
+    zarrify_parser.add_argument("--profile", help="cProfile output file")
+    zarrify_parser.add_argument(
+        "--on-gap",
+        default="skip",
+        choices=["skip", "pad", "fail"],
+        help="What to do with missing frame numbers",
+    )
+    zarrify_parser.add_argument(
+        "--raw-dtype",
+        default="native",
+        choices=["native", "rescale", "cast"],
+        help="Keep the raw dtype, or convert to uint8 between percentiles",
+    )
+    zarrify_parser.add_argument(
+        "--mask-storage",
+        default="labels",
+        choices=["labels", "dense"],
+        help="Native label dtype with a bbox index, or uint8",
+    )
+    zarrify_parser.add_argument(
+        "--outlines-source",
+        default="seg",
+        choices=["seg", "masks"],
+        help="Decode the seg files, or derive the outlines from the masks",
+    )
+    zarrify_parser.add_argument(
+        "--outlines-storage",
+        default="dense",
+        choices=["dense", "packed"],
+        help="uint8 per pixel, or 8 pixels per byte",
+    )
+    zarrify_parser.add_argument(
+        "--cell-statistics",
+        action="store_true",
+        help="Compute the per-frame cell statistics into TRACKING",
+    )
+    zarrify_parser.add_argument(
+        "--workers", type=int, help="Processes computing the cell statistics"
+    )
+    zarrify_parser.set_defaults(handler=zarrify)
+
+    config_parser = subparsers.add_parser(
+        "sap-config", help="Generate the SAP_info and SAP_parameters files"
+    )
+    config_parser.add_argument("folder", help="Animal folder")
+    config_parser.add_argument("animal", help="Animal name")
+    config_parser.add_argument(
+        "--run", nargs="*", default=[], choices=SAP_PROGRAMS, help="Programs to run"
+    )
+    config_parser.add_argument(
+        "--force", action="store_true", help="Rewrite files with unchanged parameters"
+    )
+    config_parser.set_defaults(handler=sap_config)
+
+    diff_parser = subparsers.add_parser(
+        "config-diff", help="List the SAP parameters differing across animal stores"
+    )
+    diff_parser.add_argument("stores", nargs="+", help="Animal stores")
+    diff_parser.set_defaults(handler=config_diff)
+
+    run_parser = subparsers.add_parser(
+        "sap-run", help="Run the SAP scripts of several animals"
+    )
+    run_parser.add_argument("scripts", nargs="+", help="SAP_info_<animal>.m scripts")
+    run_parser.add_argument(
+        "--command",
+        default="matlab",
+        help='"matlab", "octave" or a template, e.g. "python stub.py {script}"',
+    )
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--timeout", type=float, help="Seconds per stage")
+    run_parser.add_argument(
+        "--no-extract", action="store_true", help="Do not extract the AOT results"
+    )
+    run_parser.add_argument("--summary", help="JSON file of the runtimes and logs")
+    run_parser.set_defaults(handler=sap_run)
+
+    attributes_parser = subparsers.add_parser(
+        "export-attributes",
+        help="Write the space registration attributes as SAP text files",
+    )
+    attributes_parser.add_argument("store", help="Animal store")
+    attributes_parser.add_argument("--name", help="Animal name, default store name")
+    attributes_parser.set_defaults(handler=export_attributes)
+
+    export_parser = subparsers.add_parser("export", help="Pack a store into a zip")
+    export_parser.add_argument("store")
+    export_parser.add_argument("archive")
+    export_parser.set_defaults(handler=export_archive)
+
+    import_parser = subparsers.add_parser("import", help="Unpack a zip into a store")
+    import_parser.add_argument("archive")
+    import_parser.add_argument("store")
+    import_parser.set_defaults(handler=import_archive)
+
+    cohort_parser = subparsers.add_parser(
+        "cohort", help="Average a tensor quantity over animal stores"
+    )
+    cohort_parser.add_argument("cohort", help="Cohort zarr store")
+    cohort_parser.add_argument("animals", nargs="+", help="Animal stores")
+    cohort_parser.add_argument("--quantity", default="UPIV")
+    cohort_parser.add_argument("--grid", default="DBA_L")
+    cohort_parser.add_argument("--time-block", type=int, default=8)
+    cohort_parser.add_argument("--workers", type=int, default=None)
+    cohort_parser.set_defaults(handler=cohort)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
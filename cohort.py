@@ -0,0 +1,274 @@
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import zarr
+
+from animal_store import open_animal
+from tensors import check_time_first, grid_origin_index, read_attribute, time_starts
+
+
+def align_animals(animal_paths, quantity, grid="DBA_L"):
+    """
+    Place the grids and time points of several animals on a common cohort grid.
+
+    Boxes are matched by their position relative to the grid origin
+    (`grid_xStart`, `grid_yStart`) and time points by their start time in
+    hours APF (`TimeArray`). The cohort grid is the union of all grids and
+    the cohort time axis the union of all time points.
+
+    Parameters
+    ----------
+    animal_paths : list
+        Paths to the animal stores (folders or zip archives).
+    quantity : str
+        Name of the quantity (e.g. "UPIV").
+    grid : str, optional
+        Path of the grid group inside TENSORS. Default is "DBA_L".
+
+    Returns
+    -------
+    animals : list of dict
+        For every animal, its path, the cohort time index of each of its time
+        points (`times`) and the cohort (row, column) of its first box (`offset`).
+    cohort : dict
+        The cohort "shape", "origin" (row, column), "starts" (hours APF) and
+        "TimeArray".
+
+    Raises
+    ------
+    ValueError
+        If the quantity does not have the same box shape in every animal.
+    """
+    groups = []
+    for path in animal_paths:
+        group = open_animal(path, "r", consolidated=True).TENSORS[grid]
+        array = group[quantity]
+        starts = time_starts(group)
+        check_time_first(array, len(starts), f"{path}/{grid}/{quantity}")
+        groups.append((path, group, array.shape, starts))
+
+    box_shapes = {shape[3:] for _, _, shape, _ in groups}
+    if len(box_shapes) > 1:
+        raise ValueError(f"{quantity} has different box shapes: {box_shapes}")
+
+    origins = [grid_origin_index(group) for _, group, _, _ in groups]
+    origin = tuple(int(max(axis)) for axis in zip(*origins))
+    extent = [
+        max(
+            shape[axis + 1] - origin_[axis]
+            for (_, _, shape, _), origin_ in zip(groups, origins)
+        )
+        for axis in range(2)
+    ]
+
+    # Round the start times so that equal times parsed from different
+    # backups are matched
+    starts = np.unique(np.round(np.concatenate([g[3] for g in groups]), 6))
+    time_array = {}
+    animals = []
+    for (path, group, shape, animal_starts), animal_origin in zip(groups, origins):
+        times = np.searchsorted(starts, np.round(animal_starts, 6))
+        time_pairs = np.reshape(
+            np.asarray(read_attribute(group, "TimeArray"), dtype=object), (-1, 2)
+        )
+        for time, pair in zip(times, time_pairs):
+            time_array.setdefault(int(time), list(pair))
+        animals.append(
+            {
+                "path": str(path),
+                "times": times,
+                "offset": (
+                    origin[0] - animal_origin[0],
+                    origin[1] - animal_origin[1],
+                ),
+            }
+        )
+
+    cohort = {
+        "shape": (len(starts), origin[0] + extent[0], origin[1] + extent[1])
+        + box_shapes.pop(),
+        "origin": origin,
+        "starts": starts,
+        "TimeArray": [time_array[time] for time in range(len(starts))],
+    }
+    return animals, cohort
+
+
+def reduce_block(arguments):
+    """
+    Reduce one block of cohort time points over all animals, in a worker process.
+
+    Each animal slab overlapping the block is read once and merged into
+    running count, mean and sum of squared deviations (Welford), ignoring NaN
+    boxes. The mean, unbiased variance and count of the block are written in
+    the cohort group, blocks being aligned on its chunks.
+
+    Parameters
+    ----------
+    arguments : tuple
+        (cohort group path, grid, quantity, animals, cohort shape, block start, block stop).
+    """
+    cohort_path, grid, quantity, animals, shape, start, stop = arguments
+    block_shape = (stop - start,) + shape[1:]
+    count = np.zeros(block_shape, dtype=np.int32)
+    mean = np.zeros(block_shape, dtype=np.float64)
+    m2 = np.zeros(block_shape, dtype=np.float64)
+
+    for animal in animals:
+        selected = np.flatnonzero((animal["times"] >= start) & (animal["times"] < stop))
+        if not len(selected):
+            continue
+        array = open_animal(animal["path"], "r", consolidated=True).TENSORS[grid][
+            quantity
+        ]
+        values = array.oindex[selected].astype(np.float64)
+        row, column = animal["offset"]
+        target = (
+            animal["times"][selected] - start,
+            slice(row, row + values.shape[1]),
+            slice(column, column + values.shape[2]),
+        )
+
+        valid = np.isfinite(values)
+        animal_count = count[target] + valid
+        animal_mean = mean[target]
+        delta = np.where(valid, values - animal_mean, 0.0)
+        animal_mean += np.where(valid, delta / np.maximum(animal_count, 1), 0.0)
+        m2[target] += np.where(valid, delta * (values - animal_mean), 0.0)
+        count[target] = animal_count
+        mean[target] = animal_mean
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = np.where(count > 1, m2 / (count - 1), np.nan)
+    mean[count == 0] = np.nan
+
+    group = zarr.open_group(cohort_path, mode="r+")
+    group["mean"][start:stop] = mean
+    group["variance"][start:stop] = variance
+    group["count"][start:stop] = count
+
+
+def aggregate_quantity(
+    animal_paths, cohort_path, quantity, grid="DBA_L", time_block=8, n_workers=None
+):
+    """
+    Compute the cohort mean, variance and count of a quantity over many animals.
+
+    Animals are aligned by grid origin and time (see `align_animals`). The
+    cohort time axis is split in blocks of `time_block` time points reduced in
+    parallel, so that only one block of every animal is in memory at a time.
+    The result is written in `<grid>/<quantity>` of the cohort store, with
+    the `mean`, `variance` (unbiased, NaN below two animals) and `count`
+    (number of animals with a finite value) datasets. The group attributes
+    hold the animals, the time points and the grid origin of the cohort.
+
+    Parameters
+    ----------
+    animal_paths : list
+        Paths to the animal stores (folders or zip archives).
+    cohort_path : str or Path
+        Path to the cohort zarr store, created if needed.
+    quantity : str
+        Name of the quantity (e.g. "UPIV").
+    grid : str, optional
+        Path of the grid group inside TENSORS. Default is "DBA_L".
+    time_block : int, optional
+        Number of time points reduced per task. Default is 8.
+    n_workers : int, optional
+        Number of worker processes. Default is the number of CPUs.
+
+    Returns
+    -------
+    zarr.hierarchy.Group
+        The cohort group of the quantity.
+    """
+    animals, cohort = align_animals(animal_paths, quantity, grid)
+    shape = cohort["shape"]
+
+    group = zarr.open_group(str(cohort_path), mode="a").require_group(
+        f"{grid}/{quantity}"
+    )
+    chunks = (time_block,) + shape[1:]
+    group.create_dataset(
+        "mean",
+        shape=shape,
+        chunks=chunks,
+        dtype=np.float32,
+        fill_value=np.nan,
+        overwrite=True,
+    )
+    group.create_dataset(
+        "variance",
+        shape=shape,
+        chunks=chunks,
+        dtype=np.float32,
+        fill_value=np.nan,
+        overwrite=True,
+    )
+    group.create_dataset(
+        "count",
+        shape=shape,
+        chunks=chunks,
+        dtype=np.int32,
+        fill_value=0,
+        overwrite=True,
+    )
+    group.attrs.update(
+        {
+            "animals": [animal["path"] for animal in animals],
+            "quantity": quantity,
+            "grid": grid,
+            "starts_hAPF": cohort["starts"].tolist(),
+            "TimeArray": cohort["TimeArray"],
+            "grid_yStart": cohort["origin"][0],
+            "grid_xStart": cohort["origin"][1],
+        }
+    )
+
+    group_path = os.path.join(str(cohort_path), group.path)
+    arguments = [
+        (
+            group_path,
+            grid,
+            quantity,
+            animals,
+            shape,
+            start,
+            min(start + time_block, shape[0]),
+        )
+        for start in range(0, shape[0], time_block)
+    ]
+    n_workers = n_workers or os.cpu_count()
+    print(f"Aggregating {quantity} of {len(animals)} animals")
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(reduce_block, arguments))
+    return group
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Average a tensor quantity over a cohort of animal stores."
+    )
+    parser.add_argument("cohort", help="Path to the cohort zarr store")
+    parser.add_argument("animals", nargs="+", help="Paths to the animal stores")
+    parser.add_argument("--quantity", default="UPIV")
+    parser.add_argument("--grid", default="DBA_L")
+    parser.add_argument("--time-block", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    group = aggregate_quantity(
+        args.animals,
+        args.cohort,
+        args.quantity,
+        grid=args.grid,
+        time_block=args.time_block,
+        n_workers=args.workers,
+    )
+    print(group.tree())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,218 @@
 import os
-import pandas as pd
+from collections.abc import Mapping
+from functools import lru_cache
 from pathlib import Path
 from sap_map_templates import create_sap_parameters, generate_animal_config
+from frame_index import directory_index
+from acquisition import load_acquisition
+from sap_config import (
+    config_digest,
+    load_config,
+    parse_m_file,
+    parse_m_text,
+    read_sap_config,
+    store_config,
+)
+
+RESCALING_INDEX = "Name"
+RESCALING_COLUMNS = ["yML(pix)", "xFactor", "yFactor", "Ox(pix)", "Oy(pix)"]
+
+
+def parse_rescaling_column(values):
+    """
+    Convert a column of the rescaling table to int or float when possible.
 
-import os
-from pathlib import Path
-import pandas as pd
+    Like pandas, a column is typed as a whole: it is int if all its values
+    are integers, float if they are all numbers, and str otherwise.
+    """
+    for cast in (int, float):
+        try:
+            return list(map(cast, values))
+        except ValueError:
+            pass
+    return list(values)
+
+
+def parse_rescaling_file(rescaling_file_path):
+    """
+    Parse a `rescalingOutput.txt` table.
+
+    The table is whitespace separated, with a header line holding the column
+    names. Rows are indexed by the `Name` column (the animal names).
+
+    Parameters
+    ----------
+    rescaling_file_path : str or Path
+        The path to the rescaling file.
+
+    Returns
+    -------
+    RescalingTable
+        Mapping {name: {column: value}}, numeric columns being int or float.
+
+    Raises
+    ------
+    ValueError
+        If the `Name` column or one of `RESCALING_COLUMNS` is missing, if a
+        row does not have as many fields as the header, or if an animal is
+        listed twice.
+    """
+    with open(rescaling_file_path) as file:
+        header = file.readline().split()
+        missing = [
+            column
+            for column in [RESCALING_INDEX] + RESCALING_COLUMNS
+            if column not in header
+        ]
+        if missing:
+            raise ValueError(f"Missing columns {missing} in {rescaling_file_path}")
+        lines = [line.split() for line in file]
+
+    rows = [fields for fields in lines if fields]
+    for line_number, fields in enumerate(lines, start=2):
+        if fields and len(fields) != len(header):
+            raise ValueError(
+                f"Line {line_number} of {rescaling_file_path} has {len(fields)} "
+                f"fields, expected {len(header)}"
+            )
+
+    columns = dict(zip(header, zip(*rows))) if rows else {}
+    names = columns.pop(RESCALING_INDEX, ())
+    if len(set(names)) != len(names):
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        raise ValueError(f"{duplicates} listed twice in {rescaling_file_path}")
+
+    return RescalingTable(
+        names,
+        {column: parse_rescaling_column(values) for column, values in columns.items()},
+        [column for column in header if column != RESCALING_INDEX],
+    )
+
+
+class RescalingTable(Mapping):
+    """
+    Read-only mapping of the rows of a rescaling table, indexed by animal name.
+
+    The table is kept as typed columns, the {column: value} dictionary of an
+    animal is only built when it is looked up.
+
+    Parameters
+    ----------
+    names : sequence of str
+        The animal names, one per row.
+    columns : dict
+        The typed values of every other column, {column: list}.
+    column_names : list of str
+        The column names, in the order of the file.
+    """
+
+    def __init__(self, names, columns, column_names):
+        self.index = {name: row for row, name in enumerate(names)}
+        self.columns = columns
+        self.column_names = column_names
+
+    def __getitem__(self, name):
+        row = self.index[name]
+        return {column: self.columns[column][row] for column in self.column_names}
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+@lru_cache(maxsize=32)
+def cached_rescaling_table(rescaling_file_path, mtime_ns):
+    # The modification time is part of the key, so an edited file is re-read
+    return parse_rescaling_file(rescaling_file_path)
+
+
+def read_rescaling_table(rescaling_file_path):
+    """
+    Read a rescaling table, parsing each file once per modification.
+
+    The table is shared by all the animals of a batch: the parsed rows are
+    cached by path and modification time, so generating the configuration
+    of every animal listed in the same file only parses it once.
+
+    Parameters
+    ----------
+    rescaling_file_path : str or Path
+        The path to the rescaling file.
+
+    Returns
+    -------
+    RescalingTable
+        Mapping {name: {column: value}}, see `parse_rescaling_file`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the file does not exist.
+    """
+    rescaling_file_path = os.path.abspath(rescaling_file_path)
+    mtime_ns = os.stat(rescaling_file_path).st_mtime_ns
+    return cached_rescaling_table(rescaling_file_path, mtime_ns)
+
+
+def write_config_file(output_file_path, content, force=False):
+    """
+    Write a generated `.m` file unless its effective parameters are unchanged.
+
+    The existing file and the new content are both parsed, see
+    `sap_config.parse_m_text`: a file differing only by comments or spacing
+    is left untouched, keeping its modification time.
+
+    Parameters
+    ----------
+    output_file_path : str or Path
+        The file to write.
+    content : str
+        The generated script.
+    force : bool, optional
+        Write the file even if its parameters are unchanged. Default is False.
+
+    Returns
+    -------
+    bool
+        True if the file was written.
+    """
+    if (
+        not force
+        and os.path.exists(output_file_path)
+        and parse_m_file(output_file_path) == parse_m_text(content)
+    ):
+        print(f"Unchanged file: {output_file_path}")
+        return False
+    with open(output_file_path, "w") as file:
+        file.write(content)
+    print(f"Generated file: {output_file_path}")
+    return True
+
+
+def record_sap_config(animal_folder, sap_info_folder, animal_name):
+    """
+    Record the parsed SAP configuration of an animal in the METADATA of its store.
+
+    Nothing is done if the animal folder is not zarrified yet, or if the
+    stored record already has the same digest, in which case zarr is not
+    even imported.
+
+    Returns
+    -------
+    dict or None
+        The record, None without a store.
+    """
+    if not os.path.isdir(os.path.join(animal_folder, "METADATA")):
+        return None
+    config = read_sap_config(sap_info_folder, animal_name)
+    record = load_config(animal_folder)
+    if record.get("digest") == config_digest(config):
+        return record
+    return store_config(
+        animal_folder, config, sap_info_folder=os.path.abspath(sap_info_folder)
+    )
 
 
 class SAPConfigGenerator:
@@ -37,7 +244,7 @@ class SAPConfigGenerator:
 
     def read_rescaling_file(self, rescaling_file_path):
         """
-        Read a rescaling file and return its contents as a dictionary.
+        Read a rescaling file and return its rows as a dictionary.
 
         Parameters
         ----------
@@ -47,13 +254,12 @@ class SAPConfigGenerator:
         Returns
         -------
         dict
-            The rescaling data in dictionary form.
+            The rescaling data of every animal, {name: {column: value}}, see
+            `read_rescaling_table`.
         """
-        df = pd.read_table(rescaling_file_path, sep=" ")
-        df.set_index("Name", inplace=True)
-        return df.to_dict()
+        return read_rescaling_table(rescaling_file_path)
 
-    def count_tif_files(self, folder_path):
+    def count_tif_files(self, folder_path, prefix=""):
         """
         Count the number of TIFF files in a folder.
 
@@ -61,34 +267,52 @@ class SAPConfigGenerator:
         ----------
         folder_path : str or Path
             The path to the folder to search for TIFF files.
+        prefix : str, optional
+            Count only the files starting with this prefix. Default is "".
 
         Returns
         -------
         int
             The number of TIFF files in the folder.
         """
+        index = directory_index(folder_path)
+        if not prefix:
+            return index.count(".tif")
         return sum(
-            1 for file in os.listdir(folder_path) if file.lower().endswith(".tif")
+            1
+            for name in index.files
+            if name.startswith(prefix) and name.lower().endswith(".tif")
         )
 
-    def generate_sap_config(self, rescaling_data, time_ref_dict):
+    def generate_sap_config(self, rescaling_data, time_ref_dict, force=False):
         """
         Generate a SAP configuration file.
 
         Parameters
         ----------
         rescaling_data : dict
-            The rescaling data for the animal.
+            The rescaling data of the animals, {name: {column: value}}, as
+            returned by `read_rescaling_file`.
         time_ref_dict : dict
             The time reference data for the animal.
+        force : bool, optional
+            Rewrite the file even if its parameters are unchanged, see
+            `write_config_file`. Default is False.
+
+        Returns
+        -------
+        bool
+            True if the file was written.
 
         Notes
         -----
         The function creates a SAP configuration file and saves it in the output folder.
         """
-        # Count the number of TIFF files for the current animal
+        # Count the frames read by SAP, named `{animal}_{NNNN}.tif`, which
+        # leaves out a multi-page movie the frames were exported from
         end_frame = self.count_tif_files(
-            os.path.join(self.input_folder.parent, self.animal_name)
+            os.path.join(self.input_folder.parent, self.animal_name),
+            prefix=f"{self.animal_name}_",
         )
 
         # Determine the output file path
@@ -108,6 +332,11 @@ class SAPConfigGenerator:
         t_ref = time_ref_dict.get(self.animal_name, 71)
         start_frame = 1
 
+        # Pixel size and time step read from the movie by the zarrification
+        acquisition = load_acquisition(
+            os.path.join(self.input_folder.parent, self.animal_name)
+        )
+
         # Generate the content for the configuration file
         content = generate_animal_config(
             self.animal_name,
@@ -121,14 +350,14 @@ class SAPConfigGenerator:
             oy,
             t_ref,
             input_folder=self.input_folder.parent,
+            scale1D=acquisition.get("scale1D", 0.161),
+            dt=acquisition.get("dt", 5),
         )
 
-        # Write the configuration file
-        with open(output_file_path, "w") as file:
-            file.write(content)
-        print(f"Generated file: {output_file_path}")
+        # Write the configuration file if its parameters changed
+        return write_config_file(output_file_path, content, force=force)
 
-    def generate_sap_files(self, rescaling_data, time_ref_dict):
+    def generate_sap_files(self, rescaling_data, time_ref_dict, force=False):
         """
         Generate SAP configuration files for all relevant files in the input folder.
 
@@ -138,6 +367,8 @@ class SAPConfigGenerator:
             The rescaling data for the animals.
         time_ref_dict : dict
             The time reference data for the animals.
+        force : bool, optional
+            Rewrite the files even if their parameters are unchanged.
         """
         # movie_path = Path("full_movies")
         # for file_name in os.listdir(self.input_folder / movie_path):
@@ -145,11 +376,15 @@ class SAPConfigGenerator:
         #         (".png", ".tif")
         #     ):
         #         continue
-        self.generate_sap_config(rescaling_data, time_ref_dict)
+        self.generate_sap_config(rescaling_data, time_ref_dict, force=force)
 
 
 def generate_sap_files(
-    input_folder_path, animal_name, algorithm_to_run={}, experience_parameters={}
+    input_folder_path,
+    animal_name,
+    algorithm_to_run={},
+    experience_parameters={},
+    force=False,
 ):
     """
     Main function to generate SAP configuration and parameter files.
@@ -164,11 +399,22 @@ def generate_sap_files(
         Dictionary specifying which algorithms to run. Expected keys are 'sr', 'piv', 'vm', 'ffbp', 'ct', 'aot'.
     experience_parameters : dict, optional
         Additional parameters for the experience. Default is an empty dictionary.
+    force : bool, optional
+        Rewrite the files even if their effective parameters are unchanged.
+        Default is False.
+
+    Returns
+    -------
+    dict or None
+        The configuration record stored in the METADATA of the animal store,
+        None if the animal folder is not zarrified.
 
     Notes
     -----
     This function initializes a `SAPConfigGenerator` object, reads rescaling data,
     generates SAP configuration files, and finally generates a SAP parameters file.
+    Files whose effective parameters did not change are left untouched, and the
+    parsed configuration is recorded in the animal store, see `sap_config`.
     """
 
     # Create output folder path
@@ -201,7 +447,7 @@ def generate_sap_files(
     time_ref_dict = {}
 
     # Generate SAP configuration files
-    config_generator.generate_sap_files(rescaling_data, time_ref_dict)
+    config_generator.generate_sap_files(rescaling_data, time_ref_dict, force=force)
 
     # Create SAP parameters based on the algorithms to run
     content = create_sap_parameters(
@@ -215,9 +461,10 @@ def generate_sap_files(
 
     # Write the SAP parameters to a file
     output_file_path = output_folder_path / "SAP_parameters.m"
-    with open(output_file_path, "w") as file:
-        file.write(content)
-    print(f"Generated file: {output_file_path}")
+    write_config_file(output_file_path, content, force=force)
+
+    # Record the effective parameters next to the data
+    return record_sap_config(input_folder_path, output_folder_path, animal_name)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,721 @@
+import os
+import re
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import translate
+from functools import lru_cache
+
+FRAME_NUMBER_PATTERN = re.compile(r"(\d+)\.[^.]+$")
+
+# A directory modified less than this many seconds ago may still change within
+# the resolution of its mtime (seconds on some NFS servers), so its listing
+# is not cached
+RACY_INTERVAL = 2.0
+
+# What to do with missing frames, or with frames whose shape or dtype differ
+# from the rest of the movie, see `sequence_frames`
+FRAME_POLICIES = ["skip", "pad", "fail"]
+
+# dtype, number of bands and bits per sample of the PIL image modes. Palette
+# images are expanded to RGB or RGBA by the decoder: their number of bands
+# (None) is only known once one of them is decoded
+PIL_MODES = {
+    "1": ("bool", 1, 1),
+    "L": ("uint8", 1, 8),
+    "P": ("uint8", None, 8),
+    "PA": ("uint8", None, 8),
+    "I;16": ("uint16", 1, 16),
+    "I;16B": ("uint16", 1, 16),
+    "I;16L": ("uint16", 1, 16),
+    "I": ("int32", 1, 32),
+    "F": ("float32", 1, 32),
+    "LA": ("uint8", 2, 8),
+    "RGB": ("uint8", 3, 8),
+    "RGBA": ("uint8", 4, 8),
+}
+
+
+@lru_cache(maxsize=64)
+def compile_pattern(pattern):
+    return re.compile(translate(pattern)).match
+
+
+def parse_frame_number(name):
+    """
+    Parse the frame number of a file name like `{animal}_{NNNN}.tif`.
+
+    Parameters
+    ----------
+    name : str
+        The file name.
+
+    Returns
+    -------
+    int or None
+        The number ending the stem of the name, or None if there is none.
+    """
+    match = FRAME_NUMBER_PATTERN.search(name)
+    return int(match.group(1)) if match else None
+
+
+class FrameFiles:
+    """
+    The files of a directory matching a pattern, with their frame numbers.
+
+    Parameters
+    ----------
+    paths : list of str
+        The matching paths, sorted by frame number.
+    numbers : list of int or None
+        The frame number of every path, see `parse_frame_number`.
+    """
+
+    def __init__(self, paths, numbers):
+        self.paths = paths
+        self.numbers = numbers
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def gaps(self):
+        """
+        Frame numbers missing between the first and the last frame.
+        """
+        numbers = sorted({number for number in self.numbers if number is not None})
+        if not numbers:
+            return []
+        return sorted(set(range(numbers[0], numbers[-1] + 1)) - set(numbers))
+
+
+class DirectoryIndex:
+    """
+    Listing of a directory, built with a single `os.scandir`.
+
+    Parameters
+    ----------
+    path : str
+        The directory.
+    files : list of str
+        The names of the files, sorted.
+    directories : list of str
+        The names of the sub-directories, sorted.
+    """
+
+    def __init__(self, path, files, directories):
+        self.path = path
+        self.files = files
+        self.directories = directories
+        # The listing does not change, so the matches are computed once
+        self.matches = {}
+
+    def match_names(self, pattern, directories=False):
+        key = (pattern, directories)
+        if key not in self.matches:
+            names = self.directories if directories else self.files
+            names = filter(compile_pattern(pattern), names)
+            if not pattern.startswith("."):
+                names = (name for name in names if not name.startswith("."))
+            self.matches[key] = list(names)
+        return self.matches[key]
+
+    def match(self, pattern, directories=False):
+        """
+        Paths of the entries matching a glob pattern, sorted by name.
+
+        Like `glob`, names starting with a dot only match patterns starting
+        with a dot.
+
+        Parameters
+        ----------
+        pattern : str
+            The pattern, e.g. "*.tif" or "roi*.png".
+        directories : bool, optional
+            Whether to match the sub-directories instead of the files.
+            Default is False.
+
+        Returns
+        -------
+        list of str
+            The matching paths.
+        """
+        prefix = os.path.join(self.path, "")
+        return [prefix + name for name in self.match_names(pattern, directories)]
+
+    def frames(self, pattern):
+        """
+        The files matching a pattern, sorted by frame number.
+
+        Files without a frame number come last, sorted by name.
+
+        Parameters
+        ----------
+        pattern : str
+            The pattern, e.g. "*.tif".
+
+        Returns
+        -------
+        FrameFiles
+            The matching files.
+        """
+        prefix = os.path.join(self.path, "")
+        # Numeric order, so that frame 10000 comes after frame 9999 whatever
+        # the zero padding of the names
+        frames = sorted(
+            ((parse_frame_number(name), name) for name in self.match_names(pattern)),
+            key=lambda frame: (frame[0] is None, frame[0] or 0, frame[1]),
+        )
+        return FrameFiles(
+            [prefix + name for _, name in frames], [number for number, _ in frames]
+        )
+
+    def count(self, extension):
+        """
+        Number of files with an extension, e.g. ".tif", ignoring case.
+        """
+        extension = extension.lower()
+        return sum(1 for name in self.files if name.lower().endswith(extension))
+
+
+def scan(path):
+    files, directories = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            (directories if entry.is_dir() else files).append(entry.name)
+    return DirectoryIndex(path, sorted(files), sorted(directories))
+
+
+@lru_cache(maxsize=256)
+def cached_scan(path, mtime_ns):
+    # The modification time is part of the key: adding, removing or renaming
+    # a file changes the mtime of the directory and invalidates the entry
+    return scan(path)
+
+
+def directory_index(path):
+    """
+    Index of a directory, enumerated once as long as it does not change.
+
+    The listing is cached by path and directory modification time, so that
+    the frame count of the SAP configuration, `load_stack` and the raw ingest
+    of a run share a single enumeration of the folder.
+
+    Parameters
+    ----------
+    path : str or Path
+        The directory.
+
+    Returns
+    -------
+    DirectoryIndex
+        The listing of the directory.
+    """
+    path = os.path.abspath(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    if time.time() - mtime_ns / 1e9 < RACY_INTERVAL:
+        return scan(path)
+    return cached_scan(path, mtime_ns)
+
+
+def match_frames(folder_path, pattern):
+    """
+    The files of a folder matching a glob pattern, with their frame numbers.
+
+    Parameters
+    ----------
+    folder_path : str or Path
+        The folder. A missing folder matches nothing, like `glob`.
+    pattern : str
+        The pattern, e.g. "*.tif".
+
+    Returns
+    -------
+    FrameFiles
+        The matching files, sorted by name.
+    """
+    if not os.path.isdir(folder_path):
+        return FrameFiles([], [])
+    return directory_index(folder_path).frames(pattern)
+
+
+def match_prefix(prefix):
+    """
+    Sorted paths of the files and directories starting with a path prefix,
+    like `glob.glob(f"{prefix}*")`.
+
+    Parameters
+    ----------
+    prefix : str
+        The path prefix, e.g. "/data/wRNAi_".
+
+    Returns
+    -------
+    list of str
+        The matching paths.
+    """
+    folder, start = os.path.split(prefix)
+    folder = folder or os.curdir
+    if not os.path.isdir(folder):
+        return []
+    index = directory_index(folder)
+    pattern = f"{start}*"
+    paths = index.match(pattern) + index.match(pattern, directories=True)
+    # Keep the prefix as written (e.g. relative) like glob does
+    return sorted(
+        os.path.join(os.path.dirname(prefix), os.path.basename(path)) for path in paths
+    )
+
+
+def read_header(path):
+    """
+    Shape, dtype and bit depth of an image, read from its header only.
+
+    Parameters
+    ----------
+    path : str
+        A tif file (read with tifffile) or any image PIL can open.
+
+    Returns
+    -------
+    tuple
+        The shape of the decoded image, ending with None for a palette image
+        whose number of bands depends on the decoder, see `resolve_bands`.
+    str or None
+        The name of its dtype, or None for an image mode without a known dtype.
+    int or None
+        The number of bits per sample, e.g. 16 for a uint16 tif.
+    int
+        The number of pages of a tif, the shape being the one of the first
+        page, and 1 for other images.
+    """
+    if path.lower().endswith((".tif", ".tiff")):
+        import tifffile
+
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages[0]
+            return (
+                tuple(page.shape),
+                str(page.dtype),
+                page.bitspersample,
+                len(tif.pages),
+            )
+
+    from PIL import Image
+
+    with Image.open(path) as image:
+        dtype, bands, bits = PIL_MODES.get(image.mode, (None, 1, None))
+        shape = (image.height, image.width) + ((bands,) if bands != 1 else ())
+        return shape, dtype, bits, 1
+
+
+def resolve_bands(paths, headers):
+    """
+    Complete the shape of palette images by decoding one image per shape.
+
+    Parameters
+    ----------
+    paths : list of str
+        The images.
+    headers : list of tuple
+        Their (shape, dtype, bits, pages), see `read_header`.
+
+    Returns
+    -------
+    list of tuple
+        The headers, with the decoded shape for palette images.
+    """
+    decoded = {}
+    resolved = []
+    for path, (shape, dtype, bits, pages) in zip(paths, headers):
+        if shape[-1] is None:
+            if shape not in decoded:
+                from skimage.io import imread
+
+                decoded[shape] = imread(path).shape
+            shape = decoded[shape]
+        resolved.append((shape, dtype, bits, pages))
+    return resolved
+
+
+def read_headers(paths, n_workers=None):
+    """
+    Read the headers of many images in parallel, see `read_header`.
+
+    Reading a header is dominated by the latency of opening the file (on a
+    network share in particular) rather than by the CPU, so the headers are
+    read from a pool of threads.
+
+    Parameters
+    ----------
+    paths : list of str
+        The images.
+    n_workers : int, optional
+        Number of threads. Default is the `ThreadPoolExecutor` default.
+
+    Returns
+    -------
+    list of tuple
+        The (shape, dtype, bits, pages) of every image, in the order of `paths`.
+    """
+    if len(paths) < 2 or n_workers == 1:
+        return [read_header(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        return list(pool.map(read_header, paths))
+
+
+def memmap_tif(path):
+    """
+    Memory-map the pixels of an uncompressed tif.
+
+    Parameters
+    ----------
+    path : str
+        The tif file.
+
+    Returns
+    -------
+    np.memmap or None
+        A read-only view of the pixels on disk, or None if the file is
+        compressed or its strips are not contiguous.
+    """
+    import tifffile
+
+    try:
+        return tifffile.memmap(path, mode="r")
+    except ValueError:
+        return None
+
+
+def fit_frame(frame, shape, dtype):
+    """
+    Zero-pad or crop a frame to a shape, keeping its top left corner.
+    """
+    import numpy as np
+
+    if frame.ndim != len(shape):
+        raise ValueError(f"Cannot fit a frame of shape {frame.shape} into {shape}")
+    fitted = np.zeros(shape, dtype=dtype)
+    overlap = tuple(slice(0, min(a, b)) for a, b in zip(frame.shape, shape))
+    fitted[overlap] = frame[overlap]
+    return fitted
+
+
+class FrameSequence:
+    """
+    The frames of a movie in numeric order, validated from the file headers.
+
+    Parameters
+    ----------
+    paths : list of str or None
+        The file of every frame, None for the blank frames padding a gap.
+    numbers : list of int or None
+        The frame number of every frame.
+    shape : tuple or None
+        The shape of the frames, None if there is no frame.
+    dtype : str or None
+        The dtype of the frames.
+    bits : int or None, optional
+        The largest number of bits per sample of the frames. Default is None.
+    resized : set of int, optional
+        Indices of the frames whose shape or dtype differ, fitted to `shape`
+        and `dtype` when read. Default is no frame.
+    """
+
+    def __init__(self, paths, numbers, shape, dtype, bits=None, resized=None):
+        self.paths = paths
+        self.numbers = numbers
+        self.shape = shape
+        self.dtype = dtype
+        self.bits = bits
+        self.resized = resized or set()
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def files(self):
+        """
+        The paths of the frames read from a file, i.e. without the blank frames.
+        """
+        return [path for path in self.paths if path is not None]
+
+    def read(self, index, memmap=False):
+        """
+        Decode a frame.
+
+        Parameters
+        ----------
+        index : int
+            The position of the frame in the sequence.
+        memmap : bool, optional
+            Whether to memory-map uncompressed tifs instead of decoding them.
+            The frame is then a read-only view of the file, valid as long as
+            the file is not rewritten. Default is False.
+
+        Returns
+        -------
+        np.ndarray
+            The frame, blank for a padded gap.
+        """
+        import numpy as np
+
+        path = self.paths[index]
+        if path is None:
+            return np.zeros(self.shape, dtype=self.dtype)
+
+        frame = None
+        if memmap and path.lower().endswith((".tif", ".tiff")):
+            frame = memmap_tif(path)
+        if frame is None:
+            from skimage.io import imread
+
+            frame = np.asarray(imread(path))
+        if index in self.resized:
+            return fit_frame(frame, self.shape, self.dtype or frame.dtype)
+        if frame.shape != self.shape:
+            raise ValueError(
+                f"{path} decodes to shape {frame.shape}, its header says {self.shape}"
+            )
+        return frame
+
+    def nbytes(self, index):
+        """
+        Number of bytes read from disk for a frame, 0 for a blank frame.
+        """
+        path = self.paths[index]
+        return 0 if path is None else os.path.getsize(path)
+
+    def close(self):
+        pass
+
+
+class PageSequence:
+    """
+    The pages of a multi-page tif (e.g. an OME-TIFF), read as a movie.
+
+    The file is opened once and every page is read on demand, so that the
+    movie is never split into files nor loaded as a whole. Uncompressed
+    movies are memory-mapped once and every page is a view of the map.
+    The interface is the one of `FrameSequence`.
+
+    Parameters
+    ----------
+    path : str
+        The tif file. Its first series must hold a single movie: one axis
+        (time, or the pages) besides the image axes.
+    """
+
+    def __init__(self, path):
+        import tifffile
+
+        self.path = path
+        self.tif = tifffile.TiffFile(path)
+        series = self.tif.series[0]
+        self.pages = series.pages
+        page = series.keyframe
+        self.shape = tuple(page.shape)
+        self.dtype = str(series.dtype)
+        self.bits = page.bitspersample
+        frame_size = 1
+        for size in self.shape:
+            frame_size *= size
+        if len(self.pages) * frame_size != series.size:
+            self.tif.close()
+            raise ValueError(
+                f"{path} holds a {series.axes} series of shape {series.shape}, "
+                "not a single movie"
+            )
+        self.paths = [path] * len(self.pages)
+        self.numbers = list(range(1, len(self.pages) + 1))
+        self.resized = set()
+        self.mapped = None
+
+    def __len__(self):
+        return len(self.pages)
+
+    @property
+    def files(self):
+        return [self.path]
+
+    def read(self, index, memmap=False):
+        """
+        Read a page, see `FrameSequence.read`.
+        """
+        if memmap and self.mapped is None:
+            self.mapped = memmap_tif(self.path)
+            if self.mapped is None:
+                # Compressed: pages are decoded, do not try again
+                memmap = False
+        if memmap and self.mapped is not None:
+            return self.mapped.reshape((len(self),) + self.shape)[index]
+        return self.pages[index].asarray()
+
+    def nbytes(self, index):
+        return sum(self.pages[index].databytecounts)
+
+    def close(self):
+        self.mapped = None
+        self.tif.close()
+
+
+def is_multipage(path):
+    """
+    Whether a tif file holds more than one page.
+    """
+    import tifffile
+
+    with tifffile.TiffFile(path) as tif:
+        return len(tif.pages) > 1
+
+
+def raw_sequence(raw_image_path, on_gap="skip", on_mismatch="fail"):
+    """
+    The frames of a raw movie: a folder of single-frame tifs or a movie file.
+
+    A movie file is a multi-page tif or OME-TIFF, given directly or as the
+    only tif of the folder (or the only `.ome.tif` of the folder, next to
+    frames exported from it).
+
+    Parameters
+    ----------
+    raw_image_path : str
+        The folder or the movie file.
+    on_gap, on_mismatch : str, optional
+        Policies of a folder of frames, see `sequence_frames`.
+
+    Returns
+    -------
+    FrameSequence or PageSequence
+        The frames, to be closed after use.
+    """
+    if os.path.isfile(raw_image_path):
+        return PageSequence(str(raw_image_path))
+    if os.path.isdir(raw_image_path):
+        index = directory_index(raw_image_path)
+        movies = index.match("*.ome.tif") + index.match("*.ome.tiff")
+        if len(movies) == 1:
+            return PageSequence(movies[0])
+        files = index.match("*.tif")
+        if len(files) == 1 and is_multipage(files[0]):
+            return PageSequence(files[0])
+    return sequence_frames(
+        raw_image_path, "*.tif", on_gap=on_gap, on_mismatch=on_mismatch
+    )
+
+
+def sequence_frames(
+    folder_path,
+    pattern,
+    expected_size=None,
+    on_gap="skip",
+    on_mismatch="fail",
+    n_workers=None,
+):
+    """
+    Order the frames of a folder numerically and check them before decoding.
+
+    Only the file headers are read, so that a movie with a missing or
+    mis-sized frame fails before any pixel is decoded. Multi-page tifs, e.g.
+    a movie next to the frames exported from it, are not frames and are left
+    out with a warning.
+
+    Parameters
+    ----------
+    folder_path : str
+        The folder of the frames.
+    pattern : str
+        The pattern matching the frames, e.g. "*.tif".
+    expected_size : tuple, optional
+        The shape of the frames. Default is None, the most common shape.
+    on_gap : str, optional
+        Missing frame numbers are dropped from the sequence ("skip", with a
+        warning), replaced by blank frames ("pad") or raise a ValueError
+        ("fail"). Default is "skip".
+    on_mismatch : str, optional
+        Frames whose shape or dtype differ are dropped ("skip", with a
+        warning), zero-padded or cropped to the shape and cast to the dtype
+        ("pad") or raise a ValueError ("fail"). Default is "fail".
+    n_workers : int, optional
+        Number of threads reading the headers, see `read_headers`.
+
+    Returns
+    -------
+    FrameSequence
+        The frames to decode.
+    """
+    for policy in [on_gap, on_mismatch]:
+        if policy not in FRAME_POLICIES:
+            raise ValueError(f"Unknown frame policy {policy}, use {FRAME_POLICIES}")
+
+    frame_files = match_frames(folder_path, pattern)
+    headers = read_headers(frame_files.paths, n_workers=n_workers)
+    movies = [
+        path for path, (_, _, _, pages) in zip(frame_files.paths, headers) if pages > 1
+    ]
+    if movies:
+        warnings.warn(
+            f"Multi-page files {[os.path.basename(path) for path in movies]} of "
+            f"{folder_path} are not frames (skipped)"
+        )
+        frames = [i for i, (_, _, _, pages) in enumerate(headers) if pages == 1]
+        frame_files = FrameFiles(
+            [frame_files.paths[i] for i in frames],
+            [frame_files.numbers[i] for i in frames],
+        )
+        headers = [headers[i] for i in frames]
+    if not frame_files.paths:
+        return FrameSequence([], [], None, None)
+
+    gaps = frame_files.gaps
+    if gaps and on_gap == "fail":
+        raise ValueError(f"Missing frames {gaps} in {folder_path}")
+
+    headers = resolve_bands(frame_files.paths, headers)
+    shapes = Counter(shape for shape, _, _, _ in headers)
+    shape = tuple(expected_size) if expected_size else shapes.most_common(1)[0][0]
+    dtypes = Counter(
+        dtype for size, dtype, _, _ in headers if size == shape
+    ) or Counter(dtype for _, dtype, _, _ in headers)
+    dtype = dtypes.most_common(1)[0][0]
+    bits = max((bits or 0 for _, _, bits, _ in headers), default=0) or None
+
+    mismatched = [
+        (path, header)
+        for path, header in zip(frame_files.paths, headers)
+        if header[0] != shape or header[1] != dtype
+    ]
+    if mismatched:
+        message = (
+            f"{len(mismatched)} frames of {folder_path} differ from shape {shape}"
+            f" and dtype {dtype}: "
+            + ", ".join(
+                f"{os.path.basename(path)} {size} {frame_dtype}"
+                for path, (size, frame_dtype, _, _) in mismatched[:5]
+            )
+        )
+        if on_mismatch == "fail":
+            raise ValueError(message)
+        warnings.warn(f"{message} ({'skipped' if on_mismatch == 'skip' else 'fitted'})")
+    mismatched = {path for path, _ in mismatched}
+
+    paths, numbers, resized = [], [], set()
+    for path, number in zip(frame_files.paths, frame_files.numbers):
+        if path in mismatched and on_mismatch == "skip":
+            continue
+        if on_gap == "pad" and number is not None and numbers:
+            previous = numbers[-1]
+            for missing in range(
+                previous + 1 if previous is not None else number, number
+            ):
+                paths.append(None)
+                numbers.append(missing)
+        if path in mismatched:
+            resized.add(len(paths))
+        paths.append(path)
+        numbers.append(number)
+    if gaps:
+        action = "padded with blank frames" if on_gap == "pad" else "skipped"
+        warnings.warn(f"Missing frames {gaps} in {folder_path} ({action})")
+    return FrameSequence(paths, numbers, shape, dtype, bits=bits, resized=resized)
@@ -0,0 +1,222 @@
+import time
+import cProfile
+import platform
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import zarr
+
+from progress import NULL_PROGRESS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RUN_REPORTS_KEY = "run_reports"
+# The reports are consolidated with the attributes: only the last ones are kept
+MAX_RUN_REPORTS = 10
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the process so far, in MB, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1e6 if platform.system() == "Darwin" else peak / 1e3
+
+
+class RunReport:
+    """
+    Timers and counters of every stage of a zarrification run.
+
+    The report is passed down the pipeline in place of the progress reporter
+    and forwards every update to it, so that progress streaming keeps
+    working. On top of the frames and decoded bytes of `advance`, it keeps
+    for every stage its wall and CPU time, the bytes read and written
+    (`record`), how much it raised the peak memory of the process, and the
+    time spent in named sub-stages (`timer`, e.g. "decode", "write", "tif").
+
+    Parameters
+    ----------
+    progress : ProgressReporter, optional
+        The reporter to forward the progress updates to.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress or NULL_PROGRESS
+        self.stages = {}
+        self.created = datetime.now(timezone.utc).isoformat()
+        self.started = time.perf_counter()
+        self.error = None
+
+    def stage(self, stage):
+        if stage not in self.stages:
+            now = time.perf_counter()
+            self.stages[stage] = {
+                "total": None,
+                "frames": 0,
+                "bytes_decoded": 0,
+                "bytes_read": 0,
+                "bytes_written": 0,
+                "started": now,
+                "ended": now,
+                "cpu_started": time.process_time(),
+                "cpu_ended": time.process_time(),
+                "peak_rss_started": peak_rss_mb(),
+                "peak_rss_ended": peak_rss_mb(),
+                "substages": {},
+            }
+        return self.stages[stage]
+
+    def update(self, stage):
+        # Extend the stage up to now
+        stage["ended"] = time.perf_counter()
+        stage["cpu_ended"] = time.process_time()
+        stage["peak_rss_ended"] = peak_rss_mb()
+
+    def start(self, stage, total=None):
+        self.stage(stage)["total"] = total
+        self.progress.start(stage, total)
+
+    def advance(self, stage, n=1, nbytes=0):
+        counters = self.stage(stage)
+        counters["frames"] += n
+        counters["bytes_decoded"] += nbytes
+        self.progress.advance(stage, n, nbytes)
+
+    def finish(self, stage):
+        self.update(self.stage(stage))
+        self.progress.finish(stage)
+
+    def close(self, error=None):
+        self.error = None if error is None else str(error)
+        self.progress.close(error)
+
+    def record(self, stage, bytes_read=0, bytes_written=0):
+        """
+        Count bytes read from or written to disk by a stage.
+        """
+        counters = self.stage(stage)
+        counters["bytes_read"] += bytes_read
+        counters["bytes_written"] += bytes_written
+
+    @contextmanager
+    def timer(self, stage, name):
+        """
+        Accumulate the time spent in a sub-stage, e.g. `timer("raw", "decode")`.
+        """
+        counters = self.stage(stage)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            substage = counters["substages"].setdefault(
+                name, {"wall_time_s": 0.0, "calls": 0}
+            )
+            substage["wall_time_s"] += time.perf_counter() - start
+            substage["calls"] += 1
+            self.update(counters)
+
+    def to_dict(self):
+        """
+        Return the report as a JSON serializable dictionary.
+
+        Returns
+        -------
+        dict
+            The run metadata (creation date, duration, peak memory of the
+            process, versions, error) and per-stage "wall_time_s",
+            "cpu_time_s", "frames", "bytes_decoded", "bytes_read",
+            "bytes_written", "peak_rss_growth_mb", throughputs and
+            "substages". "peak_rss_growth_mb" is the growth of the peak
+            memory of the process during the stage: 0 for a stage staying
+            below the peak of an earlier one.
+        """
+        stages = {}
+        for name, counters in self.stages.items():
+            wall_time = counters["ended"] - counters["started"]
+            stages[name] = {
+                "wall_time_s": wall_time,
+                "cpu_time_s": counters["cpu_ended"] - counters["cpu_started"],
+                "total": counters["total"],
+                "frames": counters["frames"],
+                "bytes_decoded": counters["bytes_decoded"],
+                "bytes_read": counters["bytes_read"],
+                "bytes_written": counters["bytes_written"],
+                "frames_per_s": counters["frames"] / wall_time if wall_time else None,
+                "read_mb_per_s": (
+                    counters["bytes_read"] / wall_time / 1e6 if wall_time else None
+                ),
+                "peak_rss_growth_mb": (
+                    None
+                    if counters["peak_rss_started"] is None
+                    else counters["peak_rss_ended"] - counters["peak_rss_started"]
+                ),
+                "substages": counters["substages"],
+            }
+        return {
+            "created": self.created,
+            "wall_time_s": time.perf_counter() - self.started,
+            "peak_rss_mb": peak_rss_mb(),
+            "error": self.error,
+            "environment": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "zarr": zarr.__version__,
+            },
+            "stages": stages,
+        }
+
+    def save(self, group, **metadata):
+        """
+        Append the report to the `run_reports` attribute of a group, which
+        keeps the last MAX_RUN_REPORTS reports.
+
+        Parameters
+        ----------
+        group : zarr.hierarchy.Group
+            The METADATA group of the animal.
+        **metadata
+            Run parameters stored with the report (e.g. the input folder).
+
+        Returns
+        -------
+        dict
+            The stored report.
+        """
+        report = {**self.to_dict(), "parameters": metadata}
+        reports = group.attrs.get(RUN_REPORTS_KEY, []) + [report]
+        group.attrs[RUN_REPORTS_KEY] = reports[-MAX_RUN_REPORTS:]
+        return report
+
+
+@contextmanager
+def profiled(path=None):
+    """
+    Profile the enclosed code with cProfile if `path` is given.
+
+    The statistics are dumped to `path` in the pstats format read by
+    `python -m pstats`, snakeviz or gprof2dot. Sampling profilers need no
+    hook: `py-spy record -o profile.svg -- python -m ...` attaches to the
+    unmodified run.
+
+    Parameters
+    ----------
+    path : str, optional
+        Output file of the profile. Default is None (no profiling).
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(path))
@@ -0,0 +1,141 @@
+import numpy as np
+
+# "native" keeps the dtype of the files, "cast" wraps the values into uint8
+# (the historical behaviour), "rescale" maps a percentile range of the movie
+# to [0, 255]
+DTYPE_POLICIES = ["native", "cast", "rescale"]
+PERCENTILES = (0.5, 99.5)
+N_SAMPLES = 16
+# Integer frames up to this many bits are histogrammed exactly
+HISTOGRAM_BITS = 16
+# Pixel stride of the sample of the other frames (floats, 32-bit)
+SAMPLE_STRIDE = 4
+
+
+def check_policy(policy):
+    if policy not in DTYPE_POLICIES:
+        raise ValueError(f"Unknown dtype policy {policy}, use {DTYPE_POLICIES}")
+
+
+def sample_indices(n_frames, n_samples=N_SAMPLES):
+    """
+    Indices of `n_samples` frames evenly spread over a movie.
+    """
+    return np.unique(np.linspace(0, n_frames - 1, min(n_frames, n_samples)).round())
+
+
+def histogram_percentiles(histogram, percentiles):
+    """
+    Values at the given percentiles of an integer histogram (bin i = value i).
+    """
+    cumulative = np.cumsum(histogram)
+    return [
+        int(np.searchsorted(cumulative, cumulative[-1] * percentile / 100))
+        for percentile in percentiles
+    ]
+
+
+def intensity_range(sequence, percentiles=PERCENTILES, n_samples=N_SAMPLES):
+    """
+    Intensities at two percentiles of a movie, estimated from sampled frames.
+
+    The sampled frames are decoded one at a time. Integer frames of up to 16
+    bits are accumulated in an exact histogram of their values. Other frames
+    contribute a strided sample of their pixels.
+
+    Parameters
+    ----------
+    sequence : frame_index.FrameSequence
+        The frames of the movie.
+    percentiles : tuple, optional
+        The low and high percentiles. Default is (0.5, 99.5).
+    n_samples : int, optional
+        Number of frames sampled. Default is 16.
+
+    Returns
+    -------
+    tuple
+        The (low, high) intensities, high > low.
+    """
+    dtype = np.dtype(sequence.dtype)
+    exact = dtype.kind == "b" or (
+        dtype.kind == "u" and dtype.itemsize * 8 <= HISTOGRAM_BITS
+    )
+    histogram = np.zeros(2 ** (dtype.itemsize * 8), dtype=np.int64) if exact else None
+    samples = []
+    for index in sample_indices(len(sequence), n_samples):
+        if sequence.paths[int(index)] is None:
+            continue
+        frame = sequence.read(int(index))
+        if exact:
+            histogram += np.bincount(frame.ravel(), minlength=len(histogram))
+        else:
+            samples.append(frame[::SAMPLE_STRIDE, ::SAMPLE_STRIDE].ravel())
+
+    if exact:
+        if not histogram.any():
+            return 0, 1
+        low, high = histogram_percentiles(histogram, percentiles)
+    elif samples:
+        low, high = np.percentile(np.concatenate(samples), percentiles).tolist()
+    else:
+        return 0, 1
+    return low, high if high > low else low + 1
+
+
+class IntensityConverter:
+    """
+    Conversion of the frames of a movie to the dtype of a policy.
+
+    Parameters
+    ----------
+    sequence : frame_index.FrameSequence
+        The frames of the movie.
+    policy : str, optional
+        "native", "cast" or "rescale", see `DTYPE_POLICIES`. Default is
+        "native".
+    percentiles : tuple, optional
+        The percentiles mapped to 0 and 255 by "rescale".
+    n_samples : int, optional
+        Number of frames sampled to estimate the percentiles.
+    """
+
+    def __init__(
+        self, sequence, policy="native", percentiles=PERCENTILES, n_samples=N_SAMPLES
+    ):
+        check_policy(policy)
+        self.policy = policy
+        self.source_dtype = np.dtype(sequence.dtype)
+        self.dtype = self.source_dtype if policy == "native" else np.dtype(np.uint8)
+        self.range = None
+        self.display_range = None
+        if policy == "rescale":
+            self.range = intensity_range(sequence, percentiles, n_samples)
+            low, high = self.range
+            self.scale = np.float32(255 / (high - low))
+            self.offset = np.float32(low)
+        elif self.dtype != np.uint8:
+            # Native frames of more bits are displayed between the percentiles,
+            # e.g. 12-bit data stored in uint16
+            self.display_range = intensity_range(sequence, percentiles, n_samples)
+
+    def __call__(self, frame):
+        if self.policy == "native":
+            return frame
+        if self.policy == "cast":
+            return frame.astype(np.uint8, copy=False)
+        scaled = (frame.astype(np.float32) - self.offset) * self.scale
+        return np.clip(scaled, 0, 255, out=scaled).round().astype(np.uint8)
+
+    def attributes(self):
+        """
+        Attributes describing the conversion, stored with the dataset.
+        """
+        return {
+            "dtype_policy": self.policy,
+            "source_dtype": str(self.source_dtype),
+            "intensity_range": None if self.range is None else list(self.range),
+            "display_range": (
+                None if self.display_range is None else list(self.display_range)
+            ),
+        }
@@ -0,0 +1,248 @@
+import threading
+import time
+from contextlib import nullcontext
+
+
+class StageProgress:
+    """
+    Counters of a single stage (e.g. "raw", "masks", "AOT") of a job.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+    total : int, optional
+        Number of items (frames, files) expected for the stage. Default is None (unknown).
+    """
+
+    def __init__(self, name, total=None):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.nbytes = 0
+        self.started = time.monotonic()
+        self.updated = self.started
+        self.finished = False
+
+    def snapshot(self):
+        """
+        Return the state of the stage as a JSON serializable dictionary.
+
+        Returns
+        -------
+        dict
+            Items done, total, percent, throughput in frames/s and MB/s and ETA in seconds.
+        """
+        elapsed = max(self.updated - self.started, 1e-9)
+        frames_per_s = self.done / elapsed
+        eta = None
+        percent = None
+        if self.total:
+            percent = 100.0 * self.done / self.total
+            if frames_per_s > 0:
+                eta = (self.total - self.done) / frames_per_s
+        return {
+            "stage": self.name,
+            "done": self.done,
+            "total": self.total,
+            "percent": percent,
+            "frames_per_s": frames_per_s,
+            "mb_per_s": self.nbytes / elapsed / 1e6,
+            "eta_s": 0.0 if self.finished else eta,
+            "elapsed_s": elapsed,
+            "finished": self.finished,
+        }
+
+
+class ProgressRegistry:
+    """
+    Thread-safe store of the progress of every running job.
+
+    Workers update counters through a `ProgressReporter`, readers (e.g. the
+    Server-Sent Events endpoint of the Flask app) take snapshots and block on
+    `wait_for_update` instead of polling.
+
+    Parameters
+    ----------
+    min_interval : float, optional
+        Minimum time in seconds between two notifications of waiting readers.
+        Counter updates in between are cheap and only become visible on the
+        next notification. Default is 0.25.
+    """
+
+    def __init__(self, min_interval=0.25):
+        self.min_interval = min_interval
+        self._condition = threading.Condition()
+        self._jobs = {}
+        self._version = 0
+        self._last_notify = 0.0
+
+    def reporter(self, job_id):
+        """
+        Create a reporter bound to a job, registering the job if needed.
+
+        Parameters
+        ----------
+        job_id : str
+            Identifier of the job (usually the animal name).
+
+        Returns
+        -------
+        ProgressReporter
+            The reporter to pass to the ingest functions.
+        """
+        with self._condition:
+            self._jobs.setdefault(
+                job_id, {"stages": {}, "finished": False, "error": None}
+            )
+            self._notify(force=True)
+        return ProgressReporter(self, job_id)
+
+    def start_stage(self, job_id, stage, total=None):
+        with self._condition:
+            job = self._jobs.setdefault(
+                job_id, {"stages": {}, "finished": False, "error": None}
+            )
+            job["stages"][stage] = StageProgress(stage, total)
+            self._notify(force=True)
+
+    def advance(self, job_id, stage, n=1, nbytes=0):
+        with self._condition:
+            stage_progress = self._jobs[job_id]["stages"][stage]
+            stage_progress.done += n
+            stage_progress.nbytes += nbytes
+            stage_progress.updated = time.monotonic()
+            self._notify()
+
+    def finish_stage(self, job_id, stage):
+        with self._condition:
+            stage_progress = self._jobs[job_id]["stages"][stage]
+            stage_progress.updated = time.monotonic()
+            stage_progress.finished = True
+            self._notify(force=True)
+
+    def finish_job(self, job_id, error=None):
+        with self._condition:
+            self._jobs[job_id]["finished"] = True
+            self._jobs[job_id]["error"] = None if error is None else str(error)
+            self._notify(force=True)
+
+    def snapshot(self, job_id=None):
+        """
+        Return the progress of one job, or of all jobs.
+
+        Parameters
+        ----------
+        job_id : str, optional
+            The job to report. If None, all jobs are reported.
+
+        Returns
+        -------
+        dict
+            {job_id: {"stages": [...], "finished": bool, "error": str or None}}
+        """
+        with self._condition:
+            job_ids = list(self._jobs) if job_id is None else [job_id]
+            return {
+                job: {
+                    "stages": [
+                        stage.snapshot() for stage in self._jobs[job]["stages"].values()
+                    ],
+                    "finished": self._jobs[job]["finished"],
+                    "error": self._jobs[job]["error"],
+                }
+                for job in job_ids
+                if job in self._jobs
+            }
+
+    def wait_for_update(self, version, timeout=None):
+        """
+        Block until the registry changed after `version`, or until timeout.
+
+        Parameters
+        ----------
+        version : int
+            The last version seen by the caller.
+        timeout : float, optional
+            Maximum time to wait, in seconds.
+
+        Returns
+        -------
+        int
+            The current version of the registry.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def _notify(self, force=False):
+        # Must be called with the condition held
+        now = time.monotonic()
+        if force or now - self._last_notify >= self.min_interval:
+            self._version += 1
+            self._last_notify = now
+            self._condition.notify_all()
+
+
+class ProgressReporter:
+    """
+    Progress handle of a single job, passed down to the ingest functions.
+
+    Parameters
+    ----------
+    registry : ProgressRegistry
+        The registry holding the counters.
+    job_id : str
+        Identifier of the job.
+    """
+
+    def __init__(self, registry, job_id):
+        self.registry = registry
+        self.job_id = job_id
+
+    def start(self, stage, total=None):
+        self.registry.start_stage(self.job_id, stage, total)
+
+    def advance(self, stage, n=1, nbytes=0):
+        self.registry.advance(self.job_id, stage, n, nbytes)
+
+    def finish(self, stage):
+        self.registry.finish_stage(self.job_id, stage)
+
+    def close(self, error=None):
+        self.registry.finish_job(self.job_id, error)
+
+    def record(self, stage, bytes_read=0, bytes_written=0):
+        # Only the instrumentation reports (see instrumentation.RunReport)
+        # keep I/O counters and sub-stage timers
+        pass
+
+    def timer(self, stage, name):
+        return nullcontext()
+
+
+class NullProgress:
+    """
+    Reporter that does nothing, used when no progress is requested.
+    """
+
+    def start(self, stage, total=None):
+        pass
+
+    def advance(self, stage, n=1, nbytes=0):
+        pass
+
+    def finish(self, stage):
+        pass
+
+    def close(self, error=None):
+        pass
+
+    def record(self, stage, bytes_read=0, bytes_written=0):
+        pass
+
+    def timer(self, stage, name):
+        return nullcontext()
+
+
+NULL_PROGRESS = NullProgress()
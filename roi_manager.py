@@ -1,9 +1,10 @@
 import time
 import napari
 import numpy as np
-import zarr
 from qtpy.QtWidgets import QPushButton
 
+from animal_store import consolidate_animal, open_animal
+
 
 class RoiManager:
     """
@@ -287,15 +288,17 @@ class RoiManager:
                 self.animal.attrs[attribute][i] = value
             print(self.animal.attrs[attribute])
 
+        # Keep the consolidated metadata of the root group up to date
+        consolidate_animal(self.animal.store.path, paths=[""], recursive=False)
+
 
 def main():
     """
     Main function to initialize the napari viewer and ROI manager.
     """
-    animal = zarr.open(
-        "/Volumes/u934/equipe_bellaiche/m_ech-chouini/test_zar/wRNAi_6", "a"
-    )
-    image = animal.IMAGE.raw
+    path_animal = "/Volumes/u934/equipe_bellaiche/m_ech-chouini/test_zar/wRNAi_6"
+    animal = open_animal(path_animal, "a")
+    image = open_animal(path_animal, "r", consolidated=True).IMAGE.raw
 
     viewer = napari.Viewer()
     image_layer = viewer.add_image(image)
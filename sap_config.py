@@ -0,0 +1,356 @@
+"""
+Parser of the SAP_info and SAP_parameters MATLAB scripts.
+
+The generated scripts are lists of assignments (`dt = 5;`, `PIVgrid = 'L';`,
+`boxSize = [40 40]/scale1D;`) with comments, line continuations and a few
+if/switch blocks. Only the assignments at the top level of a script are
+its effective parameters: assignments inside blocks depend on values only
+known to MATLAB and are left out.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+CONFIG_KEY = "sap_config"
+SECTIONS = ["info", "parameters"]
+
+BLOCK_OPENERS = {"if", "switch", "for", "parfor", "while", "try", "function"}
+BLOCK_KEYWORDS = BLOCK_OPENERS | {"elseif", "else", "case", "otherwise", "catch"}
+ASSIGNMENT = re.compile(
+    r"^([A-Za-z]\w*(?:\.\w+|\{[^{}=]*\}|\([^()=]*\))*)\s*=(?!=)\s*(.*)$", re.DOTALL
+)
+NUMBER = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+SPECIAL_NUMBERS = {"Inf": "Infinity", "-Inf": "-Infinity", "NaN": "NaN"}
+OPENING, CLOSING = "([{", ")]}"
+# A quote following one of these characters is a transpose, not a string
+TRANSPOSABLE = re.compile(r"[\w)\]}.']")
+
+
+def split_statements(text):
+    """
+    Split a MATLAB script into statements, dropping comments.
+
+    Statements end with a newline, a semicolon or a comma outside brackets
+    and strings. Inside brackets, newlines and semicolons separate the rows
+    of a matrix and are kept. "..." continues a statement on the next line.
+
+    Parameters
+    ----------
+    text : str
+        The script.
+
+    Returns
+    -------
+    list of str
+        The non-empty statements, stripped.
+    """
+    statements, current, depth, i = [], [], 0, 0
+    while i < len(text):
+        char = text[i]
+        if char in "'\"" and not (
+            char == "'" and current and TRANSPOSABLE.match(current[-1])
+        ):
+            # String: copied as is up to its closing quote (doubled to escape)
+            end = i + 1
+            while end < len(text) and text[end] != "\n":
+                if text[end] == char:
+                    if text[end + 1 : end + 2] == char:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(text[i : end + 1])
+            i = end + 1
+            continue
+        if text.startswith("...", i):
+            # Continuation: skip to the next line
+            newline = text.find("\n", i)
+            i = len(text) if newline < 0 else newline + 1
+            current.append(" ")
+            continue
+        if char == "%":
+            newline = text.find("\n", i)
+            i = len(text) if newline < 0 else newline
+            continue
+        if char in OPENING:
+            depth += 1
+        elif char in CLOSING:
+            depth = max(depth - 1, 0)
+        if depth == 0 and char in "\n;,":
+            statements.append("".join(current).strip())
+            current = []
+        elif depth > 0 and char == "\n":
+            current.append(";")
+        else:
+            current.append(char)
+        i += 1
+    statements.append("".join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def split_elements(text, separators):
+    """
+    Split the inside of a matrix or cell array on top-level separators.
+    """
+    parts, current, depth, quote = [], [], 0, None
+    for char in text:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char in OPENING:
+            depth += 1
+        elif char in CLOSING:
+            depth -= 1
+        elif depth == 0 and char in separators:
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parse_value(text):
+    """
+    Convert the right-hand side of an assignment to a Python value.
+
+    Numbers, logicals, strings and matrices or cell arrays of them become
+    int, float, bool, str and (nested) lists. Inf and NaN become the strings
+    "Infinity" and "NaN" so that the value stays valid JSON. Any other
+    expression is kept as {"expression": text}.
+
+    Parameters
+    ----------
+    text : str
+        The MATLAB expression.
+
+    Returns
+    -------
+    object
+        The value.
+    """
+    text = text.strip()
+    if text in ("true", "false"):
+        return text == "true"
+    if text in SPECIAL_NUMBERS:
+        return SPECIAL_NUMBERS[text]
+    if NUMBER.match(text):
+        number = float(text)
+        return int(number) if number.is_integer() and "." not in text else number
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        quote = text[0]
+        inside = text[1:-1]
+        if quote not in inside.replace(quote * 2, ""):
+            return inside.replace(quote * 2, quote)
+    if len(text) >= 2 and (text[0], text[-1]) in (("[", "]"), ("{", "}")):
+        rows = [
+            [parse_value(element) for element in split_elements(row, " \t,")]
+            for row in split_elements(text[1:-1], ";")
+        ]
+        if not any(
+            isinstance(element, dict) for row in rows for element in row
+        ) and all(
+            # A sign separated from its number is an operation, e.g. [1 - 2]
+            element not in ("+", "-")
+            for row in split_elements(text[1:-1], ";")
+            for element in split_elements(row, " \t,")
+        ):
+            return rows[0] if len(rows) == 1 else rows
+    return {"expression": text}
+
+
+def parse_m_text(text):
+    """
+    Parse the top-level assignments of a MATLAB script.
+
+    Parameters
+    ----------
+    text : str
+        The script.
+
+    Returns
+    -------
+    dict
+        {name: value} in the order of the script, the last assignment of a
+        name winning. Names keep their field or index, e.g. "Qs2Plot.iso" or
+        "boxIJs{1}". Values are converted by `parse_value`.
+    """
+    parameters, depth = {}, 0
+    for statement in split_statements(text):
+        keyword = statement.split(None, 1)[0].split("(", 1)[0]
+        if keyword == "end":
+            depth = max(depth - 1, 0)
+            continue
+        if keyword in BLOCK_KEYWORDS:
+            depth += keyword in BLOCK_OPENERS
+            continue
+        match = ASSIGNMENT.match(statement)
+        if match and depth == 0:
+            name, value = match.groups()
+            parameters.pop(name, None)
+            parameters[name] = parse_value(value)
+    return parameters
+
+
+def parse_m_file(path):
+    """
+    Parse the top-level assignments of a MATLAB script file, see `parse_m_text`.
+    """
+    with open(path, encoding="utf-8", errors="replace") as file:
+        return parse_m_text(file.read())
+
+
+def sap_info_path(sap_info_folder, animal_name):
+    return os.path.join(sap_info_folder, f"SAP_info_{animal_name.replace('-', '_')}.m")
+
+
+def read_sap_config(sap_info_folder, animal_name):
+    """
+    Parse the SAP_info and SAP_parameters files of an animal.
+
+    Parameters
+    ----------
+    sap_info_folder : str or Path
+        The folder of the files, usually `<animal folder>/SAP_info`.
+    animal_name : str
+        The name of the animal.
+
+    Returns
+    -------
+    dict
+        {"info": {...}, "parameters": {...}}, empty for a missing file.
+    """
+    paths = {
+        "info": sap_info_path(sap_info_folder, animal_name),
+        "parameters": os.path.join(sap_info_folder, "SAP_parameters.m"),
+    }
+    return {
+        section: parse_m_file(path) if os.path.exists(path) else {}
+        for section, path in paths.items()
+    }
+
+
+def config_digest(config):
+    """
+    SHA-256 of the effective parameters of a configuration.
+
+    Comments, spacing and the order of the assignments do not change it.
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def config_record(config, **metadata):
+    """
+    The record of a configuration stored in METADATA: the parsed sections,
+    their digest and `metadata` (e.g. the files they were read from).
+    """
+    return {**config, "digest": config_digest(config), **metadata}
+
+
+def store_config(zarr_path, config, **metadata):
+    """
+    Store a configuration record in the `sap_config` attribute of METADATA.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        The animal store.
+    config : dict
+        The parsed configuration, see `read_sap_config`.
+    **metadata
+        Stored with the record, e.g. the source folder.
+
+    Returns
+    -------
+    dict
+        The stored record.
+    """
+    from animal_store import consolidate_animal, open_animal, structure_lock
+
+    record = config_record(config, **metadata)
+    metadata_group = open_animal(zarr_path, "a").METADATA
+    with structure_lock(metadata_group):
+        metadata_group.attrs[CONFIG_KEY] = record
+    consolidate_animal(zarr_path, paths=["METADATA"], recursive=False)
+    return record
+
+
+def load_config(zarr_path):
+    """
+    The configuration record of an animal store, read from its JSON attributes
+    without zarr (see `acquisition.load_acquisition`), or {} if there is none.
+    """
+    attributes = os.path.join(zarr_path, "METADATA", ".zattrs")
+    if not os.path.exists(attributes):
+        return {}
+    with open(attributes) as file:
+        return json.load(file).get(CONFIG_KEY, {})
+
+
+def diff_configs(before, after):
+    """
+    Parameters whose effective value differs between two configurations.
+
+    Parameters
+    ----------
+    before, after : dict
+        Configurations or records, see `read_sap_config`.
+
+    Returns
+    -------
+    dict
+        {"<section>.<name>": (before value, after value)}, None standing for
+        a missing parameter.
+    """
+    changes = {}
+    for section in SECTIONS:
+        old, new = before.get(section, {}), after.get(section, {})
+        for name in list(old) + [name for name in new if name not in old]:
+            if old.get(name) != new.get(name):
+                changes[f"{section}.{name}"] = (old.get(name), new.get(name))
+    return changes
+
+
+def diff_cohort(zarr_paths):
+    """
+    Parameters whose value differs across the animals of a cohort.
+
+    The records are read from the METADATA attributes of every store, see
+    `load_config`, so no `.m` file is parsed again.
+
+    Parameters
+    ----------
+    zarr_paths : list of str
+        The animal stores.
+
+    Returns
+    -------
+    dict
+        {"<section>.<name>": {store: value}} for the parameters that are not
+        the same in every animal, the stores being keyed as given. Stores
+        without a record are skipped.
+    """
+    records = {str(path): load_config(path) for path in zarr_paths}
+    records = {store: record for store, record in records.items() if record}
+    digests = {record["digest"] for record in records.values()}
+    if len(digests) < 2:
+        return {}
+    names = {
+        f"{section}.{name}": (section, name)
+        for record in records.values()
+        for section in SECTIONS
+        for name in record.get(section, {})
+    }
+    differences = {}
+    for key, (section, name) in names.items():
+        values = {
+            store: record.get(section, {}).get(name)
+            for store, record in records.items()
+        }
+        if len({json.dumps(value, sort_keys=True) for value in values.values()}) > 1:
+            differences[key] = values
+    return differences
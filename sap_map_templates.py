@@ -52,6 +52,19 @@ POT =   0;                                  % PlotOverTime (8.6)
 % - CTD can run without SIA backups, but they are required to make New Junctions and SIA division backups
 % - "NO PARAMETERS" means no SPECIFIC parameters for this program, but will use common parameters.
 
+% Programs in their order of execution. A scheduler running one program at a
+% time (sap_scheduler.py) names it in the SAP_PROGRAM environment variable:
+% every other program is then switched off.
+sapPrograms = {{'TR', 'SR', 'PIV', 'GEP', 'VM', 'FFPB', 'SIA', 'CT', 'HC', 'CTD', 'CPT', 'CTA', 'AOS', 'TA', 'GV', 'STPE', 'MSM', 'SM', 'AOT', 'POT'}};
+sapProgram = getenv('SAP_PROGRAM');
+if ~isempty(sapProgram)
+    for iProgram = 1:numel(sapPrograms)
+        if ~strcmp(sapPrograms{{iProgram}}, sapProgram)
+            eval([sapPrograms{{iProgram}} ' = 0;']);
+        end
+    end
+end
+
 
 %% MAIN COMMON PARAMETERS %%
 
@@ -631,6 +644,8 @@ def generate_animal_config(
     frame=71,
     temperature=29,
     input_folder="",
+    scale1D=0.161,
+    dt=5,
 ):
     """
     Generate the content for an animal configuration file.
@@ -659,6 +674,12 @@ def generate_animal_config(
         Frame number corresponding to time reference, by default 71.
     temperature : int, optional
         Temperature at which development was filmed, by default 29.
+    input_folder : str, optional
+        Folder containing the animal folder, by default "".
+    scale1D : float, optional
+        Length of one pixel in microns, by default 0.161 (bin 1).
+    dt : float, optional
+        Time between two frames in minutes, by default 5.
 
     Returns
     -------
@@ -688,10 +709,10 @@ def generate_animal_config(
     frameRef = {frame};                              % frame # corresponding to "timeRef" determined by "TimeRegistration"              
     timeRef = '20h15';                          % "timeRef" ('HH f:MM' or decimal) corresponding to "frameRef" above     18h35 : ¾ of the patches rotation peak    20h15 : ¾ of the cellular divisions peak    25h58 : ¾ of the cellular migration peak
 
-    dt = 5;                                     % time IN MINUTES between two frames
+    dt = {dt:g};                                     % time IN MINUTES between two frames
     temperature = {temperature};                           % temperature (25 or 29C) at which development was filmed
     yMid = [{yml}];                                 % y of midline IN PIXELS (leave empty [] if unknown)
-    scale1D = 0.161;                            % Length of one pixel IN MICRONS (if 1 pixel is 0.1 um enter 0.1) 
+    scale1D = {scale1D:g};                            % Length of one pixel IN MICRONS (if 1 pixel is 0.1 um enter 0.1) 
     %Bin 1: 0.161, Bin 2: 0.322;
 
     %% Box/Grid specifications (PIV, CPT, AOS, TA, SM) %%
@@ -0,0 +1,287 @@
+"""
+Local scheduler of the SAP (AnimalProcessing) runs of several animals.
+
+Every `SAP_info_<animal>.m` script is run by a configurable command, e.g.
+MATLAB, Octave or a stub script, in a bounded pool of workers. The output of
+every run goes to a log file next to the script, and the runtimes are
+returned per animal. As soon as the AOT results of an animal are written,
+they are extracted into its zarr store.
+
+    python cli.py sap-run /data/*/SAP_info/SAP_info_*.m --command octave --workers 2
+"""
+
+import glob
+import os
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from progress import NULL_PROGRESS
+from sap_config import parse_m_file
+
+# Variable of a SAP_parameters file listing its programs in pipeline order, a
+# program using the results of the programs before it
+PROGRAMS_KEY = "sapPrograms"
+# Command templates, formatted with the fields of `SAPJob.fields`
+COMMANDS = {
+    "matlab": "matlab -batch \"cd('{folder}'); {name}\"",
+    "octave": "octave --no-gui --eval \"cd('{folder}'); {name}\"",
+}
+LOG_FOLDER = "logs"
+
+
+def enabled_programs(parameters_path):
+    """
+    Programs switched on in a SAP_parameters file, in pipeline order.
+
+    The order is the `sapPrograms` list of the file, see
+    `sap_map_templates.create_sap_parameters`, whose scripts run only the
+    program named in the SAP_PROGRAM environment variable if it is set.
+
+    Parameters
+    ----------
+    parameters_path : str
+        The SAP_parameters.m file.
+
+    Returns
+    -------
+    list of str or None
+        The enabled programs, None if there is no file or it does not list
+        its programs (the script can then only run as a whole).
+    """
+    if not os.path.exists(parameters_path):
+        return None
+    parameters = parse_m_file(parameters_path)
+    programs = parameters.get(PROGRAMS_KEY)
+    if not isinstance(programs, list):
+        return None
+    return [program for program in programs if parameters.get(program) == 1]
+
+
+class SAPJob:
+    """
+    The SAP run of one animal.
+
+    Parameters
+    ----------
+    script : str
+        The `SAP_info_<animal>.m` script, in the SAP_info folder of the animal.
+    """
+
+    def __init__(self, script):
+        self.script = os.path.abspath(script)
+        self.folder = os.path.dirname(self.script)
+        self.name = os.path.splitext(os.path.basename(self.script))[0]
+        # The SAP_info folder is in the animal folder, named after the animal
+        self.animal_folder = os.path.dirname(self.folder)
+        self.animal = os.path.basename(self.animal_folder)
+        self.results_folder = os.path.join(self.animal_folder, f"SAP_{self.animal}")
+        self.programs = enabled_programs(os.path.join(self.folder, "SAP_parameters.m"))
+        self.log_path = os.path.join(self.folder, LOG_FOLDER, f"{self.name}.log")
+
+    def fields(self, program=""):
+        return {
+            "script": self.script,
+            "folder": self.folder,
+            "name": self.name,
+            "animal": self.animal,
+            "program": program,
+        }
+
+    def stages(self, command):
+        """
+        The commands run for the animal, [(stage, argv)].
+
+        A template using "{program}" is run once per enabled program, in
+        pipeline order, if the SAP_parameters file lists its programs. Any
+        other template runs the whole script, SAP running the programs in the
+        same order, as a single "SAP" stage.
+        """
+        if "{program}" in command and self.programs is not None:
+            return [
+                (program, shlex.split(command.format(**self.fields(program))))
+                for program in self.programs
+            ]
+        return [("SAP", shlex.split(command.format(**self.fields())))]
+
+    def environment(self, stage):
+        """
+        The environment of a stage: SAP_PROGRAM names the program of a
+        per-program stage, and is unset for a whole-script stage.
+        """
+        environment = {**os.environ}
+        environment.pop("SAP_PROGRAM", None)
+        if stage != "SAP":
+            environment["SAP_PROGRAM"] = stage
+        return environment
+
+    def runs_aot(self):
+        return self.programs is None or "AOT" in self.programs
+
+
+def run_stage(argv, log, cwd, timeout=None, environment=None):
+    """
+    Run a command, appending its output to an open log file.
+
+    Returns
+    -------
+    int
+        The return code, -1 if the command could not be started or timed out.
+    """
+    log.write(f"$ {shlex.join(argv)}\n")
+    log.flush()
+    try:
+        completed = subprocess.run(
+            argv,
+            cwd=cwd,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            timeout=timeout,
+            env=environment,
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        log.write(f"{type(error).__name__}: {error}\n")
+        return -1
+    return completed.returncode
+
+
+def extract_aot(job):
+    """
+    Extract the AOT results of a job into the TENSORS group of its animal store.
+
+    Returns
+    -------
+    str
+        "extracted", "no store" if the animal folder is not zarrified, or
+        "no AOT folder".
+    """
+    if not os.path.isdir(os.path.join(job.animal_folder, "METADATA")):
+        return "no store"
+    if not glob.glob(os.path.join(job.results_folder, "AOT*")):
+        return "no AOT folder"
+
+    from animal_store import consolidate_animal, open_animal
+    from zarrification import AOT_QUANTITIES, extract_AOT_results_folder
+
+    animal = open_animal(job.animal_folder, "a")
+    extract_AOT_results_folder(
+        animal.TENSORS, job.results_folder, AOT_QUANTITIES, verbose=False
+    )
+    consolidate_animal(job.animal_folder, paths=["TENSORS"])
+    return "extracted"
+
+
+def run_job(job, command, timeout=None, extract=True):
+    """
+    Run the stages of a job in order, stopping at the first failure.
+
+    Parameters
+    ----------
+    job : SAPJob
+        The animal to process.
+    command : str
+        The command template, see `run_sap_jobs`.
+    timeout : float, optional
+        Maximum duration of a stage, in seconds.
+    extract : bool, optional
+        Extract the AOT results into the animal store once they are written.
+
+    Returns
+    -------
+    dict
+        "stages" ({stage: {"returncode", "runtime_s"}}, the stages after a
+        failure being left out), "runtime_s", "log", "aot" (result of
+        `extract_aot`, None if not attempted) and "error" (None on success).
+    """
+    os.makedirs(os.path.dirname(job.log_path), exist_ok=True)
+    result = {"stages": {}, "log": job.log_path, "aot": None, "error": None}
+    start = time.perf_counter()
+    with open(job.log_path, "w") as log:
+        for stage, argv in job.stages(command):
+            stage_start = time.perf_counter()
+            returncode = run_stage(
+                argv, log, job.folder, timeout, job.environment(stage)
+            )
+            result["stages"][stage] = {
+                "returncode": returncode,
+                "runtime_s": time.perf_counter() - stage_start,
+            }
+            if returncode != 0:
+                result["error"] = f"{stage} failed with return code {returncode}"
+                break
+            # The AOT folder is complete once the stage writing it is done
+            if extract and stage in ("AOT", "SAP") and job.runs_aot():
+                try:
+                    result["aot"] = extract_aot(job)
+                except Exception as error:
+                    result["aot"] = f"failed: {error}"
+    result["runtime_s"] = time.perf_counter() - start
+    return result
+
+
+def run_sap_jobs(
+    scripts,
+    command="matlab",
+    n_workers=None,
+    timeout=None,
+    extract=True,
+    progress=None,
+):
+    """
+    Run the SAP scripts of several animals in a bounded pool of workers.
+
+    Parameters
+    ----------
+    scripts : list of str
+        The `SAP_info_<animal>.m` scripts, as written by
+        `create_sap_info.generate_sap_files`.
+    command : str, optional
+        A name of `COMMANDS` ("matlab", "octave") or a command template, e.g.
+        "python stub.py {script}". The template is formatted with "script"
+        (absolute path), "folder" (the SAP_info folder, also the working
+        directory), "name" (script name without extension), "animal" and
+        "program". A template using "{program}" runs the enabled programs
+        one by one in pipeline order, the program being also passed in the
+        SAP_PROGRAM environment variable that the generated SAP_parameters
+        scripts read, see `enabled_programs`. Default is "matlab".
+    n_workers : int, optional
+        Maximum number of animals processed at once. Default is 1: every
+        MATLAB session uses several cores by itself.
+    timeout : float, optional
+        Maximum duration of a stage, in seconds. Default is None (no limit).
+    extract : bool, optional
+        Extract the AOT results of every animal into its store as soon as
+        they are written, see `zarrification.extract_AOT_results_folder`.
+        Default is True.
+    progress : ProgressReporter, optional
+        Reporter receiving one update per finished animal under the "SAP"
+        stage.
+
+    Returns
+    -------
+    dict
+        {animal folder: result}, see `run_job`, in the order the runs finished.
+    """
+    progress = progress or NULL_PROGRESS
+    command = COMMANDS.get(command, command)
+    jobs = [SAPJob(script) for script in scripts]
+    results = {}
+    progress.start("SAP", total=len(jobs))
+    with ThreadPoolExecutor(max_workers=n_workers or 1) as executor:
+        futures = {
+            executor.submit(run_job, job, command, timeout, extract): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            result = results[job.animal_folder] = future.result()
+            runtimes = ", ".join(
+                f"{stage} {stage_result['runtime_s']:.1f} s"
+                for stage, stage_result in result["stages"].items()
+            )
+            status = result["error"] or f"done, AOT {result['aot']}"
+            print(f"{job.animal}: {status} ({runtimes}), log in {result['log']}")
+            progress.advance("SAP")
+    progress.finish("SAP")
+    return results
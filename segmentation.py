@@ -0,0 +1,355 @@
+import numpy as np
+import numcodecs
+
+MASK_INDEX = "masks_index"
+LABEL_TILE = 256
+
+
+def label_chunks(height, width):
+    """
+    Chunk shape of label masks: one frame split in LABEL_TILE square tiles,
+    so that extracting a cell only decodes the tiles under its bounding box.
+    """
+    return (1, min(height, LABEL_TILE), min(width, LABEL_TILE))
+
+
+def label_codecs(dtype):
+    """
+    Filters and compressor suited to label images.
+
+    Labels are constant over whole cells, so the difference between
+    consecutive pixels is zero almost everywhere. A delta filter turns each
+    cell into long runs of zeros that zstd then encodes like run-lengths.
+
+    Parameters
+    ----------
+    dtype : numpy.dtype
+        The dtype of the labels.
+
+    Returns
+    -------
+    dict
+        The `filters` and `compressor` arguments of `create_dataset`.
+    """
+    return {
+        "filters": [numcodecs.Delta(dtype=dtype)],
+        "compressor": numcodecs.Zstd(level=5),
+    }
+
+
+def label_bounding_boxes(mask):
+    """
+    Compute the bounding box of every label of a mask.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        2D label image, 0 being the background.
+
+    Returns
+    -------
+    labels : numpy.ndarray
+        The labels present in the mask, in increasing order.
+    bboxes : numpy.ndarray
+        Array of shape (n_labels, 4) holding [y_start, y_stop, x_start, x_stop].
+    """
+    from scipy import ndimage
+
+    objects = ndimage.find_objects(mask)
+    labels = np.array(
+        [label for label, box in enumerate(objects, start=1) if box is not None],
+        dtype=np.uint32,
+    )
+    bboxes = np.array(
+        [
+            [box[0].start, box[0].stop, box[1].start, box[1].stop]
+            for box in objects
+            if box is not None
+        ],
+        dtype=np.int32,
+    ).reshape(-1, 4)
+    return labels, bboxes
+
+
+def write_label_index(group, frames_boxes):
+    """
+    Store the per-frame bounding boxes of the labels as columnar arrays.
+
+    The index is a group holding `label` and `bbox` for all (frame, label)
+    pairs, frame after frame, and `offsets` such that the entries of frame t
+    are `offsets[t]:offsets[t + 1]`.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The group in which the index group is created.
+    frames_boxes : list of tuple
+        (labels, bboxes) of every frame, as returned by `label_bounding_boxes`.
+
+    Returns
+    -------
+    zarr.hierarchy.Group
+        The index group.
+    """
+    index = group.require_group(MASK_INDEX)
+    counts = [len(labels) for labels, _ in frames_boxes]
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    labels = np.concatenate([labels for labels, _ in frames_boxes])
+    bboxes = np.concatenate([bboxes for _, bboxes in frames_boxes])
+    index.create_dataset("offsets", data=offsets, overwrite=True)
+    index.create_dataset("label", data=labels, overwrite=True)
+    index.create_dataset("bbox", data=bboxes, overwrite=True)
+    return index
+
+
+class LabelIndex:
+    """
+    In-memory copy of the label index written by `write_label_index`.
+
+    The index is small compared to the masks, it is read once so that each
+    lookup only costs a binary search.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The index group.
+    """
+
+    def __init__(self, group):
+        self.offsets = group["offsets"][:]
+        self.labels = group["label"][:]
+        self.bboxes = group["bbox"][:]
+
+    def bbox(self, frame, label):
+        """
+        Look up the bounding box of a label in a frame.
+
+        Parameters
+        ----------
+        frame : int
+            The frame index.
+        label : int
+            The label.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            [y_start, y_stop, x_start, x_stop], or None if the label is absent.
+        """
+        start, stop = self.offsets[frame], self.offsets[frame + 1]
+        position = start + np.searchsorted(self.labels[start:stop], label)
+        if position == stop or self.labels[position] != label:
+            return None
+        return self.bboxes[position]
+
+
+def extract_label(masks, index, frame, label):
+    """
+    Extract the binary mask of one label, reading only its bounding box.
+
+    Parameters
+    ----------
+    masks : zarr.core.Array
+        The IMAGE/masks dataset.
+    index : LabelIndex
+        The label index of the masks.
+    frame : int
+        The frame index.
+    label : int
+        The label.
+
+    Returns
+    -------
+    bbox : numpy.ndarray or None
+        [y_start, y_stop, x_start, x_stop] of the label.
+    mask : numpy.ndarray or None
+        Boolean mask of the label inside its bounding box.
+    """
+    bbox = index.bbox(frame, label)
+    if bbox is None:
+        return None, None
+    y_start, y_stop, x_start, x_stop = bbox
+    return bbox, masks[frame, y_start:y_stop, x_start:x_stop] == label
+
+
+def outlines_from_masks(masks):
+    """
+    Derive binary outlines from label masks.
+
+    A pixel is on an outline when it belongs to a cell and one of its four
+    neighbours carries another label (including the background), i.e. the
+    inner boundary of every cell as drawn in the `seg*.png` files.
+
+    Parameters
+    ----------
+    masks : numpy.ndarray
+        Label image(s), the last two axes being (y, x).
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 outlines of the same shape, 255 on the outlines and 0 elsewhere.
+    """
+    boundary = np.zeros(masks.shape, dtype=bool)
+    rows = masks[..., 1:, :] != masks[..., :-1, :]
+    boundary[..., 1:, :] |= rows
+    boundary[..., :-1, :] |= rows
+    columns = masks[..., :, 1:] != masks[..., :, :-1]
+    boundary[..., :, 1:] |= columns
+    boundary[..., :, :-1] |= columns
+    boundary &= masks > 0
+    return boundary.astype(np.uint8) * 255
+
+
+def compare_outlines(derived, ingested):
+    """
+    Measure the agreement of derived outlines with ingested ones.
+
+    Parameters
+    ----------
+    derived : numpy.ndarray
+        Outlines computed by `outlines_from_masks`.
+    ingested : numpy.ndarray
+        Outlines decoded from the `seg*.png` files.
+
+    Returns
+    -------
+    dict
+        Pixel precision, recall and intersection over union of the outlines.
+    """
+    derived = derived > 0
+    ingested = ingested > 0
+    intersection = np.count_nonzero(derived & ingested)
+    n_derived = np.count_nonzero(derived)
+    n_ingested = np.count_nonzero(ingested)
+    union = n_derived + n_ingested - intersection
+    return {
+        "precision": intersection / n_derived if n_derived else 1.0,
+        "recall": intersection / n_ingested if n_ingested else 1.0,
+        "iou": intersection / union if union else 1.0,
+    }
+
+
+class PackedOutlines:
+    """
+    Array-like view of a bit-packed outlines dataset.
+
+    Outlines are binary, so they are stored with 8 pixels per byte along the
+    width (`np.packbits`). Reading unpacks only the bytes covering the
+    requested columns and returns uint8 outlines (0 or 255), like the dense
+    dataset, so that napari and the analysis code can use either one.
+
+    Parameters
+    ----------
+    packed : zarr.core.Array
+        The packed dataset, of shape (frames, height, ceil(width / 8)), with
+        the unpacked width in its `width` attribute.
+    """
+
+    def __init__(self, packed):
+        self.packed = packed
+        self.attrs = packed.attrs
+        self.width = packed.attrs["width"]
+        self.shape = packed.shape[:-1] + (self.width,)
+        self.chunks = packed.chunks[:-1] + (min(packed.chunks[-1] * 8, self.width),)
+        self.dtype = np.dtype(np.uint8)
+        self.ndim = len(self.shape)
+        self.size = int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def normalize_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(item is Ellipsis for item in key):
+            position = next(i for i, item in enumerate(key) if item is Ellipsis)
+            fill = (slice(None),) * (self.ndim - len(key) + 1)
+            key = key[:position] + fill + key[position + 1 :]
+        return key + (slice(None),) * (self.ndim - len(key))
+
+    def __getitem__(self, key):
+        key = self.normalize_key(key)
+        columns = key[-1]
+        if isinstance(columns, (int, np.integer)):
+            columns = columns % self.width
+            start, stop, step, squeeze = columns, columns + 1, 1, True
+        else:
+            start, stop, step = columns.indices(self.width)
+            squeeze = False
+
+        if step > 0:
+            # Only read the bytes covering [start, stop)
+            byte_start, byte_stop = start // 8, -(-stop // 8)
+            bits = np.unpackbits(
+                self.packed[key[:-1] + (slice(byte_start, byte_stop),)], axis=-1
+            )
+            bits = bits[..., start - 8 * byte_start : stop - 8 * byte_start : step]
+        else:
+            bits = np.unpackbits(self.packed[key[:-1] + (slice(None),)], axis=-1)
+            bits = bits[..., : self.width][..., columns]
+
+        if squeeze:
+            bits = bits[..., 0]
+        return bits * np.uint8(255)
+
+    def __setitem__(self, key, value):
+        # Whole rows are written, only the leading axes can be indexed
+        self.packed[key] = np.packbits(np.asarray(value) > 0, axis=-1)
+
+
+def create_packed_outlines(group, shape, name="outlines"):
+    """
+    Create a bit-packed outlines dataset.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The group in which the dataset is created.
+    shape : tuple
+        The unpacked shape (frames, height, width).
+    name : str, optional
+        Name of the dataset. Default is "outlines".
+
+    Returns
+    -------
+    PackedOutlines
+        The wrapper of the created dataset, to be filled frame by frame.
+    """
+    n_frames, height, width = shape
+    packed_width = -(-width // 8)
+    packed = group.create_dataset(
+        name,
+        shape=(n_frames, height, packed_width),
+        dtype=np.uint8,
+        chunks=(1, height, packed_width),
+    )
+    packed.attrs["packed"] = "bits"
+    packed.attrs["width"] = width
+    return PackedOutlines(packed)
+
+
+def open_outlines(group, name="outlines"):
+    """
+    Open an outlines dataset, unpacking it transparently if it is bit-packed.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The group holding the dataset (usually IMAGE).
+    name : str, optional
+        Name of the dataset. Default is "outlines".
+
+    Returns
+    -------
+    zarr.core.Array or PackedOutlines
+        The dense dataset, or the wrapper of the packed one.
+    """
+    array = group[name]
+    if array.attrs.get("packed") == "bits":
+        return PackedOutlines(array)
+    return array
@@ -1,7 +1,5 @@
 from pathlib import Path
-import napari
-from roi_manager import RoiManager
-import zarr
+from animal_store import open_animal
 
 
 def attributes_to_text_file(animal, path_animal: Path, animal_name: str):
@@ -31,10 +29,14 @@ def main():
     """
     Main function to initialize the napari viewer and ROI manager.
     """
+    # napari and Qt are only needed by the viewer, not by the text export
+    import napari
+    from roi_manager import RoiManager
+
     path_animal = Path("/Volumes/u934/equipe_bellaiche/m_ech-chouini/test_zar/wRNAi_6")
     animal_name = "wRNAi_6"
-    animal = zarr.open(path_animal, "a")
-    image = animal.IMAGE.raw
+    animal = open_animal(path_animal, "a")
+    image = open_animal(path_animal, "r", consolidated=True).IMAGE.raw
 
     viewer = napari.Viewer()
     image_layer = viewer.add_image(image)
@@ -0,0 +1,317 @@
+import re
+
+import numpy as np
+
+from animal_store import open_animal
+
+HAPF_PATTERN = re.compile(r"^\s*(\d+)\s*h\s*(\d*)\s*$")
+TIME_INDEX = "time_hAPF"
+FRAME_INDEX = "frame_range"
+
+
+def parse_hapf(value):
+    """
+    Convert a time after puparium formation to decimal hours.
+
+    Parameters
+    ----------
+    value : str or float
+        A time written like in the AOT backups ("14h00", "16h30") or a number
+        of hours.
+
+    Returns
+    -------
+    float
+        The time in hours APF.
+    """
+    if isinstance(value, str):
+        match = HAPF_PATTERN.match(value)
+        if match:
+            hours, minutes = match.groups()
+            return int(hours) + int(minutes or 0) / 60
+    return float(value)
+
+
+def read_attribute(group, key):
+    """
+    Read a value stored by `write_quantity` in a pickled one-element dataset.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        A grid group of TENSORS (e.g. TENSORS/DBA_L).
+    key : str
+        The name of the value (e.g. "TimeArray", "grid_xStart").
+
+    Returns
+    -------
+    various
+        The stored value.
+    """
+    return group[key][0]
+
+
+def time_starts(group):
+    """
+    Start time of every time point of a grid group, in hours APF.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        A grid group of TENSORS holding a `TimeArray`.
+
+    Returns
+    -------
+    numpy.ndarray
+        The start times, one per time point.
+    """
+    return time_index(group)[TIME_INDEX][:, 0]
+
+
+def grid_origin_index(group):
+    """
+    Row and column of the box at the origin of the grid of a grid group.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        A grid group of TENSORS holding `grid_xStart` and `grid_yStart`.
+
+    Returns
+    -------
+    tuple
+        The (row, column) indices of the origin box.
+    """
+    return int(read_attribute(group, "grid_yStart")), int(
+        read_attribute(group, "grid_xStart")
+    )
+
+
+def check_time_first(array, n_times, name=""):
+    """
+    Check that a quantity has the time-first layout of `harmonize_shape`.
+
+    Parameters
+    ----------
+    array : zarr.core.Array
+        The quantity, expected of shape (time, rows, columns, ...).
+    n_times : int
+        The number of time points of the `TimeArray` of its group.
+    name : str, optional
+        Name of the quantity, used in error messages.
+
+    Raises
+    ------
+    ValueError
+        If the first axis is not the time axis.
+    """
+    if array.ndim < 3 or array.shape[0] != n_times:
+        raise ValueError(
+            f"{name} of shape {array.shape} is not time first with {n_times} time points"
+        )
+
+
+def hapf_ranges(time_array):
+    """
+    Convert a `TimeArray` to start and end times in hours APF.
+
+    Parameters
+    ----------
+    time_array : array-like
+        The [start, end] pairs of every time point ("14h00", "16h00").
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 array of shape (time, 2).
+    """
+    # `loadmat(squeeze_me=True)` squeezes a single time point to shape (2,)
+    pairs = np.reshape(np.asarray(time_array, dtype=object), (-1, 2))
+    return np.array(
+        [[parse_hapf(start), parse_hapf(end)] for start, end in pairs],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+
+
+def frame_ranges(frame_array):
+    """
+    Convert a `FrameArray` to first and last frames.
+
+    Parameters
+    ----------
+    frame_array : array-like
+        The [first, last] frames of every time point, squeezed to shape (2,)
+        for a single time point.
+
+    Returns
+    -------
+    numpy.ndarray
+        int64 array of shape (time, 2).
+    """
+    return np.reshape(np.asarray(frame_array, dtype=np.int64), (-1, 2))
+
+
+def time_index(group):
+    """
+    Read the time and frame index of a grid group.
+
+    The typed `time_hAPF` and `frame_range` datasets written at extraction
+    are used when present, the pickled `TimeArray` and `FrameArray`
+    otherwise (stores extracted before they existed).
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        A grid group of TENSORS.
+
+    Returns
+    -------
+    dict
+        "time_hAPF" and "frame_range" arrays of shape (time, 2), None when
+        missing from the group.
+    """
+    index = {}
+    for key, source, convert in [
+        (TIME_INDEX, "TimeArray", hapf_ranges),
+        (FRAME_INDEX, "FrameArray", frame_ranges),
+    ]:
+        if key in group:
+            index[key] = group[key][:]
+        elif source in group:
+            index[key] = convert(read_attribute(group, source))
+        else:
+            index[key] = None
+    return index
+
+
+def select_times(index, times=None, frames=None):
+    """
+    Find the contiguous range of time points overlapping a time window.
+
+    Parameters
+    ----------
+    index : dict
+        The index returned by `time_index`.
+    times : tuple, optional
+        (start, end) in hours APF, as numbers or strings like "14h00". A time
+        point is selected if it overlaps [start, end).
+    frames : tuple, optional
+        (first, last) frames, inclusive. A time point is selected if its
+        frames overlap [first, last].
+
+    Returns
+    -------
+    slice
+        The selected time points.
+
+    Raises
+    ------
+    ValueError
+        If both windows are given, or if the index needed is missing.
+    """
+    if times is not None and frames is not None:
+        raise ValueError("Select time points by times or by frames, not both")
+    if times is None and frames is None:
+        return slice(None)
+
+    if times is not None:
+        ranges = index[TIME_INDEX]
+        start, end = parse_hapf(times[0]), parse_hapf(times[1])
+        selected = (ranges[:, 0] < end) & (ranges[:, 1] > start)
+    else:
+        ranges = index[FRAME_INDEX]
+        if ranges is None:
+            raise ValueError("The group has no FrameArray to select frames")
+        selected = (ranges[:, 0] <= frames[1]) & (ranges[:, 1] >= frames[0])
+
+    # Time points are sorted, the selection is a single run
+    selected = np.flatnonzero(selected)
+    if not len(selected):
+        return slice(0, 0)
+    return slice(int(selected[0]), int(selected[-1]) + 1)
+
+
+def query_tensor(group, quantity, times=None, frames=None, rows=None, columns=None):
+    """
+    Read a time window and a region of boxes of a time-first quantity.
+
+    Only the chunks intersecting the selection are read: quantities are
+    chunked by time point, and the time window is turned into a slice
+    through the time index of the group without loading the quantity.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        A grid group of TENSORS (e.g. TENSORS/DBA_L).
+    quantity : str
+        Name of the quantity (e.g. "UPIV").
+    times : tuple, optional
+        (start, end) in hours APF, see `select_times`.
+    frames : tuple, optional
+        (first, last) frames, inclusive, see `select_times`.
+    rows, columns : slice, optional
+        The boxes to read, as indices of the grid. Default is all boxes.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        The selected values, of shape (time, rows, columns, ...).
+    coordinates : dict
+        "time_hAPF" and "frame_range" of the selected time points, "rows" and
+        "columns" indices of the boxes and their "grid_coordinates" (x, y
+        relative to the grid origin), None when missing from the group.
+    """
+    index = time_index(group)
+    array = group[quantity]
+    if index[TIME_INDEX] is not None:
+        check_time_first(array, len(index[TIME_INDEX]), quantity)
+
+    time_slice = select_times(index, times, frames)
+    rows = rows if rows is not None else slice(None)
+    columns = columns if columns is not None else slice(None)
+    values = array[time_slice, rows, columns]
+
+    row_indices = np.arange(array.shape[1])[rows]
+    column_indices = np.arange(array.shape[2])[columns]
+    coordinates = {
+        key: None if ranges is None else ranges[time_slice]
+        for key, ranges in index.items()
+    }
+    coordinates["rows"] = row_indices
+    coordinates["columns"] = column_indices
+    coordinates["grid_coordinates"] = (
+        group["grid_coordinates"][:, rows, columns]
+        if "grid_coordinates" in group
+        else None
+    )
+    return values, coordinates
+
+
+def query_animal(
+    zarr_path, quantity, grid="DBA_L", times=None, frames=None, rows=None, columns=None
+):
+    """
+    Open an animal store and query a tensor quantity, see `query_tensor`.
+
+    Parameters
+    ----------
+    zarr_path : str or Path
+        Path to the animal store (folder or zip archive).
+    quantity : str
+        Name of the quantity (e.g. "UPIV").
+    grid : str, optional
+        Path of the grid group inside TENSORS. Default is "DBA_L".
+    times, frames, rows, columns : optional
+        The selection, see `query_tensor`.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        The selected values.
+    coordinates : dict
+        The coordinates of the selection.
+    """
+    animal = open_animal(zarr_path, "r", consolidated=True)
+    return query_tensor(
+        animal.TENSORS[grid], quantity, times, frames, rows=rows, columns=columns
+    )
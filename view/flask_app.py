@@ -1,12 +1,37 @@
 # flask_app.py
 import os
-from flask import Flask, render_template, request, jsonify
+import sys
+import json
+import threading
+import hashlib
+from io import BytesIO
+from collections import OrderedDict
+from functools import lru_cache
+from flask import Flask, render_template, request, jsonify, Response, abort
 from flask_cors import CORS
-import glob
+import numpy as np
+from PIL import Image
+
+# The pipeline modules live at the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from progress import ProgressRegistry
+from animal_store import close_animal, open_animal
+from segmentation import open_outlines
+from frame_index import match_prefix
+from intensity import PERCENTILES
 
 app = Flask(__name__)
 
 stored_data = {}
+progress_registry = ProgressRegistry()
+# Open IMAGE datasets, {(store, dataset, version): (root group, dataset)}
+open_datasets = OrderedDict()
+open_datasets_lock = threading.Lock()
+
+TILE_SIZE = 256
+DATASET_CACHE_SIZE = 64
+IMAGE_DATASETS = ["raw", "outlines", "masks"]
+IMAGE_FORMATS = {"png": "PNG", "webp": "WEBP"}
 
 
 @app.route("/")
@@ -18,7 +43,7 @@ def home():
 def autocomplete():
     partial_path = request.json["partial_path"]
     print(partial_path)
-    matching_folders = glob.glob(f"{partial_path}*")
+    matching_folders = match_prefix(partial_path)
     sorted_folders = sorted(matching_folders)
     print(sorted_folders)
     return jsonify({"suggestions": sorted_folders})
@@ -29,7 +54,7 @@ def zarrify():
     data = request.get_json()
     project_folder = data["project_folder"]
     stored_data["project_folder"] = project_folder
-    sub_folders = glob.glob(f"{project_folder}*")
+    sub_folders = match_prefix(project_folder)
     sub_folders = [
         os.path.basename(folder) for folder in sub_folders if "." not in folder
     ]
@@ -43,6 +68,323 @@ def getdata():
     return jsonify(stored_data)  # Return stored data
 
 
+def zarrify_job(animal_folder, progress):
+    """
+    Run the zarrification of one animal, reporting to `progress`.
+    """
+    from zarrification import run_zarrification
+
+    try:
+        run_zarrification(animal_folder, progress=progress)
+    except Exception as error:
+        progress.close(error)
+        raise
+    progress.close()
+
+
+@app.route("/run_zarrification", methods=["POST"])
+def run_zarrification_jobs():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, "The request body must be a JSON object")
+    project_folder = data.get("project_folder", stored_data.get("project_folder"))
+    if not isinstance(project_folder, str):
+        abort(400, "Missing project_folder")
+    animals = data.get("animals")
+    if not isinstance(animals, list) or not all(
+        isinstance(animal, str) for animal in animals
+    ):
+        abort(400, "animals must be a list of animal folder names")
+    for animal in animals:
+        progress = progress_registry.reporter(animal)
+        thread = threading.Thread(
+            target=zarrify_job,
+            args=(os.path.join(project_folder, animal), progress),
+            daemon=True,
+        )
+        thread.start()
+    return jsonify({"jobs": animals})
+
+
+@app.route("/progress", methods=["GET"])
+def progress_stream():
+    """
+    Server-Sent Events stream of the per-job, per-stage progress.
+
+    The optional `job` query argument restricts the stream to a single job,
+    the stream ends once that job is finished.
+    """
+    job_id = request.args.get("job")
+
+    def stream():
+        version = 0
+        while True:
+            version = progress_registry.wait_for_update(version, timeout=15)
+            snapshot = progress_registry.snapshot(job_id)
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if job_id is not None and snapshot.get(job_id, {}).get("finished"):
+                return
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def dataset_version(store_path, dataset):
+    """
+    Version of an IMAGE dataset, changing whenever the dataset is rewritten.
+
+    Parameters
+    ----------
+    store_path : str
+        Path to the zarr store of the animal.
+    dataset : str
+        Name of the dataset in the IMAGE group.
+
+    Returns
+    -------
+    int
+        The modification time of the dataset metadata (or of the archive for
+        zipped stores), in nanoseconds.
+    """
+    if os.path.isfile(store_path):
+        return os.stat(store_path).st_mtime_ns
+    zarray = os.path.join(store_path, "IMAGE", dataset, ".zarray")
+    try:
+        return os.stat(zarray).st_mtime_ns
+    except FileNotFoundError:
+        abort(404, f"No dataset IMAGE/{dataset} in {store_path}")
+
+
+def open_image_dataset(store_path, dataset, version):
+    """
+    Open an IMAGE dataset read-only.
+
+    The DATASET_CACHE_SIZE most recently used datasets are kept open, per
+    dataset version. The store of an evicted dataset is closed, releasing the
+    file handle of zipped stores.
+    """
+    key = (store_path, dataset, version)
+    with open_datasets_lock:
+        if key in open_datasets:
+            open_datasets.move_to_end(key)
+            return open_datasets[key][1]
+
+    root = open_animal(store_path, mode="r", consolidated=True)
+    try:
+        image = root["IMAGE"]
+        array = open_outlines(image) if dataset == "outlines" else image[dataset]
+    except KeyError:
+        close_animal(root)
+        abort(404, f"No dataset IMAGE/{dataset} in {store_path}")
+
+    with open_datasets_lock:
+        if key in open_datasets:
+            # Opened by another request in between
+            close_animal(root)
+            return open_datasets[key][1]
+        open_datasets[key] = (root, array)
+        while len(open_datasets) > DATASET_CACHE_SIZE:
+            evicted, _ = open_datasets.popitem(last=False)[1]
+            close_animal(evicted)
+    return array
+
+
+def to_display(data, dataset, display_range=None):
+    """
+    Convert a 2D region of an IMAGE dataset to an 8-bit image for display.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The region read from the dataset.
+    dataset : str
+        Name of the dataset, selecting the conversion.
+    display_range : list, optional
+        [min, max] intensities mapped to [0, 255] for raw images, written by
+        the raw ingest. Defaults to the 0.5 and 99.5 percentiles of the region
+        for stores ingested without it.
+
+    Returns
+    -------
+    np.ndarray
+        The uint8 image.
+    """
+    if dataset == "outlines":
+        return (data > 0).astype(np.uint8) * 255
+    if dataset == "masks":
+        # Scatter the labels over the grey levels so that neighbours differ
+        hashed = (data.astype(np.uint32) * np.uint32(2654435761)) >> np.uint32(24)
+        return np.where(data > 0, np.maximum(hashed, 1), 0).astype(np.uint8)
+    if data.dtype == np.uint8 and display_range is None:
+        return data
+    if display_range is None:
+        display_range = np.percentile(data, PERCENTILES)
+    low, high = display_range
+    scaled = (data.astype(np.float32) - low) * (255.0 / max(high - low, 1e-9))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=2048)
+def encode_region(store_path, dataset, t, level, x, y, image_format, version):
+    """
+    Read and encode a frame or a tile of an IMAGE dataset.
+
+    Only the chunks intersecting the requested region are read. The encoded
+    bytes are kept in an in-process LRU cache keyed by the dataset version.
+
+    Parameters
+    ----------
+    store_path : str
+        Path to the zarr store of the animal.
+    dataset : str
+        Name of the dataset in the IMAGE group.
+    t : int
+        Frame index.
+    level : int
+        Downsampling level, the image is subsampled by 2**level.
+    x, y : int or None
+        Tile column and row at that level. If None, the whole frame is encoded.
+    image_format : str
+        One of the keys of IMAGE_FORMATS.
+    version : int
+        Version of the dataset, see `dataset_version`.
+
+    Returns
+    -------
+    bytes
+        The encoded image.
+    """
+    array = open_image_dataset(store_path, dataset, version)
+    if not 0 <= t < array.shape[0]:
+        abort(404, "Frame out of bounds")
+    if level > max_level(array.shape):
+        abort(400, f"level must be at most {max_level(array.shape)}")
+    step = 2**level
+    if x is None:
+        region = (t, slice(None, None, step), slice(None, None, step))
+    else:
+        span = TILE_SIZE * step
+        region = (
+            t,
+            slice(y * span, (y + 1) * span, step),
+            slice(x * span, (x + 1) * span, step),
+        )
+    data = array[region]
+    if data.size == 0:
+        abort(404, "Tile out of bounds")
+
+    image = Image.fromarray(to_display(data, dataset, array.attrs.get("display_range")))
+    buffer = BytesIO()
+    image.save(buffer, format=IMAGE_FORMATS[image_format])
+    return buffer.getvalue()
+
+
+def max_level(shape):
+    """
+    Highest downsampling level of a (frames, height, width) dataset, at which
+    a frame is a single pixel.
+    """
+    return (max(shape[1:]) - 1).bit_length()
+
+
+def int_argument(name, default=0):
+    """
+    A non-negative integer query argument, aborting with 400 otherwise.
+    """
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, f"{name} must be an integer, got {value!r}")
+    if value < 0:
+        abort(400, f"{name} must be non-negative, got {value}")
+    return value
+
+
+def store_argument():
+    """
+    The `store` query argument, aborting with 400 if missing and 404 if the
+    store does not exist.
+    """
+    store_path = request.args.get("store")
+    if not store_path:
+        abort(400, "Missing store argument")
+    if not os.path.exists(store_path):
+        abort(404, f"No store {store_path}")
+    return store_path
+
+
+def image_response(level=None, x=None, y=None):
+    store_path = store_argument()
+    dataset = request.args.get("dataset", "raw")
+    t = int_argument("t")
+    if level is None:
+        level = int_argument("level")
+    image_format = request.args.get("format", "png").lower()
+    if dataset not in IMAGE_DATASETS or image_format not in IMAGE_FORMATS:
+        abort(
+            400, f"dataset must be in {IMAGE_DATASETS}, format in {list(IMAGE_FORMATS)}"
+        )
+
+    version = dataset_version(store_path, dataset)
+    key = (store_path, dataset, t, level, x, y, image_format, version)
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(encode_region(*key), mimetype=f"image/{image_format}")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+@app.route("/image/info", methods=["GET"])
+def image_info():
+    """
+    Shape, dtype and tile grid of the IMAGE datasets of an animal store.
+    """
+    store_path = store_argument()
+    root = open_animal(store_path, mode="r", consolidated=True)
+    try:
+        if "IMAGE" not in root:
+            abort(404, f"No IMAGE group in {store_path}")
+        image = root["IMAGE"]
+        info = {}
+        for dataset in IMAGE_DATASETS:
+            if dataset not in image:
+                continue
+            array = open_outlines(image) if dataset == "outlines" else image[dataset]
+            info[dataset] = {
+                "shape": array.shape,
+                "dtype": str(array.dtype),
+                "chunks": array.chunks,
+                "tile_size": TILE_SIZE,
+                "max_level": max_level(array.shape),
+            }
+    finally:
+        close_animal(root)
+    return jsonify(info)
+
+
+@app.route("/image/frame", methods=["GET"])
+def image_frame():
+    """
+    Frame `t` of an IMAGE dataset, subsampled by 2**level.
+    """
+    return image_response()
+
+
+@app.route("/image/tile/<int:level>/<int:y>/<int:x>", methods=["GET"])
+def image_tile(level, y, x):
+    """
+    Tile (y, x) of frame `t` of an IMAGE dataset at a downsampling level.
+    """
+    return image_response(level=level, x=x, y=y)
+
+
 if __name__ == "__main__":
     CORS(app)
-    app.run(port=5001)
+    app.run(port=5001, threaded=True)
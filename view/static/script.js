@@ -335,3 +335,50 @@ function runSelection() {
 
     console.log("Selected checkboxes: ", selectedValues);
 }
+
+function zarrifySelection() {
+    const checkboxContainer = document.getElementById('checkbox-container');
+    const checkboxes = checkboxContainer.querySelectorAll('input[type="checkbox"]:checked');
+    const animals = Array.from(checkboxes).map(checkbox => checkbox.value);
+    const project_folder = document.getElementById('project_folder').value;
+
+    fetch('http://127.0.0.1:5001/run_zarrification', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ project_folder, animals })
+    })
+        .then(response => response.json())
+        .then(data => watchProgress());
+}
+
+let progressSource = null;  // Single Server-Sent Events connection for all jobs
+
+function watchProgress() {
+    if (progressSource) {
+        return;
+    }
+    progressSource = new EventSource('http://127.0.0.1:5001/progress');
+    progressSource.onmessage = function (event) {
+        renderProgress(JSON.parse(event.data));
+    };
+}
+
+function renderProgress(jobs) {
+    const container = document.getElementById('progress-container');
+    container.innerHTML = '';
+
+    Object.entries(jobs).forEach(([job, state]) => {
+        const title = document.createElement('h4');
+        title.innerText = state.error ? `${job} (failed: ${state.error})` : job;
+        container.appendChild(title);
+
+        state.stages.forEach(stage => {
+            const line = document.createElement('div');
+            const percent = stage.percent === null ? '?' : stage.percent.toFixed(0);
+            const eta = stage.eta_s === null ? '?' : `${stage.eta_s.toFixed(0)} s`;
+            line.innerText = `${stage.stage}: ${stage.done}/${stage.total} (${percent}%) `
+                + `${stage.frames_per_s.toFixed(1)} frames/s, ${stage.mb_per_s.toFixed(1)} MB/s, ETA ${eta}`;
+            container.appendChild(line);
+        });
+    });
+}
@@ -1,15 +1,40 @@
 from pathlib import Path
-from tqdm import tqdm
 import zarr
 import glob
 import os
 import numpy as np
 import numcodecs
 
-import scipy.io as spio
 import warnings
 from copy import deepcopy
-from skimage.io import imread, imsave
+
+# tqdm, scipy.io and skimage.io take most of the import time of this module,
+# they are imported by the functions using them so that the command line
+# tools only pay for them when they ingest data
+
+from progress import NULL_PROGRESS
+from averages import AVERAGES_GROUP, compute_averages, create_running_averages
+from instrumentation import RunReport, profiled
+from frame_index import raw_sequence, sequence_frames
+from acquisition import ACQUISITION_KEY, read_acquisition
+from intensity import IntensityConverter, check_policy
+from cell_statistics import STATISTICS_GROUP, compute_cell_statistics
+from segmentation import (
+    create_packed_outlines,
+    label_bounding_boxes,
+    label_chunks,
+    label_codecs,
+    outlines_from_masks,
+    write_label_index,
+)
+from tensors import FRAME_INDEX, TIME_INDEX, frame_ranges, hapf_ranges
+from animal_store import (
+    consolidate_animal,
+    open_animal,
+    require_animal_groups,
+    require_subgroup,
+    structure_lock,
+)
 
 MAPPING_KEY = {
     "xyStart": ["xStart", "yStart"],
@@ -56,7 +81,9 @@ def format_4_decimals(num):
         )
 
 
-def save_stack(folder_path, base_name, stack, extension="png"):
+def save_stack(
+    folder_path, base_name, stack, extension="png", progress=None, stage="save"
+):
     """
     Save a 3D image stack as individual 2D image files.
 
@@ -76,20 +103,40 @@ def save_stack(folder_path, base_name, stack, extension="png"):
 
     stack : numpy.ndarray
         3D image stack where the first dimension represents the number of 2D slices.
+
+    progress : ProgressReporter, optional
+        Reporter receiving one update per saved frame. Default is None (no reporting).
+
+    stage : str, optional
+        Name of the stage reported to `progress`. Default is "save".
     """
-    global current_progress
+    from skimage.io import imsave
+    from tqdm import tqdm
+
+    progress = progress or NULL_PROGRESS
+    progress.start(stage, stack.shape[0])
     for i in tqdm(range(stack.shape[0])):
-        current_progress = int((i / (stack.shape[0] - 1)) * 100)
         frame_number = format_4_decimals(i + 1)
         filename = f"{base_name}_{frame_number}.{extension}"
         output_file = os.path.join(folder_path, filename)
         with warnings.catch_warnings():
             warnings.simplefilter("ignore", category=UserWarning)
             imsave(output_file, stack[i])
+        progress.advance(stage, 1, stack[i].nbytes)
+    progress.finish(stage)
 
 
 def load_stack(
-    folder_path: list, motif: str, expected_size=None, as_stack=True
+    folder_path: list,
+    motif: str,
+    expected_size=None,
+    as_stack=True,
+    progress=None,
+    stage="load",
+    on_gap="skip",
+    on_mismatch="fail",
+    memmap=True,
+    finish=True,
 ) -> (list, np.array):
     """
     Load a sequence of image files into a stack (3D array) or a list of 2D arrays.
@@ -104,10 +151,27 @@ def load_stack(
         A string that specifies the pattern to match files.
         For example, '*.png' would match all PNG files in the specified directory.
     expected_size : tuple, optional
-        The expected size of each image. If provided, only images of this size will be included in the output.
-        Default is None.
+        The expected size of each image. Default is None, the most common size.
     as_stack : bool, optional
         Whether to return the images as a 3D array (True) or as a list of 2D arrays (False). Default is True.
+    progress : ProgressReporter, optional
+        Reporter receiving one update per decoded frame. Default is None (no reporting).
+    stage : str, optional
+        Name of the stage reported to `progress`. Default is "load".
+    on_gap : str, optional
+        "skip", "pad" or "fail" on missing frame numbers, see
+        `frame_index.sequence_frames`. Default is "skip".
+    on_mismatch : str, optional
+        "skip", "pad" or "fail" on frames of another size or dtype, checked
+        from the file headers before decoding. Default is "fail".
+    memmap : bool, optional
+        Whether to read uncompressed tifs through a memory map, copied once
+        into the stack, instead of decoding them into a temporary array.
+        Compressed files are decoded. Default is True.
+    finish : bool, optional
+        Whether to finish the stage of `progress` once the frames are loaded,
+        False for a caller still writing them under the same stage. Default
+        is True.
 
     Returns
     -------
@@ -118,41 +182,70 @@ def load_stack(
         If 'as_stack' is False, a list of 2D numpy arrays with each element representing an individual image.
 
     """
-    # Fetching paths
-    global current_progress  # Declare it as a global variable
-    files = sorted(glob.glob(os.path.join(folder_path, motif)))
+    from tqdm import tqdm
+
+    progress = progress or NULL_PROGRESS
+    # Ordering the frames numerically and checking their headers
+    with progress.timer(stage, "headers"):
+        sequence = sequence_frames(
+            folder_path,
+            motif,
+            expected_size=expected_size,
+            on_gap=on_gap,
+            on_mismatch=on_mismatch,
+        )
+    files = sequence.files
     print(f"Found {len(files)} images matching '{motif}'")
     # Importing individual frames
-
-    pbar = tqdm(files, position=0, leave=True)
-    frames = []
-
-    for i, file in enumerate(pbar):  # Add enumerate to get index i
-        img = np.array(imread(file))
-        if expected_size and img.shape == expected_size:
-            frames.append(img)
+    progress.start(stage, len(sequence))
+    if not len(sequence) and as_stack:
+        if finish:
+            progress.finish(stage)
+        return 0
+    # The headers give the size of the movie: the frames are decoded in place
+    # instead of being stacked (and copied) at the end
+    if as_stack:
+        movie = np.empty((len(sequence),) + sequence.shape, dtype=sequence.dtype)
+    else:
+        movie = []
+
+    pbar = tqdm(range(len(sequence)), position=0, leave=True)
+    for i in pbar:
+        with progress.timer(stage, "decode"):
+            img = sequence.read(i, memmap=memmap)
+        if sequence.paths[i] is not None:
+            progress.record(stage, bytes_read=os.path.getsize(sequence.paths[i]))
+        if as_stack:
+            movie[i] = img
         else:
-            frames.append(img)
+            movie.append(np.array(img))
 
         # Update progress
-        current_progress = (i / len(files)) * 100
-    if as_stack:
-        if frames:
-            movie = np.stack(frames, axis=0)
-        else:
-            return 0
-    else:
-        movie = frames
+        progress.advance(stage, 1, img.nbytes)
+    if finish:
+        progress.finish(stage)
 
     return [files, movie]
 
 
 def extract_and_store_data(
-    data_path, motif, dataset_name, group, height, width, extension="png"
+    data_path,
+    motif,
+    dataset_name,
+    group,
+    height,
+    width,
+    extension="png",
+    progress=None,
+    on_gap="skip",
+    dtype_policy="cast",
 ):
     """
     Load and store data from a specified path into a zarr group.
 
+    The dataset is allocated from the file headers and filled frame by frame,
+    each frame converted to the dtype of `dtype_policy` as it is written.
+
     Parameters:
     -----------
     data_path : str
@@ -165,24 +258,501 @@ def extract_and_store_data(
         Height of the images.
     width : int
         Width of the images.
+    progress : ProgressReporter, optional
+        Reporter receiving the loading progress under the `dataset_name` stage.
+    on_gap : str, optional
+        Policy on missing frames, see `load_stack`. Default is "skip".
+    dtype_policy : str, optional
+        "cast" to uint8 (wrapping values above 255), "native" or "rescale" to
+        uint8 between percentiles of the movie, see
+        `intensity.IntensityConverter`. Default is "cast".
 
     Returns:
     --------
-    data : np.ndarray
-        Loaded and processed data.
+    zarr.core.Array
+        The stored dataset.
     """
+    from tqdm import tqdm
+
     print(f"Extracting {dataset_name}")
-    data = load_stack(data_path, motif=f"{motif}*.{extension}", as_stack=True)[
-        1
-    ].astype(np.uint8)
-    group.create_dataset(
-        dataset_name, data=data, dtype=data.dtype, chunks=(1, height, width)
+    progress = progress or NULL_PROGRESS
+    with progress.timer(dataset_name, "headers"):
+        sequence = sequence_frames(
+            data_path,
+            f"{motif}*.{extension}",
+            expected_size=(height, width),
+            on_gap=on_gap,
+        )
+    print(f"Found {len(sequence.files)} images matching '{motif}*.{extension}'")
+    if not len(sequence):
+        raise FileNotFoundError(f"No {motif}*.{extension} file in {data_path}")
+    with progress.timer(dataset_name, "percentiles"):
+        converter = IntensityConverter(sequence, dtype_policy)
+
+    progress.start(dataset_name, len(sequence))
+    dataset = group.create_dataset(
+        dataset_name,
+        shape=(len(sequence), height, width),
+        dtype=converter.dtype,
+        chunks=(1, height, width),
     )
-    return data
+    dataset.attrs.update(converter.attributes())
+    for i in tqdm(range(len(sequence)), position=0, leave=True):
+        with progress.timer(dataset_name, "decode"):
+            frame = converter(sequence.read(i))
+        if sequence.paths[i] is not None:
+            progress.record(dataset_name, bytes_read=os.path.getsize(sequence.paths[i]))
+        with progress.timer(dataset_name, "write"):
+            dataset[i] = frame
+        progress.advance(dataset_name, 1, frame.nbytes)
+    progress.record(dataset_name, bytes_written=dataset.nbytes_stored)
+    progress.finish(dataset_name)
+    return dataset
+
+
+def extract_and_store_raw(
+    raw_image_path,
+    group,
+    zarr_path,
+    animal_name,
+    averages=None,
+    progress=None,
+    on_gap="skip",
+    on_mismatch="fail",
+    dtype_policy="native",
+    memmap=True,
+):
+    """
+    Stream the raw tif frames, or the pages of a movie file, into the zarr
+    group in a single pass.
+
+    Each frame is decoded once, written in `raw`, saved back as a tif for the
+    pipeline and fed to the time-average accumulators, so that only one frame
+    (plus the accumulators) is in memory at a time. The dataset is allocated
+    from the file headers, in the native dtype of the frames.
+
+    Parameters:
+    -----------
+    raw_image_path : str
+        Path to the folder containing the raw tif images, or to a multi-page
+        tif / OME-TIFF movie, see `frame_index.raw_sequence`.
+    group : zarr.hierarchy.Group
+        Zarr group where the `raw` dataset is created (usually IMAGE).
+    zarr_path : str
+        Path to the zarr directory, where the tif frames are saved.
+    animal_name : str
+        Base name of the saved tif frames.
+    averages : list, optional
+        Time-averaging windows stored under `averages/<window>`, see
+        `averages.parse_window`. Default is None (no averages).
+    progress : ProgressReporter, optional
+        Reporter receiving the "raw" stage.
+    on_gap, on_mismatch : str, optional
+        Policies on missing and mis-sized frames, see `load_stack`.
+    dtype_policy : str, optional
+        "native" keeps the dtype of the files, "rescale" maps the 0.5 and 99.5
+        percentiles of sampled frames to [0, 255] in uint8 and "cast" wraps
+        the values into uint8, see `intensity.IntensityConverter`. The policy
+        is stored in the attributes of `raw`, with the pixel size and time
+        step of the movie, see `acquisition.read_acquisition`. The uint8
+        policies fail if the tifs would be saved over the raw frames, e.g.
+        with the animal folder as `zarr_path`. Default is "native".
+    memmap : bool, optional
+        Whether to memory-map uncompressed tifs, handing views of the files
+        to the zarr writer without decoding them. Compressed files are
+        decoded. Default is True.
+
+    Returns:
+    --------
+    zarr.core.Array or None
+        The raw dataset, or None if there is no tif image.
+    """
+    progress = progress or NULL_PROGRESS
+    # The headers give the shape of the movie before any frame is decoded
+    with progress.timer("raw", "headers"):
+        sequence = raw_sequence(raw_image_path, on_gap=on_gap, on_mismatch=on_mismatch)
+    print(f"Found {len(sequence)} raw frames in {raw_image_path}")
+    if not len(sequence):
+        return None
+    try:
+        return stream_raw(
+            sequence,
+            group,
+            zarr_path,
+            animal_name,
+            averages=averages,
+            progress=progress,
+            dtype_policy=dtype_policy,
+            memmap=memmap,
+        )
+    finally:
+        sequence.close()
+
+
+def stream_raw(
+    sequence,
+    group,
+    zarr_path,
+    animal_name,
+    averages=None,
+    progress=None,
+    dtype_policy="native",
+    memmap=True,
+):
+    """
+    Write the frames of a sequence in `raw`, see `extract_and_store_raw`.
+    """
+    from skimage.io import imsave
+    from tqdm import tqdm
+
+    progress = progress or NULL_PROGRESS
+    check_policy(dtype_policy)
+    n_frames = len(sequence)
+
+    # Save raw images as a list of tif files for the pipeline
+    outputs = [
+        os.path.join(zarr_path, f"{animal_name}_{format_4_decimals(i + 1)}.tif")
+        for i in range(n_frames)
+    ]
+    last_read = {}
+    for i, source in enumerate(sequence.paths):
+        if source is not None:
+            last_read[os.path.realpath(source)] = i
+    # The source frames are never overwritten by converted ones
+    if dtype_policy != "native" and any(
+        os.path.realpath(output) in last_read for output in outputs
+    ):
+        raise ValueError(
+            f"The {dtype_policy} raw tifs would be saved over the raw frames in "
+            f"{zarr_path}: use the native dtype policy or another output folder"
+        )
+
+    # First pass over a sample of the frames for the rescaling percentiles
+    with progress.timer("raw", "percentiles"):
+        converter = IntensityConverter(sequence, dtype_policy)
+
+    print("Extracting raw images")
+    height, width = sequence.shape
+    progress.start("raw", n_frames)
+    raw = group.create_dataset(
+        "raw",
+        shape=(n_frames, height, width),
+        dtype=converter.dtype,
+        chunks=(1, height, width),
+    )
+    raw.attrs.update(
+        converter.attributes(),
+        bits_per_sample=sequence.bits,
+        acquisition=read_acquisition(sequence.files[0]),
+    )
+    accumulators = create_running_averages(
+        group, averages or [], n_frames, height, width
+    )
+
+    # A tif saved over the source of a frame not read yet (e.g. frames numbered
+    # from 0 in the output folder) would replace that frame: the tifs are then
+    # saved from `raw` once every frame is read
+    deferred = any(
+        last_read.get(os.path.realpath(output), i) > i
+        for i, output in enumerate(outputs)
+    )
+    # Sources rewritten by this run are decoded: a memory-mapped frame kept by
+    # a sliding window would change with its file
+    rewritten = {
+        os.path.realpath(output)
+        for i, output in enumerate(outputs)
+        if os.path.realpath(output) in last_read
+        and not (
+            converter.policy == "native"
+            and sequence.paths[i] is not None
+            and os.path.realpath(sequence.paths[i]) == os.path.realpath(output)
+        )
+    }
+
+    def save_tif(i, frame):
+        source = sequence.paths[i]
+        in_place = (
+            source is not None
+            and os.path.exists(outputs[i])
+            and os.path.samefile(source, outputs[i])
+        )
+        # A frame is not saved onto its own file, which already holds it
+        if in_place and converter.policy == "native":
+            return
+        with progress.timer("raw", "tif"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=UserWarning)
+            imsave(outputs[i], frame)
+        progress.record("raw", bytes_written=os.path.getsize(outputs[i]))
+
+    for i in tqdm(range(n_frames), position=0, leave=True):
+        source = sequence.paths[i]
+        mapped = memmap and (
+            source is None or os.path.realpath(source) not in rewritten
+        )
+        with progress.timer("raw", "decode"):
+            frame = converter(sequence.read(i, memmap=mapped))
+        progress.record("raw", bytes_read=sequence.nbytes(i))
+        with progress.timer("raw", "write"):
+            raw[i] = frame
+        if not deferred:
+            save_tif(i, frame)
+
+        with progress.timer("raw", "averages"):
+            for accumulator in accumulators:
+                accumulator.add(frame)
+        progress.advance("raw", 1, frame.nbytes)
+
+    if deferred:
+        for i in range(n_frames):
+            save_tif(i, raw[i])
+
+    for accumulator in accumulators:
+        accumulator.finish()
+    progress.record("raw", bytes_written=raw.nbytes_stored)
+    progress.finish("raw")
+    return raw
+
+
+def extract_and_store_masks(
+    data_path,
+    group,
+    height,
+    width,
+    mask_storage="labels",
+    progress=None,
+    on_gap="skip",
+):
+    """
+    Load label masks from `roi*` files and store them into a zarr group.
+
+    Parameters:
+    -----------
+    data_path : str
+        Path to the folder containing the mask files.
+    group : zarr.hierarchy.Group
+        Zarr group where the `masks` dataset will be stored.
+    height : int
+        Height of the images.
+    width : int
+        Width of the images.
+    mask_storage : str, optional
+        "labels" keeps the native label dtype (e.g. uint16), compresses the
+        masks with delta + zstd in tiles and writes a per-frame bounding box
+        index of the labels in `masks_index`. "dense" casts to uint8 with the default
+        compressor, wrapping labels above 255. Default is "labels".
+    progress : ProgressReporter, optional
+        Reporter receiving the loading progress under the "masks" stage.
+    on_gap : str, optional
+        Policy on missing frames, see `load_stack`. Default is "skip".
+
+    Returns:
+    --------
+    masks : np.ndarray or zarr.core.Array
+        Loaded masks, or the stored dataset for "dense".
+    """
+    if mask_storage == "dense":
+        return extract_and_store_data(
+            data_path,
+            "roi",
+            "masks",
+            group,
+            height,
+            width,
+            progress=progress,
+            on_gap=on_gap,
+        )
+    if mask_storage != "labels":
+        raise ValueError(
+            f"Unknown mask storage {mask_storage}, use 'labels' or 'dense'"
+        )
+
+    print("Extracting masks")
+    progress = progress or NULL_PROGRESS
+    loaded = load_stack(
+        data_path,
+        motif="roi*.png",
+        expected_size=(height, width),
+        as_stack=True,
+        progress=progress,
+        stage="masks",
+        on_gap=on_gap,
+        finish=False,
+    )
+    if not loaded:
+        progress.finish("masks")
+        raise FileNotFoundError(f"No roi*.png file in {data_path}")
+    masks = loaded[1]
+    with progress.timer("masks", "write"):
+        dataset = group.create_dataset(
+            "masks",
+            data=masks,
+            dtype=masks.dtype,
+            chunks=label_chunks(height, width),
+            **label_codecs(masks.dtype),
+        )
+    with progress.timer("masks", "index"):
+        write_label_index(group, [label_bounding_boxes(mask) for mask in masks])
+    progress.record("masks", bytes_written=dataset.nbytes_stored)
+    progress.finish("masks")
+    return masks
+
+
+def create_outlines_dataset(group, shape, outlines_storage="dense"):
+    """
+    Create an empty outlines dataset, dense or bit-packed.
+
+    Parameters:
+    -----------
+    group : zarr.hierarchy.Group
+        Zarr group where the `outlines` dataset is created.
+    shape : tuple
+        Shape (frames, height, width) of the outlines.
+    outlines_storage : str, optional
+        "dense" stores one uint8 per pixel, "packed" stores 8 pixels per byte,
+        see `segmentation.PackedOutlines`. Default is "dense".
+
+    Returns:
+    --------
+    zarr.core.Array or PackedOutlines
+        The dataset, to be filled frame by frame.
+    """
+    if outlines_storage == "packed":
+        return create_packed_outlines(group, shape)
+    if outlines_storage != "dense":
+        raise ValueError(
+            f"Unknown outlines storage {outlines_storage}, use 'dense' or 'packed'"
+        )
+    return group.create_dataset(
+        "outlines", shape=shape, dtype=np.uint8, chunks=(1,) + tuple(shape[1:])
+    )
+
+
+def extract_and_store_outlines(
+    outlines_path,
+    group,
+    height,
+    width,
+    outlines_storage="dense",
+    progress=None,
+    on_gap="skip",
+):
+    """
+    Load outlines from `seg*` files and store them, dense or bit-packed.
+
+    Parameters:
+    -----------
+    outlines_path : str
+        Path to the folder containing the `seg*.png` files.
+    group : zarr.hierarchy.Group
+        Zarr group where the `outlines` dataset is created.
+    height : int
+        Height of the images.
+    width : int
+        Width of the images.
+    outlines_storage : str, optional
+        See `create_outlines_dataset`. Default is "dense".
+    progress : ProgressReporter, optional
+        Reporter receiving the loading progress under the "outlines" stage.
+    on_gap : str, optional
+        Policy on missing frames, see `load_stack`. Default is "skip".
+
+    Returns:
+    --------
+    zarr.core.Array or PackedOutlines
+        The outlines dataset.
+    """
+    if outlines_storage == "dense":
+        extract_and_store_data(
+            outlines_path,
+            "seg",
+            "outlines",
+            group,
+            height,
+            width,
+            progress=progress,
+            on_gap=on_gap,
+        )
+        return group["outlines"]
+
+    print("Extracting outlines")
+    progress = progress or NULL_PROGRESS
+    loaded = load_stack(
+        outlines_path,
+        motif="seg*.png",
+        expected_size=(height, width),
+        as_stack=True,
+        progress=progress,
+        stage="outlines",
+        on_gap=on_gap,
+        finish=False,
+    )
+    if not loaded:
+        progress.finish("outlines")
+        raise FileNotFoundError(f"No seg*.png file in {outlines_path}")
+    data = loaded[1]
+    with progress.timer("outlines", "write"):
+        outlines = create_outlines_dataset(group, data.shape, outlines_storage)
+        outlines[:] = data
+    progress.finish("outlines")
+    return outlines
+
+
+def derive_and_store_outlines(
+    group, height, width, outlines_storage="dense", progress=None
+):
+    """
+    Derive the outlines from the stored masks instead of decoding `seg*` files.
+
+    The masks are read back frame by frame, so that memory stays bounded.
+
+    Parameters:
+    -----------
+    group : zarr.hierarchy.Group
+        Zarr group holding the `masks` dataset, where `outlines` is created.
+    height : int
+        Height of the images.
+    width : int
+        Width of the images.
+    outlines_storage : str, optional
+        See `create_outlines_dataset`. Default is "dense".
+    progress : ProgressReporter, optional
+        Reporter receiving the derivation progress under the "outlines" stage.
+
+    Returns:
+    --------
+    zarr.core.Array or PackedOutlines
+        The outlines dataset.
+    """
+    progress = progress or NULL_PROGRESS
+    print("Deriving outlines from masks")
+    masks = group["masks"]
+    outlines = create_outlines_dataset(group, masks.shape, outlines_storage)
+    progress.start("outlines", masks.shape[0])
+    for frame in range(masks.shape[0]):
+        with progress.timer("outlines", "derive"):
+            derived = outlines_from_masks(masks[frame])
+        with progress.timer("outlines", "write"):
+            outlines[frame] = derived
+        progress.advance("outlines", 1, height * width)
+    progress.finish("outlines")
+    return outlines
 
 
 def store_data_in_zarr(
-    zarr_path, raw_image_path, outlines_path, masks_path, sap_folder
+    zarr_path,
+    raw_image_path,
+    outlines_path,
+    masks_path,
+    sap_folder,
+    progress=None,
+    mask_storage="labels",
+    outlines_source="seg",
+    outlines_storage="dense",
+    cell_statistics=False,
+    n_workers=None,
+    averages=None,
+    on_gap="skip",
+    raw_dtype="native",
 ):
     """
     Initialize a zarr directory, create groups, and store raw images, outlines, and masks.
@@ -192,11 +762,45 @@ def store_data_in_zarr(
     zarr_path : str
         Path to the zarr directory to be created.
     raw_image_path : str
-        Path to the folder containing raw images.
+        Path to the folder containing raw images, or to a multi-page tif /
+        OME-TIFF movie. The pixel size and time step found in the tif
+        metadata are stored in the `acquisition` attribute of METADATA.
     outlines_path : str
         Path to the folder containing image outlines.
     masks_path : str
         Path to the folder containing image masks.
+    progress : ProgressReporter, optional
+        Reporter receiving the "raw", "averages", "outlines" and "masks" stages.
+    mask_storage : str, optional
+        Storage of the masks, see `extract_and_store_masks`. Default is "labels".
+    outlines_source : str, optional
+        "seg" decodes the outlines from the `seg*.png` files of `outlines_path`,
+        "masks" derives them from the stored masks, skipping the decode of the
+        seg files entirely. Default is "seg".
+    outlines_storage : str, optional
+        "dense" (uint8 per pixel) or "packed" (8 pixels per byte, read through
+        `segmentation.open_outlines`). Default is "dense".
+    cell_statistics : bool, optional
+        Whether to compute the per-frame area, centroid, bounding box and
+        perimeter of every cell into `TRACKING/cell_statistics`, see
+        `cell_statistics.compute_cell_statistics`. Default is False.
+    n_workers : int, optional
+        Number of processes computing the cell statistics. Default is the
+        number of CPUs.
+    averages : list, optional
+        Time-averaging windows of the raw movie, e.g. ["block_24", "sliding_5"],
+        computed in the same pass as the raw ingest and stored under
+        `IMAGE/averages/<window>`, see `averages.parse_window`. If the raw
+        movie is already stored, the missing windows are computed from it.
+        Default is None (no averages).
+    on_gap : str, optional
+        What to do with missing frame numbers in the raw, mask and outline
+        folders: "skip" them, "pad" them with blank frames or "fail" before
+        decoding, see `frame_index.sequence_frames`. Default is "skip".
+    raw_dtype : str, optional
+        dtype policy of the raw movie: "native", "rescale" (uint8 between
+        percentiles) or "cast" (uint8, wrapping), see
+        `extract_and_store_raw`. Default is "native".
 
     Note:
     -----
@@ -204,53 +808,87 @@ def store_data_in_zarr(
     the raw images as a sequence of tif images for compatibility with the pipeline
     """
 
-    # Create the output folder
-    try:
-        # Attempt to create the output folder
-        animal = zarr.open_group(zarr_path, mode="w-")
-    except zarr.errors.ContainsGroupError:
-        # If a group already exists, open it in read-write mode
-        animal = zarr.open_group(zarr_path, mode="a")
+    # Create the output folder, or open it if it already exists
+    animal = open_animal(zarr_path, mode="a")
     animal_name = os.path.basename(os.path.normpath(zarr_path))
 
     # Create the first level structure if it doesn't exist
-    groups = ["METADATA", "TENSORS", "IMAGE", "TRACKING"]
-    for group in groups:
-        if group in animal:
-            continue
-        animal.create_groups(group)
+    require_animal_groups(animal)
 
     sap_dest = os.path.join(zarr_path, str(sap_folder).split("/")[-1])
     print("sap_dest   ", sap_dest)
 
-    # Load and store raw images
-    print("Extracting raw images")
-    raw_image = load_stack(raw_image_path, motif="*.tif", as_stack=True)[1].astype(
-        np.uint8
-    )
-    if isinstance(raw_image, int):
-        return
-    width, height = raw_image.shape[1:]
-    if "raw" not in animal.IMAGE:
-        animal.IMAGE.create_dataset(
-            "raw", data=raw_image, dtype=raw_image.dtype, chunks=(1, height, width)
+    # Load and store raw images. Datasets are created under their lock so that
+    # a concurrent ingest of the same animal waits, then skips them.
+    with structure_lock(animal.IMAGE, "raw"):
+        if "raw" not in animal.IMAGE:
+            raw = extract_and_store_raw(
+                raw_image_path,
+                animal.IMAGE,
+                zarr_path,
+                animal_name,
+                averages=averages,
+                progress=progress,
+                on_gap=on_gap,
+                dtype_policy=raw_dtype,
+            )
+            if raw is None:
+                return
+            # The pixel size and time step of the movie, for the SAP config
+            with structure_lock(animal.METADATA):
+                animal.METADATA.attrs[ACQUISITION_KEY] = raw.attrs[ACQUISITION_KEY]
+        elif averages:
+            with structure_lock(animal.IMAGE, AVERAGES_GROUP):
+                compute_averages(animal.IMAGE, averages, progress=progress)
+    height, width = animal.IMAGE.raw.shape[1:]
+
+    if outlines_source not in ["seg", "masks"]:
+        raise ValueError(
+            f"Unknown outlines source {outlines_source}, use 'seg' or 'masks'"
         )
 
-        # Save raw images as a list of tif files for the pipeline
-        save_stack(zarr_path, animal_name, raw_image, extension="tif")
+    # Load and store masks
+    with structure_lock(animal.IMAGE, "masks"):
+        if "masks" not in animal.IMAGE:
+            masks = extract_and_store_masks(
+                masks_path,
+                animal.IMAGE,
+                height,
+                width,
+                mask_storage=mask_storage,
+                progress=progress,
+                on_gap=on_gap,
+            )
 
     # Load and store outlines
-    if "outlines" not in animal.IMAGE:
-        print(outlines_path)
-        outlines = extract_and_store_data(
-            outlines_path, "seg", "outlines", animal.IMAGE, height, width
-        )
-
-    # Load and store masks
-    if "masks" not in animal.IMAGE:
-        masks = extract_and_store_data(
-            masks_path, "roi", "masks", animal.IMAGE, height, width
-        )
+    with structure_lock(animal.IMAGE, "outlines"):
+        if "outlines" not in animal.IMAGE and outlines_source == "masks":
+            outlines = derive_and_store_outlines(
+                animal.IMAGE,
+                height,
+                width,
+                outlines_storage=outlines_storage,
+                progress=progress,
+            )
+        elif "outlines" not in animal.IMAGE:
+            print(outlines_path)
+            outlines = extract_and_store_outlines(
+                outlines_path,
+                animal.IMAGE,
+                height,
+                width,
+                outlines_storage=outlines_storage,
+                progress=progress,
+                on_gap=on_gap,
+            )
+
+    # Compute the cell statistics from the stored masks and outlines
+    if cell_statistics:
+        progress = progress or NULL_PROGRESS
+        with structure_lock(animal.TRACKING, STATISTICS_GROUP), progress.timer(
+            "cell_statistics", "compute"
+        ):
+            compute_cell_statistics(zarr_path, animal.TRACKING, n_workers=n_workers)
 
 
 def format_xyStart_values(value):
@@ -295,8 +933,9 @@ def convert_coordinates_to_numpy(coordinates_matlab):
     """
     Converts a 2D MATLAB array of coordinates into a 3D NumPy array.
 
-    The function reshapes the original MATLAB array, transposes it to match NumPy's indexing order,
-    and returns the transformed array.
+    The MATLAB cell array (a NumPy object array of [x, y] arrays) is joined in
+    a single vectorized call, then its last axis is moved first to match
+    NumPy's indexing order. A numeric array of shape (w, h, 2) is used as is.
 
     Parameters
     ----------
@@ -313,21 +952,45 @@ def convert_coordinates_to_numpy(coordinates_matlab):
     This function is specifically designed to work with a 2D array of coordinates from MATLAB. The input is assumed
     to have a specific structure (array of arrays of coordinates). Deviations from this structure may result in unexpected outcomes.
     """
-    # Calculate the dimensions based on the input
-    w, h = coordinates_matlab.shape
+    coordinates_matlab = np.asarray(coordinates_matlab)
 
-    # Convert the array of arrays to a 3D numpy array
-    coordinates_numpy = np.array(
-        [coordinate for row in coordinates_matlab for coordinate in row]
-    )
+    if coordinates_matlab.dtype == object:
+        # Concatenate the flattened cells in one call (np.stack would add an
+        # axis to every cell first), then restore the (w, h, 2) shape
+        w, h = coordinates_matlab.shape
+        coordinates_numpy = np.concatenate(coordinates_matlab.ravel()).reshape(w, h, 2)
+    else:
+        coordinates_numpy = coordinates_matlab
 
-    # Reshape the 3D array to the original shape (w, h, 2)
-    coordinates_numpy = coordinates_numpy.reshape(w, h, 2)
+    # Move the coordinate axis first to get the desired shape (2, w, h)
+    return np.moveaxis(coordinates_numpy, 2, 0)
 
-    # Transpose the axes to get the desired shape (2, w, h)
-    coordinates_numpy = np.transpose(coordinates_numpy, (2, 0, 1))
 
-    return coordinates_numpy
+def grid_origin(coordinates):
+    """
+    Find the box of a grid whose coordinates are (0, 0).
+
+    On a regular grid x only depends on the column and y on the row, so the
+    first row and column are enough to find the origin. The full grid is only
+    scanned if that guess does not hold.
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        The grid coordinates, of shape (2, w, h).
+
+    Returns
+    -------
+    tuple
+        The (row, column) indices of the origin box.
+    """
+    columns = np.flatnonzero(coordinates[0, 0, :] == 0)
+    rows = np.flatnonzero(coordinates[1, :, 0] == 0)
+    if len(rows) and len(columns) and not coordinates[:, rows[0], columns[0]].any():
+        return int(rows[0]), int(columns[0])
+
+    y, x = np.nonzero(~coordinates.any(axis=0))
+    return int(y[0]), int(x[0])
 
 
 def format_coordinates_values(coordinates):
@@ -337,28 +1000,19 @@ def format_coordinates_values(coordinates):
     Parameters
     ----------
     coordinates : numpy.ndarray
-        The array containing coordinate information.
+        The MATLAB array containing coordinate information, or the grid
+        coordinates of shape (2, w, h) returned by `convert_coordinates_to_numpy`.
 
     Returns
     -------
     list
         A list of two integers representing the coordinates where all values are zero.
-
-    Notes
-    -----
-    This function assumes that the array is transformed into a NumPy array before being passed in.
     """
-    values = []
-    # Convert coordinates to NumPy array
-    coordinates = convert_coordinates_to_numpy(coordinates)
+    if coordinates.dtype == object:
+        coordinates = convert_coordinates_to_numpy(coordinates)
 
-    # Find the indices where all elements along the axis are zero
-    indices = np.all(coordinates == 0, axis=0)
-    y, x = np.where(indices)
-
-    values.append(int(x[0]))
-    values.append(int(y[0]))
-    return values
+    y, x = grid_origin(coordinates)
+    return [x, y]
 
 
 def format_frame_array_values(frame_array):
@@ -473,7 +1127,11 @@ def field_formatted(key: str, value):
 
 
 def extract_AOT_results_folder(
-    group: zarr.hierarchy.Group, SAP_results_folder, quantities, verbose=True
+    group: zarr.hierarchy.Group,
+    SAP_results_folder,
+    quantities,
+    verbose=True,
+    progress=None,
 ):
     """
     Extracts information from .mat files in the AveragesOverTime (AOT) folder and stores them in a zarr group.
@@ -492,6 +1150,8 @@ def extract_AOT_results_folder(
         The list of quantities to be extracted from the .mat files.
     verbose : bool, optional
         If True, the function will print warnings when a quantity is not found in the backup file.
+    progress : ProgressReporter, optional
+        Reporter receiving one update per extracted .mat file under the "AOT" stage.
 
     Raises
     ------
@@ -505,7 +1165,9 @@ def extract_AOT_results_folder(
 
     """
     AOT_folder = find_AOT_folder(SAP_results_folder)
-    traverse_and_extract_AOT(group, AOT_folder, quantities, verbose=True)
+    traverse_and_extract_AOT(
+        group, AOT_folder, quantities, verbose=True, progress=progress
+    )
 
 
 def find_AOT_folder(SAP_results_folder):
@@ -545,7 +1207,9 @@ def find_AOT_folder(SAP_results_folder):
     return AOT_folder[0]
 
 
-def traverse_and_extract_AOT(group, AOT_folder, quantities, verbose=True):
+def traverse_and_extract_AOT(
+    group, AOT_folder, quantities, verbose=True, progress=None
+):
     """
     Traverse the AOT folder and extract relevant AOT information into a Zarr group.
 
@@ -559,28 +1223,34 @@ def traverse_and_extract_AOT(group, AOT_folder, quantities, verbose=True):
         A list of quantities that need to be extracted from the AOT files.
     verbose : bool, optional
         Whether to display verbose messages. Default is True.
+    progress : ProgressReporter, optional
+        Reporter receiving one update per extracted .mat file under the "AOT" stage.
 
     Notes
     -----
     The function walks through the AOT folder to find relevant `.mat` files.
     """
-    for root, _, files in os.walk(AOT_folder):
-        for file in files:
-            if file.endswith(".mat") and "alltime" not in file:
-                fullpath = os.path.join(root, file)
-                index = fullpath.find(AOT_folder)
-                parts = fullpath[index + len(AOT_folder) + 1 :].split(os.path.sep)[:-1]
-
-                group_tmp = group
-                for part in parts:
-                    if part not in group_tmp:
-                        group_tmp = group_tmp.create_group(part)
-                    else:
-                        group_tmp = group_tmp[part]
-
-                extract_AOT(
-                    group_tmp, os.path.join(root, file), quantities, verbose=verbose
-                )
+    progress = progress or NULL_PROGRESS
+    mat_files = [
+        os.path.join(root, file)
+        for root, _, files in os.walk(AOT_folder)
+        for file in files
+        if file.endswith(".mat") and "alltime" not in file
+    ]
+    progress.start("AOT", len(mat_files))
+
+    for fullpath in mat_files:
+        index = fullpath.find(AOT_folder)
+        parts = fullpath[index + len(AOT_folder) + 1 :].split(os.path.sep)[:-1]
+
+        group_tmp = group
+        for part in parts:
+            group_tmp = require_subgroup(group_tmp, part)
+
+        extract_AOT(group_tmp, fullpath, quantities, verbose=verbose, progress=progress)
+        progress.record("AOT", bytes_read=os.path.getsize(fullpath))
+        progress.advance("AOT", 1, os.path.getsize(fullpath))
+    progress.finish("AOT")
 
 
 def check_keys(matlab_dict):
@@ -601,6 +1271,8 @@ def check_keys(matlab_dict):
     -----
     This function is specific to handling MATLAB `.mat` files.
     """
+    import scipy.io as spio
+
     for key in matlab_dict:
         if isinstance(matlab_dict[key], spio.matlab.mio5_params.mat_struct):
             matlab_dict[key] = todict(matlab_dict[key])
@@ -621,6 +1293,8 @@ def todict(matobj):
     dict
         A Python dictionary representation of the mat_struct object.
     """
+    import scipy.io as spio
+
     python_dict = {}
     for field in matobj._fieldnames:
         elem = matobj.__dict__[field]
@@ -645,6 +1319,8 @@ def loadmat(filename):
     dict
         A Python dictionary containing the data from the `.mat` file.
     """
+    import scipy.io as spio
+
     data = spio.loadmat(filename, struct_as_record=False, squeeze_me=True)
     return check_keys(data)
 
@@ -698,9 +1374,43 @@ def update_zarr_group(group, quantity, value, group_name):
     2. The function supports specialized formatting for quantities listed in `QUANTITIES_ATTRIBUTES`.
     3. The values are either pickled or harmonized based on their nature.
     """
-    # Check if quantity already exists in the group
-    if quantity in group:
-        return
+    # Check if quantity already exists in the group, under the lock of the
+    # quantity in case another process extracts the same folder
+    with structure_lock(group, quantity):
+        if quantity in group:
+            return
+        write_quantity(group, quantity, value, group_name)
+
+
+def write_quantity(group, quantity, value, group_name):
+    """
+    Write a quantity of an AOT backup into a Zarr group.
+
+    Parameters
+    ----------
+    group : zarr.hierarchy.Group
+        The Zarr group to be updated.
+    quantity : str
+        The quantity name.
+    value : various
+        The value associated with the quantity.
+    group_name : str
+        The name of the group being updated.
+    """
+
+    # Store the full grid once as a typed array, so that it never needs to be
+    # derived again from the pickled MATLAB cells
+    if quantity == "Coordinates":
+        value = convert_coordinates_to_numpy(value)
+        group.create_dataset(
+            "grid_coordinates", data=value, dtype=value.dtype, overwrite=True
+        )
+
+    # Same for the time points, which are the index of the time-window queries
+    if quantity == "TimeArray":
+        group.create_dataset(TIME_INDEX, data=hapf_ranges(value), overwrite=True)
+    elif quantity == "FrameArray":
+        group.create_dataset(FRAME_INDEX, data=frame_ranges(value), overwrite=True)
 
     # Handle special quantities listed in QUANTITIES_ATTRIBUTES
     if quantity in QUANTITIES_ATTRIBUTES:
@@ -726,10 +1436,16 @@ def update_zarr_group(group, quantity, value, group_name):
         harmonized_value = harmonize_shape(
             value, quantity_name=quantity, group_name=group_name
         )
-        group.create_dataset(quantity, data=harmonized_value, dtype=np.float16)
+        # One chunk per time point, so that a time window only reads its own
+        group.create_dataset(
+            quantity,
+            data=harmonized_value,
+            dtype=np.float16,
+            chunks=(1,) + harmonized_value.shape[1:],
+        )
 
 
-def extract_AOT(group, path_AOT, quantities, verbose=True):
+def extract_AOT(group, path_AOT, quantities, verbose=True, progress=None):
     """
     Extracts given quantities from the backup file and stores them in a zarr group.
 
@@ -748,6 +1464,8 @@ def extract_AOT(group, path_AOT, quantities, verbose=True):
         The list of quantities that are to be extracted from the backup file.
     verbose : bool, optional
         If True, the function will print warnings when a quantity is not found in the backup file.
+    progress : ProgressReporter, optional
+        Reporter timing the "loadmat" and "write" sub-stages of the "AOT" stage.
 
     Returns
     -------
@@ -755,15 +1473,18 @@ def extract_AOT(group, path_AOT, quantities, verbose=True):
         This function doesn't return anything. It modifies the provided zarr group in-place.
 
     """
+    progress = progress or NULL_PROGRESS
     group_name = os.path.basename(group.name)
-    backup = load_and_update_backup(path_AOT)
+    with progress.timer("AOT", "loadmat"):
+        backup = load_and_update_backup(path_AOT)
 
     for quantity in quantities:
         if quantity not in backup.keys() and verbose:
             print(quantity, backup.keys())
             warnings.warn(f"{quantity} not found in {path_AOT}")
         elif quantity in backup.keys():
-            update_zarr_group(group, quantity, backup[quantity], group_name)
+            with progress.timer("AOT", "write"):
+                update_zarr_group(group, quantity, backup[quantity], group_name)
         # update_zarr_group(group, quantity, backup[quantity], group_name)
 
 
@@ -850,7 +1571,33 @@ def harmonize_shape(quantity_value, quantity_name=None, group_name=""):
     return quantity_value  # Default return value in case no condition is met
 
 
-def zarr_cellpose(project_folder, data_folder, output_folder):
+# Quantities extracted from the AOT backups of SAP
+AOT_QUANTITIES = [
+    "EpsilonPIV",
+    "OmegaPIV",
+    "UPIV",
+    "xywh",
+    "Overlap",
+    "Coordinates",
+    "TimeArray",
+    "FrameArray",
+]
+
+
+def zarr_cellpose(
+    project_folder,
+    data_folder,
+    output_folder,
+    progress=None,
+    averages=None,
+    on_gap="skip",
+    raw_dtype="native",
+    mask_storage="labels",
+    outlines_source="seg",
+    outlines_storage="dense",
+    cell_statistics=False,
+    n_workers=None,
+):
     zarr_path = Path(output_folder)
     input_dir = Path(project_folder)
     raw_image_path = input_dir
@@ -862,29 +1609,90 @@ def zarr_cellpose(project_folder, data_folder, output_folder):
     output_dir = input_dir / seg_dir
     masks_path = output_dir / Path(f"roi_{str(data_folder)}")
     outlines_path = output_dir / Path(f"results_{str(data_folder)}")
-    store_data_in_zarr(zarr_path, raw_image_path, outlines_path, masks_path, sap_folder)
-    quantities = [
-        "EpsilonPIV",
-        "OmegaPIV",
-        "UPIV",
-        "xywh",
-        "Overlap",
-        "Coordinates",
-        "TimeArray",
-        "FrameArray",
-    ]
-
-    animal = zarr.open(zarr_path, "a")
-
-    extract_AOT_results_folder(
-        animal.TENSORS,
-        sap_folder,
-        quantities=quantities,
-        verbose=True,
-    )
-
+    progress = progress or NULL_PROGRESS
+    with progress.timer("zarrification", "images"):
+        store_data_in_zarr(
+            zarr_path,
+            raw_image_path,
+            outlines_path,
+            masks_path,
+            sap_folder,
+            progress=progress,
+            averages=averages,
+            on_gap=on_gap,
+            raw_dtype=raw_dtype,
+            mask_storage=mask_storage,
+            outlines_source=outlines_source,
+            outlines_storage=outlines_storage,
+            cell_statistics=cell_statistics,
+            n_workers=n_workers,
+        )
+    with progress.timer("zarrification", "consolidate"):
+        consolidate_animal(zarr_path, paths=["IMAGE", "METADATA", "TRACKING"])
+    animal = open_animal(zarr_path, "a")
+
+    with progress.timer("zarrification", "tensors"):
+        extract_AOT_results_folder(
+            animal.TENSORS,
+            sap_folder,
+            quantities=AOT_QUANTITIES,
+            verbose=True,
+            progress=progress,
+        )
+    with progress.timer("zarrification", "consolidate"):
+        consolidate_animal(zarr_path, paths=["TENSORS"])
+
+
+def run_zarrification(
+    project_folder,
+    output_folder=None,
+    progress=None,
+    averages=None,
+    report=False,
+    profile=None,
+    on_gap="skip",
+    raw_dtype="native",
+    mask_storage="labels",
+    outlines_source="seg",
+    outlines_storage="dense",
+    cell_statistics=False,
+    n_workers=None,
+):
+    """
+    Zarrify an animal folder: images, masks, outlines and AOT tensors.
 
-def run_zarrification(project_folder, output_folder=None):
+    Parameters
+    ----------
+    project_folder : str or Path
+        The animal folder, named after the animal.
+    output_folder : str or Path, optional
+        The zarr store of the animal. Default is the animal folder itself.
+    progress : ProgressReporter, optional
+        Reporter receiving the progress of every stage.
+    averages : list, optional
+        Time-averaging windows of the raw movie, see `store_data_in_zarr`.
+    report : bool, optional
+        Whether to time every stage and sub-stage (decode, write, tif export,
+        .mat loading...) and append the run report to the `run_reports`
+        attribute of the METADATA group (keeping the last ones), see
+        `instrumentation.RunReport`. Default is False.
+    profile : str or Path, optional
+        File receiving a cProfile dump of the run. Default is None.
+    on_gap : str, optional
+        Policy on missing frames, see `store_data_in_zarr`. Default is "skip".
+    raw_dtype : str, optional
+        dtype policy of the raw movie, see `store_data_in_zarr`. Default is
+        "native".
+    mask_storage, outlines_source, outlines_storage : str, optional
+        Storage of the masks and outlines, see `store_data_in_zarr`. Defaults
+        are "labels", "seg" and "dense".
+    cell_statistics : bool, optional
+        Whether to compute `TRACKING/cell_statistics`, see
+        `store_data_in_zarr`. Default is False.
+    n_workers : int, optional
+        Number of processes computing the cell statistics. Default is the
+        number of CPUs.
+    """
     project_folder = Path(project_folder)
     data_folder = project_folder.name
     if output_folder is None:
@@ -892,7 +1700,75 @@ def run_zarrification(project_folder, output_folder=None):
         output_folder = output_folder  # / data_folder
     output_folder = Path(output_folder)
 
-    zarr_cellpose(project_folder, data_folder, output_folder)
+    if report:
+        progress = RunReport(progress)
+    try:
+        with profiled(profile):
+            zarr_cellpose(
+                project_folder,
+                data_folder,
+                output_folder,
+                progress=progress,
+                averages=averages,
+                on_gap=on_gap,
+                raw_dtype=raw_dtype,
+                mask_storage=mask_storage,
+                outlines_source=outlines_source,
+                outlines_storage=outlines_storage,
+                cell_statistics=cell_statistics,
+                n_workers=n_workers,
+            )
+    except Exception as error:
+        if report:
+            progress.error = repr(error)
+        raise
+    finally:
+        if report:
+            save_run_report(
+                output_folder,
+                progress,
+                project_folder=str(project_folder),
+                averages=averages,
+                on_gap=on_gap,
+                raw_dtype=raw_dtype,
+                mask_storage=mask_storage,
+                outlines_source=outlines_source,
+                outlines_storage=outlines_storage,
+                cell_statistics=cell_statistics,
+                profile=None if profile is None else str(profile),
+            )
+
+
+def save_run_report(output_folder, report, **parameters):
+    """
+    Append a run report to the METADATA group of an animal store.
+
+    The report of a failed run is only saved in a store that already exists,
+    and failing to save it only warns, so that the error of the run is the
+    one raised.
+
+    Parameters
+    ----------
+    output_folder : Path
+        The zarr store of the animal.
+    report : instrumentation.RunReport
+        The report of the run.
+    **parameters
+        Run parameters stored with the report.
+    """
+    failed = report.error is not None
+    if failed and not os.path.exists(output_folder / "METADATA" / ".zgroup"):
+        warnings.warn(f"The run failed before creating {output_folder}, no report")
+        return
+    try:
+        metadata = open_animal(output_folder, "a").METADATA
+        with structure_lock(metadata):
+            report.save(metadata, **parameters)
+        consolidate_animal(output_folder, paths=["METADATA"], recursive=False)
+    except Exception as error:
+        if not failed:
+            raise
+        warnings.warn(f"Could not save the run report in {output_folder}: {error!r}")
 
 
 if __name__ == "__main__":